@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 1 ファクトチェックのベンチマーク
+長い記事（元記事本文・生成記事とも数千文字）で、旧来の抽出（パターンごとに re.findall）と
+1回走査の TextFeatures、語ごとの in 検索とオートマトン（TermAutomaton）・TermMatcher による有無の確認、
+および fact_check_article 全体の処理時間（元記事ごとの初回と、同じ元記事での2回目以降）を比べる。
+RSSの要約程度（約400文字・30語弱）の短い場合も測る
+
+使い方:
+    python bench_fact_checker.py [繰り返し回数]
+"""
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from fact_checker import TextFeatures, COMMON_WORDS, fact_check_article, html_to_text, source_terms
+from term_automaton import TermAutomaton, TermMatcher
+
+SOURCE_PARAGRAPH = (
+    "OpenAI announced GPT-5 on November 6, 2025, claiming a 35% improvement in reasoning benchmarks. "
+    "The San Francisco company said Microsoft Azure customers will get access first, with pricing at $1.25 "
+    "per million input tokens. Google responded with Gemini 2.5 Ultra, while Anthropic's Claude Sonnet 4.5 "
+    "remains the leader on SWE-bench at 77.2%. Meta Platforms plans to release Llama 5 on 2025-12-01. "
+)
+GENERATED_PARAGRAPH = (
+    "<p>OpenAIは2025年11月6日、推論ベンチマークで35%の性能向上をうたうGPT-5を発表しました。"
+    "サンフランシスコに本社を置く同社によると、まずMicrosoft Azureの顧客が利用でき、価格は入力100万トークンあたり"
+    "1.25ドルです。GoogleはGemini 2.5 Ultraで対抗し、AnthropicのClaude Sonnet 4.5はSWE-benchで77.2%と首位を保っています。"
+    "Meta Platformsは12月1日にLlama 5を公開する予定です。</p>\n"
+)
+
+
+COMPANIES = [f"{a} {b}" for a in ("Nova", "Quant", "Hyper", "Deep", "Astra", "Zenith")
+             for b in ("Labs", "Mind", "Scale", "Works", "Forge", "Robotics")]
+MONTHS = ["January", "March", "May", "July", "September", "November"]
+
+
+def source_body(chars=8000):
+    """元記事本文（数値・日付・企業名が段落ごとに違う長い英文記事）"""
+    lines = [SOURCE_PARAGRAPH]
+    for i in range(200):
+        lines.append(f"{COMPANIES[i % len(COMPANIES)]} reported revenue of {i * 17}.{i % 7} billion on "
+                     f"{MONTHS[i % 6]} {1 + i % 28}, 2025, up {i % 50 + 5}% year over year. ")
+    return "".join(lines)[:chars]
+
+
+def legacy_extract(text):
+    """旧来の抽出（パターンごとに re.findall、固有名詞はリテラルのパターンを都度渡す）"""
+    numbers = set(re.findall(r'\d+(?:\.\d+)?', text))
+    numbers.update(re.findall(r'\d+(?:\.\d+)?%', text))
+    dates = set(re.findall(r'\d{4}年\d{1,2}月\d{1,2}日', text))
+    dates.update(re.findall(r'\d{4}[/-]\d{1,2}[/-]\d{1,2}', text))
+    dates.update(re.findall(r'\d{1,2}月\d{1,2}日', text))
+    dates.update(re.findall(r'(?:January|February|March|April|May|June|July|August|September|October|November|December)'
+                            r'\s+\d{1,2},?\s+\d{4}', text, re.IGNORECASE))
+    nouns = {n for n in re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', text) if n not in COMMON_WORDS}
+    nouns.update(re.findall(r'[ァ-ヶー]{2,}', text))
+    nouns.update(re.findall(r'\b(?:OpenAI|Google|Microsoft|Amazon|Meta|Apple|GPT-?\d+|Claude|Gemini|ChatGPT)\b',
+                            text, re.IGNORECASE))
+    return numbers, dates, nouns
+
+
+def legacy_present(terms, text):
+    """旧来の有無の確認（語ごとに in、見つからなければテキスト全体を小文字化して再確認）"""
+    return {t for t in terms if t in text or t.lower() in text.lower()}
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(repeat=200):
+    source = {"title": "OpenAI launches GPT-5", "summary": source_body()}
+    # 同じ段落の繰り返しだけにならないよう、段落ごとに違う数値を混ぜる
+    generated_html = "<h1>OpenAIがGPT-5を発表</h1>\n" + "".join(
+        GENERATED_PARAGRAPH + f"<p>第{i}四半期の売上は{i * 13}.{i % 10}億ドル、前年比{i % 40 + 3}%増でした。</p>\n"
+        for i in range(20))
+    source_text = f"{source['title']} {source['summary']}"
+    print(f"元記事 {len(source_text)}文字 / 生成記事 {len(generated_html)}文字、{repeat}回の平均")
+
+    legacy = legacy_extract(source_text)
+    features = TextFeatures(source_text)
+    assert legacy[0] == features.numbers and legacy[1] == features.dates
+    print(f"  抽出結果: 数値 {len(features.numbers)}件・日付 {len(features.dates)}件が旧来と一致、"
+          f"固有名詞 旧来 {len(legacy[2])}件 / 新 {len(features.proper_nouns)}件"
+          f"（新は日付の月名を固有名詞に含めない）")
+
+    for name, text in (("元記事", source_text), ("生成記事", generated_html)):
+        old_ms = timed(lambda: legacy_extract(text), repeat)
+        new_ms = timed(lambda: TextFeatures(text), repeat)
+        print(f"  {name}の抽出: 旧来 {old_ms:.3f}ms → TextFeatures {new_ms:.3f}ms（{old_ms / new_ms:.1f}倍）")
+    generated_text = html_to_text(generated_html)
+    rss_source = TextFeatures(SOURCE_PARAGRAPH)
+    rss_terms = [*rss_source.numbers, *rss_source.dates, *(n for n in rss_source.proper_nouns if len(n) > 2)]
+    terms = [*features.numbers, *features.dates, *(n for n in features.proper_nouns if len(n) > 2)]
+    for name, ts, text in (("RSSの要約", rss_terms, generated_text[:400]), ("元記事本文", terms, generated_text)):
+        assert legacy_present(ts, text) == TermAutomaton(ts).present(text) == TermMatcher(ts).present(text)
+        automaton = TermAutomaton(ts)
+        matcher = TermMatcher(ts)
+        matcher.present(text)
+        old_ms = timed(lambda: legacy_present(ts, text), repeat)
+        build_ms = timed(lambda: TermAutomaton(ts).present(text), repeat)
+        scan_ms = timed(lambda: automaton.present(text), repeat)
+        first_ms = timed(lambda: TermMatcher(ts).present(text), repeat)
+        reuse_ms = timed(lambda: matcher.present(text), repeat)
+        print(f"  {name}（{len(ts)}語・生成記事{len(text)}文字）の有無の確認: 旧来 {old_ms:.3f}ms / "
+              f"TermAutomaton 構築込み {build_ms:.3f}ms・走査のみ {scan_ms:.3f}ms / "
+              f"TermMatcher 初回 {first_ms:.3f}ms・2回目以降 {reuse_ms:.3f}ms")
+
+    def first_check():
+        source_terms.cache_clear()
+        fact_check_article(source, generated_html)
+
+    print(f"  fact_check_article 全体: 元記事ごとの初回 {timed(first_check, repeat):.3f}ms / "
+          f"2回目以降 {timed(lambda: fact_check_article(source, generated_html), repeat):.3f}ms")
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
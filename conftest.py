@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""
+pytest 共通設定
+- テスト中のAPI呼び出しで本番の state/model_health.json を書き換えないよう、
+  モデル稼働状況は保存しない（model_helper.HEALTH_PATH_ENV）
+"""
+import os
+
+os.environ["MODEL_HEALTH_PATH"] = ""
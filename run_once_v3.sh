@@ -18,10 +18,10 @@ LOG_FILE="$PROJECT_DIR/logs/run_$(date +%Y%m%d_%H%M%S).log"
   if [ ! -x "$PY" ]; then
     /usr/bin/python3 -m venv "$VENV_DIR"
     "$PY" -m pip install -U pip
-    "$PY" -m pip install feedparser pyyaml python-dotenv langdetect anthropic requests
+    "$PY" -m pip install feedparser pyyaml python-dotenv langdetect anthropic requests numpy
   fi
   "$PY" - <<'PY'
-import feedparser, yaml, dotenv, langdetect, anthropic, requests
+import feedparser, yaml, dotenv, langdetect, anthropic, requests, numpy
 print("[check] deps: OK")
 PY
   echo "[run] post_dedup_value_add.py"
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+article_cache.py
+生成・ファクトチェック済み記事のキャッシュ（state/article_cache.json）
+- キーは 正規化済みURL・元記事テキストのハッシュ・生成プロンプト版数・モデル
+- 両方のチェックに合格した記事を保存し、投稿に失敗しても次回は生成・チェックをやり直さずに投稿だけ行う
+- 投稿待ち（pending）になるのは投稿を試みて失敗した記事だけ。投機生成で合格しただけの下位候補や、
+  同じ実行内の衝突で投稿を見送った記事は、次回も投稿しない
+- 投稿に成功したら削除する。投稿失敗が続く記事は max_publish_attempts 回で諦める
+"""
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from cache_store import JsonCache, content_hash
+
+
+def article_cache_key(url: str, source_text: str, prompt_version, model: str) -> str:
+    return content_hash(url, content_hash(source_text), prompt_version, model)
+
+
+class ArticleCache:
+    """
+    合格済み記事のキャッシュ
+
+    各エントリ: {"url", "item"（候補の情報）, "html", "model", "phase1", "phase2",
+                 "created", "publish_failures"}
+    """
+
+    def __init__(self, path: Path, ttl_seconds: Optional[float] = 48 * 3600, max_entries: int = 200,
+                 max_publish_attempts: int = 3):
+        self.cache = JsonCache(path, ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self.max_publish_attempts = max_publish_attempts
+
+    def lookup(self, url: str, source_text: str, prompt_version, models: Iterable[str]) -> Optional[Dict]:
+        """同じ元記事・同じプロンプトでいずれかのモデルが生成した合格済み記事（なければNone）"""
+        for model in models:
+            entry = self.cache.get(article_cache_key(url, source_text, prompt_version, model))
+            if entry:
+                return entry
+        return None
+
+    def store(self, url: str, source_text: str, prompt_version, model: str, item: Dict, html: str,
+              phase1: Dict, phase2: Dict) -> None:
+        self.cache.set(article_cache_key(url, source_text, prompt_version, model), {
+            "url": url,
+            "item": item,
+            "html": html,
+            "model": model,
+            "phase1": {k: phase1.get(k) for k in ("passed", "issues", "warnings")},
+            "phase2": {k: phase2.get(k) for k in ("passed", "score", "issues")},
+            "created": time.time(),
+            "publish_failures": 0,
+        })
+        self.cache.save()
+
+    def pending(self) -> List[Dict]:
+        """投稿を試みて失敗した合格済み記事（新しい順）"""
+        return sorted((v for _, v in self.cache.items() if v.get("publish_failures", 0) > 0),
+                      key=lambda v: v.get("created", 0), reverse=True)
+
+    def _keys_for(self, url: str) -> List[str]:
+        return [k for k, v in self.cache.items() if v.get("url") == url]
+
+    def record_publish_failure(self, url: str) -> None:
+        """投稿失敗を記録し、上限に達した記事は削除"""
+        with self.cache.lock:
+            for key in self._keys_for(url):
+                # 値を直接書き換える（set()し直すと保存時刻が更新され、TTLが延びてしまう）
+                entry = self.cache.get(key)
+                entry["publish_failures"] = entry.get("publish_failures", 0) + 1
+                if entry["publish_failures"] >= self.max_publish_attempts:
+                    print(f"[記事キャッシュ] 投稿に{entry['publish_failures']}回失敗したため破棄: {url}")
+                    self.cache.delete(key)
+            self.cache.save()
+
+    def forget(self, url: str) -> None:
+        """投稿済みになった記事を削除"""
+        with self.cache.lock:
+            for key in self._keys_for(url):
+                self.cache.delete(key)
+            self.cache.save()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+article_repair.py
+ファクトチェックで不合格になった記事の修正（全体の再生成の代わり）
+- Phase 1 / Phase 2 の指摘（issues）を下書きと一緒に返し、該当箇所だけの最小限の修正を依頼する
+- 会話は「生成依頼 → 下書き → 修正依頼」の順で、生成時と同じsystem（prompt caching 対象）を使う
+- 生成・修正の各試行の結果を state/generation_attempts.jsonl に記録し、合格率・トークン・時間を比較する
+  （Phase 1 の日付を表記どおりに照合していた頃の合格率も並べて表示する）
+
+使い方:
+    python src/article_repair.py report    # 初回生成と修正の合格率などを表示
+"""
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BASE = Path(__file__).resolve().parent.parent
+ATTEMPT_LOG_PATH = BASE / "state" / "generation_attempts.jsonl"
+
+REPAIR_REQUEST = """上の記事はファクトチェックで以下の問題を指摘されました。
+
+【指摘された問題】
+{issues}
+
+指摘された箇所だけを最小限に修正し、それ以外の文章・構成はそのまま残した記事全体を出力してください。
+元記事にない数値・日付・固有名詞を新たに加えないでください。
+HTMLのみで出力してください。Markdown禁止。コードブロックマーカーは使用禁止。"""
+
+# Phase 2 で個別の指摘がない場合に、低い評価項目を指摘として使う
+PHASE2_ITEM_NAMES = {
+    "logical_consistency": "論理的一貫性",
+    "factual_accuracy": "事実の正確性",
+    "completeness": "記事の完全性",
+    "internal_coherence": "内部整合性",
+    "readability": "読みやすさ",
+}
+
+
+def phase2_issues(llm_result: Dict, min_item_score: int = 60) -> List[str]:
+    """Phase 2 の結果から修正依頼に使う指摘を作る"""
+    issues = list(llm_result.get("issues") or [])
+    for key, score in (llm_result.get("analysis") or {}).items():
+        if score < min_item_score:
+            issues.append(f"{PHASE2_ITEM_NAMES.get(key, key)}の評価が低い（{score}/100）")
+    if not issues:
+        issues.append(f"総合評価が低い（{llm_result.get('score', 0)}/100）。全体の正確さと読みやすさを見直してください")
+    return issues
+
+
+def repair_messages(generation_user: str, draft_html: str, issues: List[str]) -> List[Dict]:
+    """修正依頼のメッセージ列（生成依頼・下書き・指摘）"""
+    return [
+        {"role": "user", "content": generation_user},
+        {"role": "assistant", "content": draft_html},
+        {"role": "user", "content": REPAIR_REQUEST.format(issues="\n".join(f"- {i}" for i in issues))},
+    ]
+
+
+def record_attempt(kind: str, passed: bool, failed_stage: Optional[str], seconds: float,
+                   output_tokens: int = 0, path: Path = ATTEMPT_LOG_PATH,
+                   legacy_date_rejected: bool = False) -> None:
+    """
+    生成・修正の1回の試行を記録
+
+    kind: "generate"（初回生成）/ "repair"（修正）
+    failed_stage: 不合格になった段階（"generate" / "phase1" / "phase2"）、合格ならNone
+    legacy_date_rejected: 日付を表記どおりに照合していたら Phase 1 で不合格になっていたか
+    """
+    record = {"ts": time.time(), "kind": kind, "passed": passed, "failed_stage": failed_stage,
+              "seconds": round(seconds, 2), "output_tokens": output_tokens,
+              "legacy_date_rejected": legacy_date_rejected}
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[警告] 生成試行の記録に失敗: {e}")
+
+
+def summarize(records: List[Dict]) -> Dict[str, Dict]:
+    """
+    試行の種類ごとの件数・合格率・平均出力トークン数・平均時間
+
+    legacy_pass_rate: 日付を表記どおりに照合していた場合の合格率（日付の正規化の効果の比較用）
+    """
+    summary = {}
+    for kind in ("generate", "repair"):
+        rs = [r for r in records if r.get("kind") == kind]
+        if not rs:
+            continue
+        summary[kind] = {
+            "n": len(rs),
+            "pass_rate": sum(1 for r in rs if r.get("passed")) / len(rs),
+            "legacy_pass_rate": sum(1 for r in rs if r.get("passed") and not r.get("legacy_date_rejected")) / len(rs),
+            "avg_output_tokens": sum(r.get("output_tokens", 0) for r in rs) / len(rs),
+            "avg_seconds": sum(r.get("seconds", 0) for r in rs) / len(rs),
+        }
+    return summary
+
+
+def load_attempts(path: Path = ATTEMPT_LOG_PATH) -> List[Dict]:
+    if not path.exists():
+        return []
+    records = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return records
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] != ["report"]:
+        print(__doc__)
+        return 1
+    summary = summarize(load_attempts())
+    if not summary:
+        print("記録がありません")
+        return 0
+    labels = {"generate": "初回生成", "repair": "修正"}
+    for kind, s in summary.items():
+        print(f"{labels[kind]}: {s['n']}回、合格率 {s['pass_rate']:.0%}"
+              f"（日付を表記どおりに照合した場合 {s['legacy_pass_rate']:.0%}）、"
+              f"平均出力 {s['avg_output_tokens']:.0f}トークン、平均 {s['avg_seconds']:.1f}秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+cache_store.py
+state/ 配下にJSONで永続化する、TTL・件数上限付きのキャッシュ
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Optional
+
+
+def content_hash(*parts) -> str:
+    """複数の値を連結したSHA-1ハッシュ（キャッシュキー用）"""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(str(p if p is not None else "").encode("utf-8"))
+        h.update(b"\x1f")
+    return h.hexdigest()
+
+
+class JsonCache:
+    """
+    TTL・件数上限付きのJSONキャッシュ
+
+    - 各エントリは {"value": ..., "ts": 保存時刻} で保持
+    - TTLを過ぎたエントリは取得時・保存時に削除
+    - 件数上限を超えた場合は古いエントリから削除
+    - ヒット・ミス件数を記録（hit_rate()で参照）
+    - 複数スレッドから使えるよう操作はロックで保護し、保存は一時ファイル経由で置き換える
+    """
+
+    def __init__(self, path: Path, ttl_seconds: Optional[float] = None, max_entries: int = 5000):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+        self.entries = {}
+        if self.path.exists():
+            try:
+                self.entries = json.loads(self.path.read_text(encoding="utf-8")).get("entries", {})
+            except Exception:
+                self.entries = {}
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return self.ttl_seconds is not None and now - entry.get("ts", 0) > self.ttl_seconds
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or self._expired(entry, time.time()):
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry.get("value")
+
+    def __contains__(self, key: str) -> bool:
+        with self.lock:
+            entry = self.entries.get(key)
+            return entry is not None and not self._expired(entry, time.time())
+
+    def set(self, key: str, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = {"value": value, "ts": time.time()}
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def items(self):
+        """有効な (key, value) の一覧"""
+        with self.lock:
+            now = time.time()
+            return [(k, e.get("value")) for k, e in self.entries.items() if not self._expired(e, now)]
+
+    def prune(self) -> None:
+        """期限切れエントリの削除と件数上限の適用"""
+        with self.lock:
+            now = time.time()
+            self.entries = {k: e for k, e in self.entries.items() if not self._expired(e, now)}
+            if len(self.entries) > self.max_entries:
+                newest = sorted(self.entries.items(), key=lambda kv: kv[1].get("ts", 0), reverse=True)
+                self.entries = dict(newest[:self.max_entries])
+
+    def save(self) -> None:
+        """一時ファイルに書いてから置き換える（書き込み途中の壊れたファイルを残さない）"""
+        with self.lock:
+            self.prune()
+            data = json.dumps({"entries": self.entries}, ensure_ascii=False)
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_text(data, encoding="utf-8")
+            os.replace(tmp, self.path)
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats_line(self, label: str) -> str:
+        """ヒット率のログ出力用文字列"""
+        total = self.hits + self.misses
+        return f"[キャッシュ] {label}: ヒット {self.hits}/{total}件（{self.hit_rate():.0%}）"
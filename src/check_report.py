@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+check_report.py
+Phase 2（LLM品質チェック）の結果の受け取り
+- 結果は report_quality ツールの呼び出し（入力はJSONスキーマで制約）で受け取り、pydantic で検証する
+- 形式が不正なら、記事を送り直さずに不正な出力だけを渡して、形式の直しだけを安いモデルに依頼する
+  （直した結果の評価値が元の出力にない場合は、作られた値として採用しない）
+- 形式不正の件数・回復できた件数を集計し、実行ごとに state/fact_check_format.jsonl に記録する
+"""
+import json
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+BASE = Path(__file__).resolve().parent.parent
+FORMAT_LOG_PATH = BASE / "state" / "fact_check_format.jsonl"
+
+CHECK_TOOL_NAME = "report_quality"
+
+
+class Phase2Report(BaseModel):
+    """Phase 2 の評価結果（各項目0-100の整数）"""
+    logical_consistency: int = Field(ge=0, le=100, description="論理的一貫性")
+    factual_accuracy: int = Field(ge=0, le=100, description="事実の正確性")
+    completeness: int = Field(ge=0, le=100, description="記事の完全性")
+    internal_coherence: int = Field(ge=0, le=100, description="内部整合性")
+    readability: int = Field(ge=0, le=100, description="読みやすさ")
+    issues: List[str] = Field(default_factory=list, description="問題点（ある場合のみ）")
+    summary: str = Field("", description="総合評価のサマリー")
+
+
+SCORE_FIELDS = ("logical_consistency", "factual_accuracy", "completeness", "internal_coherence", "readability")
+
+CHECK_TOOL = {
+    "name": CHECK_TOOL_NAME,
+    "description": "生成記事の品質チェックの結果を報告する",
+    "input_schema": Phase2Report.model_json_schema(),
+}
+# 必ず report_quality ツールで答えさせる
+CHECK_TOOL_CHOICE = {"type": "tool", "name": CHECK_TOOL_NAME}
+
+FORMAT_RETRY_SYSTEM = "評価結果の整形係。与えられた評価結果を report_quality ツールの形式で提出し直す。"
+FORMAT_RETRY_REQUEST = """次の評価結果は形式が不正でした。
+
+【形式のエラー】
+{error}
+
+【評価結果】
+{output}
+
+内容は変えずに、report_quality ツールで提出し直してください。
+評価結果に書かれている値だけを使い、書かれていない評価値を作らないでください。"""
+
+_JSON_OBJECT_RE = re.compile(r'\{.*\}', re.DOTALL)
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def response_output(msg) -> str:
+    """応答の内容（ツールの入力はJSON、テキストはそのまま）"""
+    parts = []
+    for block in msg.content:
+        if block.type == "tool_use":
+            parts.append(json.dumps(block.input, ensure_ascii=False))
+        elif block.type == "text":
+            parts.append(block.text)
+    return "\n".join(parts).strip()
+
+
+def parse_check_response(msg) -> Tuple[Optional[Phase2Report], str]:
+    """
+    応答から評価結果を取り出して検証
+
+    report_quality ツールの呼び出しを優先し、なければテキスト中のJSONを読む。
+
+    Returns:
+        (評価結果, エラー内容)  ※形式が不正なら評価結果はNone
+    """
+    for block in msg.content:
+        if block.type == "tool_use" and block.name == CHECK_TOOL_NAME:
+            try:
+                return Phase2Report.model_validate(block.input), ""
+            except ValidationError as e:
+                return None, str(e)
+    text = "".join(block.text for block in msg.content if block.type == "text")
+    m = _JSON_OBJECT_RE.search(text)
+    if not m:
+        return None, "report_quality ツールの呼び出しもJSONもありません"
+    try:
+        return Phase2Report.model_validate_json(m.group()), ""
+    except ValidationError as e:
+        return None, str(e)
+
+
+def invented_scores(report: Phase2Report, msg) -> List[str]:
+    """
+    形式の直しで作られた評価値（report の評価値のうち、元の応答 msg に数値として現れないもの）
+
+    必須項目を埋めさせるため、元の出力に欠けていた評価値を直しの側が作ることがある
+    """
+    numbers = set(_NUMBER_RE.findall(response_output(msg)))
+    return [field for field in SCORE_FIELDS if str(getattr(report, field)) not in numbers]
+
+
+def format_retry_messages(msg, error: str) -> List[Dict]:
+    """形式の直しだけを依頼するメッセージ（記事は含めない）"""
+    return [{"role": "user", "content": FORMAT_RETRY_REQUEST.format(
+        error=error[:1000], output=response_output(msg)[:4000] or "（出力なし）")}]
+
+
+class FormatStats:
+    """
+    Phase 2 の応答形式の集計
+
+    invalid: 最初の応答の形式が不正だった回数
+    recovered: そのうち形式の直しの依頼で回復した回数（以前は記事ごと破棄していた）
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checks = 0
+        self.invalid = 0
+        self.recovered = 0
+
+    def record(self, first_valid: bool, valid: bool) -> None:
+        with self.lock:
+            self.checks += 1
+            if not first_valid:
+                self.invalid += 1
+                if valid:
+                    self.recovered += 1
+
+    def as_dict(self) -> Dict:
+        return {"checks": self.checks, "invalid": self.invalid, "recovered": self.recovered,
+                "failed": self.invalid - self.recovered}
+
+    def summary_line(self) -> Optional[str]:
+        if not self.checks:
+            return None
+        return (f"[Phase 2] 応答形式の不正 {self.invalid}/{self.checks}回"
+                f"（形式の直しで回復 {self.recovered}回、判定できず {self.invalid - self.recovered}回）")
+
+    def log(self, path: Path = FORMAT_LOG_PATH) -> None:
+        """今回の実行の集計を追記"""
+        if not self.checks:
+            return
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), **self.as_dict()}, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"[警告] Phase 2 の応答形式の記録に失敗: {e}")
+
+
+format_stats = FormatStats()
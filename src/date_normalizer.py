@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+date_normalizer.py
+日付表記の正規化（Phase 1 の日付照合用）
+- 英語（November 6, 2025 / Nov. 6, 2025 / 6 November 2025）・日本語（2025年11月6日 / 11月6日）・
+  ISO（2025-11-06 / 2025/11/06）・相対表現（today / yesterday / 本日 / 昨日 など）を (年, 月, 日) にそろえる
+- 年のない表記は年を None とし、月日が同じ日付と一致するものとして扱う
+- 相対表現は基準日（元記事の公開日。不明なら今日）から計算する
+"""
+import re
+from functools import lru_cache
+from datetime import date, datetime, timedelta
+from typing import Optional, Set, Tuple
+
+# (年 or None, 月, 日)
+DateKey = Tuple[Optional[int], int, int]
+
+MONTHS = {
+    "january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6,
+    "july": 7, "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+    "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8,
+    "sep": 9, "sept": 9, "oct": 10, "nov": 11, "dec": 12,
+}
+RELATIVE_DAYS = {
+    "today": 0, "yesterday": -1, "tomorrow": 1,
+    "本日": 0, "今日": 0, "昨日": -1, "一昨日": -2, "明日": 1,
+}
+
+# 長い月名を先に置く（"Sept" より "September"、"Sep" より "Sept"）
+# 各選択肢は先頭の文字の種類（数字・英字）で先に振り分け、当たらない位置では試さない
+_MONTH_NAMES = "|".join(sorted(MONTHS, key=len, reverse=True))
+_DATE_RE = re.compile(
+    r'(?=\d)(?:'
+    r'(?P<ja_y>\d{4})年\s*(?P<ja_m>\d{1,2})月\s*(?P<ja_d>\d{1,2})日'
+    r'|(?P<md_m>\d{1,2})月\s*(?P<md_d>\d{1,2})日'
+    r'|(?P<iso_y>\d{4})[/-](?P<iso_m>\d{1,2})[/-](?P<iso_d>\d{1,2})'
+    rf'|\b(?P<dm_d>\d{{1,2}})(?:st|nd|rd|th)?\s+(?P<dm_m>{_MONTH_NAMES})\b\.?(?:,?\s+(?P<dm_y>\d{{4}}))?)'
+    r'|\b(?=[a-z])(?:'
+    rf'(?P<en_m>{_MONTH_NAMES})\.?\s+(?P<en_d>\d{{1,2}})(?:st|nd|rd|th)?\b(?:,?\s+(?P<en_y>\d{{4}}))?'
+    r'|(?P<rel_en>today|yesterday|tomorrow)\b)'
+    r'|(?P<rel_ja>本日|今日|一昨日|昨日|明日)',
+    re.IGNORECASE,
+)
+
+
+def reference_date(ts: Optional[float] = None) -> date:
+    """相対表現の基準日（元記事の公開時刻 ts があればその日、なければ今日）"""
+    return datetime.fromtimestamp(ts).date() if ts else date.today()
+
+
+def _key(m, reference: date) -> Optional[DateKey]:
+    g = m.groupdict()
+    if g["ja_y"]:
+        y, mo, d = int(g["ja_y"]), int(g["ja_m"]), int(g["ja_d"])
+    elif g["md_m"]:
+        y, mo, d = None, int(g["md_m"]), int(g["md_d"])
+    elif g["iso_y"]:
+        y, mo, d = int(g["iso_y"]), int(g["iso_m"]), int(g["iso_d"])
+    elif g["en_m"]:
+        y, mo, d = int(g["en_y"]) if g["en_y"] else None, MONTHS[g["en_m"].lower()], int(g["en_d"])
+    elif g["dm_m"]:
+        y, mo, d = int(g["dm_y"]) if g["dm_y"] else None, MONTHS[g["dm_m"].lower()], int(g["dm_d"])
+    else:
+        day = reference + timedelta(days=RELATIVE_DAYS[(g["rel_en"] or g["rel_ja"]).lower()])
+        return day.year, day.month, day.day
+    try:
+        # 年がなければ閏年（2000年）で日付として正しいかだけ確かめる
+        date(y or 2000, mo, d)
+    except ValueError:
+        return None
+    return y, mo, d
+
+
+def find_dates(text: str, reference: date) -> Set[DateKey]:
+    """テキストに含まれる日付（表記によらず (年, 月, 日) で返す）"""
+    keys = set()
+    for m in _DATE_RE.finditer(text):
+        key = _key(m, reference)
+        if key:
+            keys.add(key)
+    return keys
+
+
+@lru_cache(maxsize=4096)
+def normalize_date(text: str, reference: date) -> Optional[DateKey]:
+    """日付の表記1つを (年, 月, 日) に（日付として読めなければNone。元記事の日付は照合のたびに同じものを渡すのでキャッシュする）"""
+    m = _DATE_RE.search(text)
+    return _key(m, reference) if m else None
+
+
+def date_mentioned(key: DateKey, dates: Set[DateKey]) -> bool:
+    """
+    日付 key が dates に含まれるか
+
+    片方に年がなければ月日だけで比べる（「11月6日」は "November 6, 2025" と一致）
+    """
+    year, month, day = key
+    if key in dates or (None, month, day) in dates:
+        return True
+    return year is None and any(d[1:] == (month, day) for d in dates)
@@ -4,7 +4,115 @@ fact_checker.py
 基本的なルールベースのファクトチェック機能
 """
 import re
-from typing import Dict, List, Set
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+from cache_store import JsonCache, content_hash
+from check_report import (CHECK_TOOL, CHECK_TOOL_CHOICE, FORMAT_RETRY_SYSTEM, format_retry_messages,
+                          format_stats, invented_scores, parse_check_response)
+from date_normalizer import reference_date, find_dates, normalize_date, date_mentioned
+from prompt_budget import fit_to_budget
+from term_automaton import TermMatcher
+
+# Phase 2 に渡す生成記事（タグ除去済み）のトークン上限の既定値
+CHECK_ARTICLE_TOKENS = 5000
+
+BASE = Path(__file__).resolve().parent.parent
+CHECK_CACHE_PATH = BASE / "state" / "fact_check_cache.json"
+
+# Phase 2 のプロンプト（LLM_CHECK_SYSTEM / ユーザーメッセージ）を変更したら上げる（古いキャッシュを無効化するため）
+LLM_CHECK_PROMPT_VERSION = 2
+
+
+# 除外する一般的な英単語（文頭の大文字など）
+COMMON_WORDS = frozenset({
+    'The', 'A', 'An', 'This', 'That', 'These', 'Those',
+    'You', 'Your', 'My', 'Our', 'Their', 'His', 'Her',
+    'What', 'When', 'Where', 'Why', 'How', 'Who',
+    'Can', 'Could', 'Will', 'Would', 'Should', 'May', 'Might',
+    'To', 'From', 'With', 'Without', 'For', 'By', 'At', 'In', 'On',
+    'But', 'And', 'Or', 'So', 'If', 'As',
+    'New', 'Old', 'First', 'Last', 'Next', 'All', 'Some', 'Many',
+    'It', 'Its', 'Is', 'Are', 'Was', 'Were', 'Be', 'Been',
+})
+
+_MONTHS = r'January|February|March|April|May|June|July|August|September|October|November|December'
+# よく使われる企業名・製品名
+_TECH_NAMES = r'OpenAI|Google|Microsoft|Amazon|Meta|Apple|GPT-?\d+|Claude|Gemini|ChatGPT'
+
+# 数値・日付・固有名詞をまとめて1回で走査するパターン
+# - 数字で始まる特徴・単語の先頭の英字で始まる特徴をそれぞれ先読みで絞り、各位置で試す候補を減らす
+# - 同じ位置では上にあるものが優先。英語の固有名詞は「On November 6, 2025」の月名を取り込まない（日付として取る）
+# - 重なって現れる特徴（日付の中の数値、固有名詞の中の企業名など）はマッチした範囲の中だけで拾い直す
+_FEATURE_RE = re.compile(
+    r'(?=\d)(?:(?P<date_ja>\d{4}年\d{1,2}月\d{1,2}日)'
+    r'|(?P<date_iso>\d{4}[/-]\d{1,2}[/-]\d{1,2})'
+    r'|(?P<date_md>\d{1,2}月\d{1,2}日)'
+    r'|(?P<number>\d+(?:\.\d+)?%?))'
+    rf'|\b(?=[A-Za-z])(?:(?P<date_en>(?i:{_MONTHS})\s+\d{{1,2}},?\s+\d{{4}})'
+    rf'|(?P<latin>[A-Z][a-z]+(?:\s+(?!(?i:{_MONTHS})\s+\d{{1,2}},?\s+\d{{4}})[A-Z][a-z]+)*\b)'
+    rf'|(?P<tech>(?i:{_TECH_NAMES})\b))'
+    r'|(?P<katakana>[ァ-ヶー]{2,})'
+)
+_NUMBER_RE = re.compile(r'\d+(?:\.\d+)?')
+_MONTH_DAY_RE = re.compile(r'\d{1,2}月\d{1,2}日')
+_TECH_RE = re.compile(rf'\b(?:{_TECH_NAMES})\b', re.IGNORECASE)
+
+_TAG_RE = re.compile(r'<[^>]+>')
+_SPACE_RE = re.compile(r'\s+')
+_H1_RE = re.compile(r'<h1[^>]*>(.*?)</h1>', re.IGNORECASE | re.DOTALL)
+_TITLE_WORD_RE = re.compile(r'[ァ-ヶー]{2,}|[A-Z][a-z]+')
+
+
+def html_to_text(html: str) -> str:
+    """HTMLタグを除去し、空白をまとめたテキスト"""
+    return _SPACE_RE.sub(' ', _TAG_RE.sub(' ', html)).strip()
+
+
+class TextFeatures:
+    """
+    テキストから取り出した数値・日付・固有名詞
+
+    プリコンパイル済みのパターンでテキストを1回だけ走査して集める。
+    元記事・生成記事ごとに1度作り、各チェックで使い回す。
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.numbers: Set[str] = set()      # "100", "3.5", "20%" など（"20%" は "20" も含む）
+        self.dates: Set[str] = set()        # 見つかった表記のまま
+        self.katakana: Set[str] = set()     # 2文字以上のカタカナ語
+        self.latin_nouns: Set[str] = set()  # 大文字で始まる英単語の連続（一般的な単語は除外）
+        self.tech_names: Set[str] = set()   # よく使われる企業名・製品名
+        self._scan()
+
+    def _scan(self) -> None:
+        numbers, dates = self.numbers, self.dates
+        for m in _FEATURE_RE.finditer(self.text):
+            kind, value = m.lastgroup, m.group()
+            if kind == "number":
+                numbers.add(value)
+                if value.endswith("%"):
+                    numbers.add(value[:-1])
+            elif kind == "katakana":
+                self.katakana.add(value)
+            elif kind == "latin":
+                if value not in COMMON_WORDS:
+                    self.latin_nouns.add(value)
+                self.tech_names.update(_TECH_RE.findall(value))
+            elif kind == "tech":
+                self.tech_names.add(value)
+                numbers.update(_NUMBER_RE.findall(value))
+            else:
+                dates.add(value)
+                if kind == "date_ja":
+                    dates.update(_MONTH_DAY_RE.findall(value))
+                numbers.update(_NUMBER_RE.findall(value))
+
+    @property
+    def proper_nouns(self) -> Set[str]:
+        return self.latin_nouns | self.katakana | self.tech_names
 
 
 def extract_numbers(text: str) -> Set[str]:
@@ -14,16 +122,7 @@ def extract_numbers(text: str) -> Set[str]:
     Returns:
         数値の文字列セット（"100", "3.5", "20%"など）
     """
-    numbers = set()
-
-    # 整数と小数
-    numbers.update(re.findall(r'\d+(?:\.\d+)?', text))
-
-    # パーセンテージ
-    percentages = re.findall(r'\d+(?:\.\d+)?%', text)
-    numbers.update(percentages)
-
-    return numbers
+    return TextFeatures(text).numbers
 
 
 def extract_dates(text: str) -> Set[str]:
@@ -33,21 +132,7 @@ def extract_dates(text: str) -> Set[str]:
     Returns:
         日付の文字列セット
     """
-    dates = set()
-
-    # YYYY年MM月DD日形式
-    dates.update(re.findall(r'\d{4}年\d{1,2}月\d{1,2}日', text))
-
-    # YYYY/MM/DD, YYYY-MM-DD形式
-    dates.update(re.findall(r'\d{4}[/-]\d{1,2}[/-]\d{1,2}', text))
-
-    # MM月DD日形式
-    dates.update(re.findall(r'\d{1,2}月\d{1,2}日', text))
-
-    # 英語の日付形式（November 6, 2025など）
-    dates.update(re.findall(r'(?:January|February|March|April|May|June|July|August|September|October|November|December)\s+\d{1,2},?\s+\d{4}', text, re.IGNORECASE))
-
-    return dates
+    return TextFeatures(text).dates
 
 
 def extract_proper_nouns(text: str) -> Set[str]:
@@ -56,36 +141,7 @@ def extract_proper_nouns(text: str) -> Set[str]:
 
     主に英語の大文字で始まる単語、カタカナ語を抽出
     """
-    nouns = set()
-
-    # 除外する一般的な英単語
-    common_words = {
-        'The', 'A', 'An', 'This', 'That', 'These', 'Those',
-        'You', 'Your', 'My', 'Our', 'Their', 'His', 'Her',
-        'What', 'When', 'Where', 'Why', 'How', 'Who',
-        'Can', 'Could', 'Will', 'Would', 'Should', 'May', 'Might',
-        'To', 'From', 'With', 'Without', 'For', 'By', 'At', 'In', 'On',
-        'But', 'And', 'Or', 'So', 'If', 'As',
-        'New', 'Old', 'First', 'Last', 'Next', 'All', 'Some', 'Many',
-        'It', 'Its', 'Is', 'Are', 'Was', 'Were', 'Be', 'Been',
-    }
-
-    # 英語の固有名詞（連続する大文字開始の単語）
-    english_nouns = re.findall(r'\b[A-Z][a-z]+(?:\s+[A-Z][a-z]+)*\b', text)
-    for noun in english_nouns:
-        # 一般的な単語を除外
-        if noun not in common_words:
-            nouns.add(noun)
-
-    # カタカナ語（2文字以上）
-    katakana_nouns = re.findall(r'[ァ-ヶー]{2,}', text)
-    nouns.update(katakana_nouns)
-
-    # よく使われる企業名・製品名（パターン）
-    tech_names = re.findall(r'\b(?:OpenAI|Google|Microsoft|Amazon|Meta|Apple|GPT-?\d+|Claude|Gemini|ChatGPT)\b', text, re.IGNORECASE)
-    nouns.update([n.strip() for n in tech_names])
-
-    return nouns
+    return TextFeatures(text).proper_nouns
 
 
 def check_speculation_phrases(text: str) -> List[str]:
@@ -134,6 +190,19 @@ def check_forbidden_additions(source_summary: str, generated_text: str) -> List[
     return []
 
 
+@lru_cache(maxsize=64)
+def source_terms(source_text: str) -> Tuple[TextFeatures, List[str], TermMatcher]:
+    """
+    元記事の特徴と、生成記事で有無を調べる語（数値・日付・重要な固有名詞）の照合
+
+    修正の再生成などで同じ元記事を何度も照合するので、元記事ごとに1度だけ作って使い回す
+    """
+    source = TextFeatures(source_text)
+    # 重要な固有名詞は3文字以上
+    important_nouns = [n for n in source.proper_nouns if len(n) > 2]
+    return source, important_nouns, TermMatcher([*source.numbers, *source.dates, *important_nouns])
+
+
 def fact_check_article(source_item: Dict, generated_html: str) -> Dict:
     """
     生成記事の基本的なファクトチェック
@@ -153,21 +222,21 @@ def fact_check_article(source_item: Dict, generated_html: str) -> Dict:
     warnings = []
 
     # HTMLタグを除去してテキストのみを取得
-    generated_text = re.sub(r'<[^>]+>', ' ', generated_html)
-    generated_text = re.sub(r'\s+', ' ', generated_text).strip()
+    generated_text = html_to_text(generated_html)
 
     source_text = f"{source_item.get('title', '')} {source_item.get('summary', '')}"
+    source, important_nouns, terms = source_terms(source_text)
+    generated = TextFeatures(generated_text)
 
-    # 1. 数値の照合
-    source_numbers = extract_numbers(source_text)
-    generated_numbers = extract_numbers(generated_text)
+    # 元記事の数値・日付・重要な固有名詞（3文字以上）の有無を、生成記事でまとめて調べる
+    # （大文字小文字・全角半角の違いは無視。「約3.5」なども部分一致で含まれる）
+    found = terms.present(generated_text)
 
+    # 1. 数値の照合
     # 元記事の重要な数値が生成記事に含まれているかチェック
-    for num in source_numbers:
-        if num not in generated_text:
-            # 数値の変換をチェック（例：3.5を「3.5」や「約3.5」）
-            if not re.search(rf'[約およそ]?\s*{re.escape(num)}', generated_text):
-                warnings.append(f"元記事の数値 '{num}' が見つかりません")
+    for num in source.numbers:
+        if num not in found:
+            warnings.append(f"元記事の数値 '{num}' が見つかりません")
 
     # 元記事にない数値の追加をチェック
     added_nums = check_forbidden_additions(source_text, generated_text)
@@ -175,25 +244,23 @@ def fact_check_article(source_item: Dict, generated_html: str) -> Dict:
         issues.extend(added_nums)
 
     # 2. 日付の照合
-    source_dates = extract_dates(source_text)
-    generated_dates = extract_dates(generated_text)
-
-    # 元記事の日付が正確に含まれているかチェック
-    for date in source_dates:
-        if date not in generated_text:
+    # 元記事の日付が生成記事に含まれているかチェック。表記ではなく日付として比べる
+    # （"November 6, 2025" と「2025年11月6日」、元記事の公開日基準の "yesterday" と「11月5日」は同じ日付）
+    reference = reference_date(source_item.get("ts"))
+    generated_date_keys = find_dates(generated_text, reference)
+    legacy_date_issues = []  # 従来の表記どおりの照合なら不合格になっていた日付（効果の測定用）
+    for date in source.dates:
+        if date not in found:
+            legacy_date_issues.append(date)
+        key = normalize_date(date, reference)
+        if not (date_mentioned(key, generated_date_keys) if key else date in found):
             issues.append(f"元記事の日付 '{date}' が正確に記載されていません")
 
     # 3. 固有名詞の照合
-    source_nouns = extract_proper_nouns(source_text)
-    generated_nouns = extract_proper_nouns(generated_text)
-
     # 重要な固有名詞がすべて含まれているか
-    important_nouns = [n for n in source_nouns if len(n) > 2]  # 3文字以上
     for noun in important_nouns:
-        if noun not in generated_text:
-            # 大文字小文字を無視して再チェック
-            if noun.lower() not in generated_text.lower():
-                warnings.append(f"固有名詞 '{noun}' が見つかりません")
+        if noun not in found:
+            warnings.append(f"固有名詞 '{noun}' が見つかりません")
 
     # 4. 推測表現のチェック
     speculations = check_speculation_phrases(generated_text)
@@ -208,11 +275,11 @@ def fact_check_article(source_item: Dict, generated_html: str) -> Dict:
         issues.append(f"記事が短すぎます（{len(generated_text)}文字）")
 
     # 6. タイトルと本文の一貫性チェック
-    title_match = re.search(r'<h1[^>]*>(.*?)</h1>', generated_html, re.IGNORECASE | re.DOTALL)
+    title_match = _H1_RE.search(generated_html)
     if title_match:
-        title = re.sub(r'<[^>]+>', '', title_match.group(1)).strip()
+        title = _TAG_RE.sub('', title_match.group(1)).strip()
         # タイトルに含まれる重要な語が本文にも含まれているか
-        title_words = [w for w in re.findall(r'[ァ-ヶー]{2,}|[A-Z][a-z]+', title) if len(w) > 2]
+        title_words = [w for w in _TITLE_WORD_RE.findall(title) if len(w) > 2]
         for word in title_words[:3]:  # 最初の3つの重要語をチェック
             if word not in generated_text:
                 warnings.append(f"タイトルの '{word}' が本文で説明されていません")
@@ -225,52 +292,21 @@ def fact_check_article(source_item: Dict, generated_html: str) -> Dict:
         "issues": issues,
         "warnings": warnings,
         "details": {
-            "source_numbers": list(source_numbers),
-            "generated_numbers": list(generated_numbers),
-            "source_dates": list(source_dates),
-            "generated_dates": list(generated_dates),
+            "source_numbers": list(source.numbers),
+            "generated_numbers": list(generated.numbers),
+            "source_dates": list(source.dates),
+            "generated_dates": list(generated.dates),
+            "legacy_date_issues": legacy_date_issues,
             "character_count": len(generated_text)
         }
     }
 
 
-def llm_fact_check_article(source_item: Dict, generated_html: str, client) -> Dict:
-    """
-    LLMを使用した高度なファクトチェック（Phase 2）
-
-    Args:
-        source_item: 元記事の情報
-        generated_html: 生成されたHTML記事
-        client: Anthropic client
-
-    Returns:
-        {
-            "passed": bool,
-            "score": int (0-100),
-            "issues": [問題のリスト],
-            "analysis": {
-                "logical_consistency": int (0-100),
-                "contextual_accuracy": int (0-100),
-                "tone_consistency": int (0-100),
-                "information_completeness": int (0-100),
-                "semantic_accuracy": int (0-100)
-            }
-        }
-    """
-    # HTMLタグを除去
-    generated_text = re.sub(r'<[^>]+>', ' ', generated_html)
-    generated_text = re.sub(r'\s+', ' ', generated_text).strip()
-
-    source_text = f"{source_item.get('title', '')} {source_item.get('summary', '')}"
-
-    # LLMに分析を依頼
-    from datetime import datetime
-    today = datetime.now().strftime("%Y年%m月%d日")
-
-    system_prompt = f"""あなたは記事品質チェッカーです。
+# Phase 2 のシステムプロンプト（固定。prompt caching の対象）
+LLM_CHECK_SYSTEM = """あなたは記事品質チェッカーです。
 
 【重要な前提情報】
-- 今日の日付: {today}
+- 今日の日付はユーザーメッセージの【前提情報】を参照してください
 - 元記事に含まれる製品名・技術名は実在するものとして扱ってください
 - 元記事が最新ニュースのため、あなたの知識にない新製品・新サービスが含まれている可能性があります
 
@@ -311,71 +347,160 @@ def llm_fact_check_article(source_item: Dict, generated_html: str, client) -> Di
 - 元記事にない影響分析の追加
 - 推測や予測の記述（明示されている場合）
 
-各項目を0-100点で評価し、JSON形式で返してください。
-60点未満の項目がある場合は、その理由を詳しく説明してください。"""
+各項目を0-100点の整数で評価し、report_quality ツールで報告してください。
+60点未満の項目がある場合は、その理由を issues に詳しく説明してください。
 
-    user_prompt = f"""【元記事】
-タイトル: {source_item.get('title', '')}
-要約: {source_item.get('summary', '')}
-
-【生成記事（HTMLタグ除去済み）】
-{generated_text[:6000]}
-
-上記の生成記事を分析し、以下のJSON形式で返してください：
-
-{{
-  "logical_consistency": <0-100の整数>,
-  "factual_accuracy": <0-100の整数>,
-  "completeness": <0-100の整数>,
-  "internal_coherence": <0-100の整数>,
-  "readability": <0-100の整数>,
-  "issues": [
-    "問題点1（ある場合のみ）",
-    "問題点2（ある場合のみ）"
-  ],
-  "summary": "総合評価のサマリー"
-}}
+【報告する項目】
+- logical_consistency / factual_accuracy / completeness / internal_coherence / readability: 0-100の整数
+- issues: 問題点のリスト（ある場合のみ）
+- summary: 総合評価のサマリー
 
 【重要な注意】
 - 背景説明、技術解説、影響分析の追加は問題ではありません
 - 元記事にない情報の追加は問題ではありません
 - 明らかな事実誤認、論理矛盾、記事の途切れのみを問題としてください
 
-注意：JSONのみを返し、他のテキストは含めないでください。"""
+注意：結果は report_quality ツールの呼び出しのみで返してください。"""
+
+
+_check_cache = None
+
+
+def get_check_cache() -> Optional[JsonCache]:
+    """Phase 2 の結果キャッシュ（プロセス内で共有、無効な場合はNone）"""
+    global _check_cache
+    from model_helper import CFG
+    cc = CFG.get("generate", {}).get("check_cache", {})
+    if not cc.get("enabled", True):
+        return None
+    if _check_cache is None:
+        _check_cache = JsonCache(
+            CHECK_CACHE_PATH,
+            ttl_seconds=cc.get("ttl_hours", 24) * 3600,
+            max_entries=cc.get("max_entries", 500),
+        )
+    return _check_cache
+
+
+def check_cache_key(source_item: Dict, article_text: str, model: str) -> str:
+    """元記事のタイトル・要約、Phase 2 に渡す記事テキスト、プロンプト版数、モデルのハッシュ"""
+    return content_hash(source_item.get("title", ""), source_item.get("summary", ""),
+                        content_hash(article_text), LLM_CHECK_PROMPT_VERSION, model)
+
+
+def llm_fact_check_article(source_item: Dict, generated_html: str, client,
+                           max_article_tokens: int = CHECK_ARTICLE_TOKENS, deadline: float = None) -> Dict:
+    """
+    LLMを使用した高度なファクトチェック（Phase 2）
+
+    Args:
+        source_item: 元記事の情報
+        generated_html: 生成されたHTML記事
+        client: Anthropic client
+        max_article_tokens: 生成記事のトークン上限（超える分は文の区切りで切り詰め）
+        deadline: API呼び出しの実行枠を待つ期限（time.monotonic() の時刻、Noneなら期限なし）
+
+    同じ記事の結果は generate.check_cache に保存して再利用する（"cached": True を付けて返す）。
+    エラーで判定できなかった結果は保存しない。
+
+    Returns:
+        {
+            "passed": bool,
+            "score": int (0-100),
+            "issues": [問題のリスト],
+            "analysis": {
+                "logical_consistency": int (0-100),
+                "contextual_accuracy": int (0-100),
+                "tone_consistency": int (0-100),
+                "information_completeness": int (0-100),
+                "semantic_accuracy": int (0-100)
+            }
+        }
+    """
+    # HTMLタグを除去し、トークン上限に収める
+    article_text = fit_to_budget(html_to_text(generated_html), max_article_tokens)
+
+    # 同じ元記事・同じ記事テキストをいずれかのモデルでチェック済みなら再利用
+    cache = get_check_cache()
+    if cache is not None:
+        from model_helper import route_models
+        for model in route_models("fact_check"):
+            hit = cache.get(check_cache_key(source_item, article_text, model))
+            if hit:
+                print(f"[Phase 2] チェック済みの結果をキャッシュから再利用します（{model}）")
+                return dict(hit, cached=True)
+
+    # 日付は可変なのでsystem（キャッシュ対象）ではなくuserメッセージに置く
+    from datetime import datetime
+    today = datetime.now().strftime("%Y年%m月%d日")
+
+    user_prompt = f"""【前提情報】
+- 今日の日付: {today}
+
+【元記事】
+タイトル: {source_item.get('title', '')}
+要約: {source_item.get('summary', '')}
+
+【生成記事（HTMLタグ除去済み）】
+{article_text}
+
+上記の生成記事を分析し、report_quality ツールで結果を報告してください。"""
 
     try:
         # model_helperをインポート
         import sys
         from pathlib import Path
         sys.path.append(str(Path(__file__).parent))
-        from model_helper import create_message_with_fallback
+        from model_helper import create_message_with_fallback, cacheable_system
 
         msg = create_message_with_fallback(
             client,
-            system=system_prompt,
+            system=cacheable_system(LLM_CHECK_SYSTEM),
             messages=[{"role": "user", "content": user_prompt}],
             max_tokens=1500,
             temperature=0.0,
-            timeout=20.0  # 20秒でタイムアウト
+            timeout=20.0,  # 20秒でタイムアウト
+            label="fact_check",
+            deadline=deadline,
+            tools=[CHECK_TOOL],
+            tool_choice=CHECK_TOOL_CHOICE
         )
 
-        response_text = "".join([p.text for p in msg.content if p.type == "text"]).strip()
-
-        # JSONをパース
-        import json
-        # コードブロックマーカーを除去
-        response_text = re.sub(r'```json\s*', '', response_text)
-        response_text = re.sub(r'```\s*$', '', response_text)
-
-        analysis = json.loads(response_text)
+        # スキーマどおりでなければ、記事は送り直さずに形式の直しだけを依頼（1回まで）
+        report, error = parse_check_response(msg)
+        format_retries = 0
+        if report is None:
+            print(f"[Phase 2] 応答の形式が不正なため、形式の直しを依頼します: {error[:200]}")
+            format_retries = 1
+            retry = create_message_with_fallback(
+                client,
+                system=FORMAT_RETRY_SYSTEM,
+                messages=format_retry_messages(msg, error),
+                max_tokens=1500,
+                temperature=0.0,
+                timeout=20.0,
+                label="fact_check_format",
+                deadline=deadline,
+                tools=[CHECK_TOOL],
+                tool_choice=CHECK_TOOL_CHOICE
+            )
+            report, error = parse_check_response(retry)
+            # 元の出力になかった評価値は直しの側が作ったもの。判定に使わず、エラーとして扱う
+            invented = invented_scores(report, msg) if report is not None else []
+            if invented:
+                report, error = None, f"元の評価結果にない評価値: {', '.join(invented)}"
+        format_stats.record(format_retries == 0, report is not None)
+        if report is None:
+            raise ValueError(f"応答の形式が不正: {error[:300]}")
+        analysis = report.model_dump()
 
         # スコアを計算
         scores = [
-            analysis.get("logical_consistency", 0),
-            analysis.get("factual_accuracy", 0),
-            analysis.get("completeness", 0),
-            analysis.get("internal_coherence", 0),
-            analysis.get("readability", 0)
+            analysis["logical_consistency"],
+            analysis["factual_accuracy"],
+            analysis["completeness"],
+            analysis["internal_coherence"],
+            analysis["readability"]
         ]
         average_score = sum(scores) / len(scores)
 
@@ -383,20 +508,26 @@ def llm_fact_check_article(source_item: Dict, generated_html: str, client) -> Di
         min_score = min(scores)
         passed = min_score >= 60 and average_score >= 70
 
-        return {
+        result = {
             "passed": passed,
             "score": int(average_score),
             "min_score": min_score,
-            "issues": analysis.get("issues", []),
-            "summary": analysis.get("summary", ""),
+            "issues": analysis["issues"],
+            "summary": analysis["summary"],
+            "format_retries": format_retries,
             "analysis": {
-                "logical_consistency": analysis.get("logical_consistency", 0),
-                "factual_accuracy": analysis.get("factual_accuracy", 0),
-                "completeness": analysis.get("completeness", 0),
-                "internal_coherence": analysis.get("internal_coherence", 0),
-                "readability": analysis.get("readability", 0)
+                "logical_consistency": analysis["logical_consistency"],
+                "factual_accuracy": analysis["factual_accuracy"],
+                "completeness": analysis["completeness"],
+                "internal_coherence": analysis["internal_coherence"],
+                "readability": analysis["readability"]
             }
         }
+        if cache is not None:
+            model = getattr(msg, "model", None) or route_models("fact_check")[0]
+            cache.set(check_cache_key(source_item, article_text, model), result)
+            cache.save()
+        return result
 
     except Exception as e:
         print(f"LLMファクトチェックエラー: {e}")
@@ -408,6 +539,7 @@ def llm_fact_check_article(source_item: Dict, generated_html: str, client) -> Di
             "min_score": 0,
             "issues": [f"LLMチェックエラー: {str(e)}"],
             "summary": "エラーのため不合格（次の候補を試行）",
+            "error": str(e),
             "analysis": {
                 "logical_consistency": 0,
                 "factual_accuracy": 0,
@@ -448,6 +580,8 @@ def print_fact_check_result(result: Dict) -> None:
     print(f"  生成記事の数値: {details['generated_numbers']}")
     print(f"  元記事の日付: {details['source_dates']}")
     print(f"  生成記事の日付: {details['generated_dates']}")
+    if details.get("legacy_date_issues"):
+        print(f"  表記どおりの照合では不一致の日付: {details['legacy_date_issues']}")
 
     print("="*60 + "\n")
 
@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from langdetect import detect, DetectorFactory
 from dotenv import dotenv_values
-from anthropic import Anthropic
+from model_helper import get_client, call_with_rate_limit, estimate_input_tokens
 import requests
 from requests.auth import HTTPBasicAuth
 from urllib.parse import urljoin
@@ -118,7 +118,7 @@ def main():
     api_key = ENV.get("ANTHROPIC_API_KEY")
     if not api_key:
         raise SystemExit("ANTHROPIC_API_KEY が .env にありません。")
-    client = Anthropic(api_key=api_key)
+    client = get_client(api_key)
 
     system = (
         "あなたは日本語のテック記者で、実用性と信頼性を重視します。"
@@ -187,13 +187,14 @@ def main():
 - freshness: {item["freshness"]}
 """.strip()
 
-    msg = client.messages.create(
+    # 共有のレート制限・再試行を通して呼び出す
+    msg = call_with_rate_limit(lambda: client.messages.create(
         model="claude-3-opus-20240229",
         max_tokens=4000,  # より長い生成のため増加
         temperature=0.2,
         system=system,
         messages=[{"role": "user", "content": user}],
-    )
+    ), estimate_input_tokens(system, [{"role": "user", "content": user}]), 4000)
     parts = msg.content
     html = "".join([p.text for p in parts if p.type == "text"]).strip()
     if not html:
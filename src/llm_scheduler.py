@@ -0,0 +1,384 @@
+# -*- coding: utf-8 -*-
+"""
+llm_scheduler.py
+LLM呼び出しの並列実行
+- スレッドプールで独立した呼び出しを並列に実行（同時実行数は設定で上限）
+- 429（レート制限）/529（過負荷）を受けたら同時実行数を半減し、
+  retry-after / anthropic-ratelimit-*-reset ヘッダの時刻まで全体を一時停止
+  （再試行は model_helper.call_with_rate_limit が行うため、既定では実行器では再試行しない）
+- 成功が続けば同時実行数を1ずつ戻す
+- 全Anthropic呼び出しで共有するトークンバケット（リクエスト数・入力/出力トークン数/分）
+  上限と残量は anthropic-ratelimit-* レスポンスヘッダで随時更新する
+- 優先度付きレーン（生成・チェック・スコアリング）ごとの同時実行枠と期限
+  （トークンバケットの確保も優先度順に行い、トークン待ちの間は枠を取らない）
+"""
+import time
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from anthropic import APIConnectionError, APITimeoutError
+
+RATE_LIMIT_STATUSES = (429, 529)
+# 再試行する一時的なエラー（レート制限・過負荷・サーバーエラー）
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504, 529)
+RESET_HEADERS = (
+    "anthropic-ratelimit-requests-reset",
+    "anthropic-ratelimit-tokens-reset",
+    "anthropic-ratelimit-input-tokens-reset",
+    "anthropic-ratelimit-output-tokens-reset",
+)
+
+
+def is_rate_limited(e: Exception) -> bool:
+    """429/529 のAPIエラーかどうか"""
+    return getattr(e, "status_code", None) in RATE_LIMIT_STATUSES
+
+
+def is_retryable(e: Exception) -> bool:
+    """再試行で回復する見込みのあるエラーかどうか（タイムアウトは含めない）"""
+    if getattr(e, "status_code", None) in RETRYABLE_STATUSES:
+        return True
+    return isinstance(e, APIConnectionError) and not isinstance(e, APITimeoutError)
+
+
+def _parse_reset(value: str) -> Optional[float]:
+    """RFC 3339形式のリセット時刻を「今から何秒後か」に変換"""
+    try:
+        reset = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if reset.tzinfo is None:
+        reset = reset.replace(tzinfo=timezone.utc)
+    return max(0.0, (reset - datetime.now(timezone.utc)).total_seconds())
+
+
+def retry_after_seconds(e: Exception) -> Optional[float]:
+    """
+    エラーレスポンスのヘッダから待機秒数を取得
+
+    retry-after を優先し、なければ anthropic-ratelimit-*-reset のうち最も遅い時刻を使う。
+    ヘッダがない場合はNone。
+    """
+    response = getattr(e, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+    waits = [_parse_reset(headers[h]) for h in RESET_HEADERS if headers.get(h)]
+    waits = [w for w in waits if w is not None]
+    return max(waits) if waits else None
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0) -> float:
+    """ジッター付き指数バックオフ（秒）"""
+    return min(cap, base * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+
+class AdaptiveExecutor:
+    """
+    レート制限を意識した並列実行器
+
+    同時実行数の上限（limit）を持ち、429/529で半減・成功が続けば+1する（AIMD）。
+    レート制限時は全スレッドを retry-after まで一時停止する。
+    max_retries を指定した場合のみ、429/529の項目を実行器でも再試行する
+    （model_helper 経由の呼び出しは既に再試行済みのため、二重に再試行しないよう既定は0）。
+    """
+
+    def __init__(self, max_workers: int = 4, max_retries: int = 0,
+                 base_delay: float = 2.0, max_delay: float = 60.0):
+        self.max_workers = max(1, int(max_workers))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limit = self.max_workers
+        self.active = 0
+        self.pause_until = 0.0
+        self.successes = 0
+        self.throttled = 0
+        self.cond = threading.Condition()
+
+    def _acquire(self) -> None:
+        with self.cond:
+            while True:
+                wait = self.pause_until - time.time()
+                if wait > 0:
+                    self.cond.wait(wait)
+                    continue
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                self.cond.wait()
+
+    def _release(self, throttle_for: Optional[float] = None) -> None:
+        with self.cond:
+            self.active -= 1
+            if throttle_for is not None:
+                self.throttled += 1
+                self.limit = max(1, self.limit // 2)
+                self.pause_until = max(self.pause_until, time.time() + throttle_for)
+                self.successes = 0
+            else:
+                self.successes += 1
+                if self.limit < self.max_workers and self.successes >= self.limit:
+                    self.limit += 1
+                    self.successes = 0
+            self.cond.notify_all()
+
+    def run(self, fn: Callable[[Any], Any], item: Any) -> Any:
+        """
+        1件を実行
+
+        429/529の場合は同時実行数を絞って全体を一時停止し、max_retries 回まで再試行
+        （既定の0なら再試行せず送出）。それ以外の例外はそのまま送出。
+        """
+        for attempt in range(self.max_retries + 1):
+            self._acquire()
+            try:
+                result = fn(item)
+            except Exception as e:
+                if not is_rate_limited(e):
+                    self._release()
+                    raise
+                wait = retry_after_seconds(e)
+                if wait is None:
+                    wait = backoff_delay(attempt, self.base_delay, self.max_delay)
+                wait = min(wait, self.max_delay)
+                self._release(throttle_for=wait)
+                print(f"[レート制限] {getattr(e, 'status_code', '')} を受信。{wait:.1f}秒待機し、同時実行数を{self.limit}に制限します")
+                if attempt >= self.max_retries:
+                    raise
+                continue
+            self._release()
+            return result
+
+    def map(self, fn: Callable[[Any], Any], items: List[Any], default: Any = None) -> List[Any]:
+        """
+        全件を並列実行し、入力と同じ順序で結果を返す
+
+        再試行しても失敗した項目は default になる。
+        """
+        if not items:
+            return []
+
+        def safe(item):
+            try:
+                return self.run(fn, item)
+            except Exception as e:
+                print(f"[警告] LLM呼び出しに失敗: {str(e)[:100]}")
+                return default
+
+        if self.max_workers == 1 or len(items) == 1:
+            return [safe(it) for it in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as pool:
+            return list(pool.map(safe, items))
+
+
+class TokenBucket:
+    """1分あたりの上限から毎秒補充されるバケット"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """amount を取り出せるまでの秒数（上限を超える量は上限まで切り詰める）"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) * 60 / self.capacity
+
+    def take(self, amount: float) -> None:
+        self.tokens -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    リクエスト数・入力トークン数・出力トークン数の3つのトークンバケットによる流量制御
+
+    - acquire() で見積もり分を確保（足りなければ補充されるまで待機）
+      try_acquire() は待たずに確保を試み、足りなければ待つべき秒数を返す
+    - settle() で実際の使用量との差を精算
+    - update_from_headers() でAPIの上限（*-limit）と残量（*-remaining）に合わせる
+    - pause() で全体を一時停止（429/529の retry-after）
+    """
+
+    KINDS = ("requests", "input-tokens", "output-tokens")
+
+    def __init__(self, requests_per_minute: float = 50, input_tokens_per_minute: float = 30000,
+                 output_tokens_per_minute: float = 8000):
+        self.buckets = {
+            "requests": TokenBucket(requests_per_minute),
+            "input-tokens": TokenBucket(input_tokens_per_minute),
+            "output-tokens": TokenBucket(output_tokens_per_minute),
+        }
+        self.pause_until = 0.0
+        self.waited = 0.0
+        self.cond = threading.Condition()
+
+    def _try_take(self, amounts: Dict[str, float]) -> float:
+        now = time.monotonic()
+        wait = max([self.pause_until - now] + [b.wait_time(amounts[k], now) for k, b in self.buckets.items()])
+        if wait <= 0:
+            for k, b in self.buckets.items():
+                b.take(amounts[k])
+        return wait
+
+    def acquire(self, input_tokens: float = 0, output_tokens: float = 0) -> float:
+        """1リクエスト分を確保し、待機した秒数を返す"""
+        amounts = {"requests": 1, "input-tokens": input_tokens, "output-tokens": output_tokens}
+        start = time.monotonic()
+        with self.cond:
+            while True:
+                wait = self._try_take(amounts)
+                if wait <= 0:
+                    break
+                self.cond.wait(wait)
+            waited = time.monotonic() - start
+            self.waited += waited
+        return waited
+
+    def try_acquire(self, input_tokens: float = 0, output_tokens: float = 0) -> float:
+        """
+        待たずに確保できれば1リクエスト分を確保して0を返す
+
+        確保できなければ何も取らず、確保できるようになるまでの秒数（目安）を返す
+        （PriorityScheduler が優先度順に確保させるのに使う）
+        """
+        amounts = {"requests": 1, "input-tokens": input_tokens, "output-tokens": output_tokens}
+        with self.cond:
+            return max(0.0, self._try_take(amounts))
+
+    def settle(self, est_input: float, est_output: float, input_tokens: float, output_tokens: float) -> None:
+        """見積もりと実際の使用量の差を精算（使いすぎた分は以降の待機で調整される）"""
+        with self.cond:
+            self.buckets["input-tokens"].tokens -= input_tokens - est_input
+            self.buckets["output-tokens"].tokens -= output_tokens - est_output
+            self.cond.notify_all()
+
+    def pause(self, seconds: float) -> None:
+        with self.cond:
+            self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+            self.cond.notify_all()
+
+    def update_from_headers(self, headers) -> None:
+        """anthropic-ratelimit-{requests,input-tokens,output-tokens}-{limit,remaining} を反映"""
+        with self.cond:
+            for kind, bucket in self.buckets.items():
+                try:
+                    limit = headers.get(f"anthropic-ratelimit-{kind}-limit")
+                    remaining = headers.get(f"anthropic-ratelimit-{kind}-remaining")
+                    if limit:
+                        bucket.capacity = max(1.0, float(limit))
+                    if remaining is not None:
+                        bucket._refill(time.monotonic())
+                        bucket.tokens = min(bucket.tokens, float(remaining))
+                except (TypeError, ValueError):
+                    continue
+            self.cond.notify_all()
+
+
+class DeadlineExceeded(Exception):
+    """実行枠を待っている間に期限を過ぎた"""
+
+
+class PriorityScheduler:
+    """
+    優先度付きレーンごとの同時実行枠
+
+    - レーンごとに優先度（小さいほど優先）と同時実行数の上限を持ち、全体の上限も共有する
+    - 枠が空いたら、待っている呼び出しのうち実行可能なもの（レーンの上限に達していない）を
+      優先度 → 期限の早い順 → 到着順で選ぶ。優先度の高い呼び出しが待っている間、
+      待ち行列の低優先度の呼び出しは後回しになる（実行中の呼び出しは中断しない）
+    - 期限（time.monotonic() の時刻）までに枠を得られなければ DeadlineExceeded を送出
+      （レーンの queue_timeout を既定の期限にできる）
+    - slot() に RateLimiter を渡すと、枠と見積もりトークンをまとめて確保する。トークンが足りない間は
+      枠を取らずに待ち、先頭（最優先）の呼び出しが確保できるまで後ろの呼び出しも待つ
+      （トークンも優先度順に割り当てられ、低優先度の呼び出しが補充分を先取りしない）
+    """
+
+    def __init__(self, lanes: Dict[str, Dict] = None, max_concurrency: int = 4):
+        self.lanes = lanes or {}
+        self.max_concurrency = max_concurrency
+        self.cond = threading.Condition()
+        self.active: Dict[str, int] = {}
+        self.total = 0
+        self.waiting: List[Tuple] = []
+        self.seq = 0
+        self.stats: Dict[str, Dict] = {}
+
+    def _lane_cfg(self, lane: str) -> Dict:
+        return self.lanes.get(lane) or {}
+
+    def _has_room(self, lane: str) -> bool:
+        limit = self._lane_cfg(lane).get("max_concurrency")
+        return self.total < self.max_concurrency and (limit is None or self.active.get(lane, 0) < limit)
+
+    def _next(self) -> Optional[Tuple]:
+        runnable = [w for w in self.waiting if self._has_room(w[3])]
+        return min(runnable) if runnable else None
+
+    @contextmanager
+    def slot(self, lane: str = "default", deadline: float = None, limiter: Optional[RateLimiter] = None,
+             input_tokens: float = 0, output_tokens: float = 0):
+        cfg = self._lane_cfg(lane)
+        if deadline is None and cfg.get("queue_timeout"):
+            deadline = time.monotonic() + cfg["queue_timeout"]
+        start = time.monotonic()
+        stats = self.stats.setdefault(lane, {"granted": 0, "expired": 0, "wait": 0.0})
+        with self.cond:
+            self.seq += 1
+            waiter = (cfg.get("priority", 1), deadline if deadline is not None else float("inf"), self.seq, lane)
+            self.waiting.append(waiter)
+            try:
+                while True:
+                    # トークン待ちは先頭の呼び出しだけ（補充を待つ秒数だけ眠る）
+                    token_wait = None
+                    if self._next() == waiter:
+                        if limiter is None:
+                            break
+                        token_wait = limiter.try_acquire(input_tokens, output_tokens)
+                        if token_wait <= 0:
+                            break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        stats["expired"] += 1
+                        raise DeadlineExceeded(f"{lane} の実行枠を期限内に確保できませんでした")
+                    waits = [w for w in (remaining, token_wait) if w is not None]
+                    self.cond.wait(min(waits) if waits else None)
+            finally:
+                self.waiting.remove(waiter)
+                self.cond.notify_all()
+            self.active[lane] = self.active.get(lane, 0) + 1
+            self.total += 1
+            stats["granted"] += 1
+            stats["wait"] += time.monotonic() - start
+        try:
+            yield
+        finally:
+            with self.cond:
+                self.active[lane] -= 1
+                self.total -= 1
+                self.cond.notify_all()
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        for lane, s in sorted(self.stats.items()):
+            avg = s["wait"] / s["granted"] if s["granted"] else 0.0
+            line = f"[スケジューラ] {lane}: {s['granted']}回、平均待ち {avg:.2f}秒"
+            if s["expired"]:
+                line += f"、期限切れ {s['expired']}回"
+            lines.append(line)
+        return lines
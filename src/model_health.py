@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+model_health.py
+モデルごとの稼働状況（ヘルス）を state/model_health.json に記録し、フォールバック順を決める
+- 404 / not_found を返したモデルは長期間（既定7日）スキップ
+- エラーが連続したモデルは一定時間スキップ（サーキットブレーカー）
+- スキップ期間が過ぎたら1回だけ試し（再プローブ）、また失敗すれば再びスキップ
+- 成功時のレイテンシを呼び出し種別（label: scoring / generation など）ごとに記録し、
+  同じ種別のp50の速い順に並べる（設定で無効化可）
+- path が None の場合は保存しない（テスト用）
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+# モデルごとに保持するレイテンシの件数
+MAX_SAMPLES = 200
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    """p（0〜100）パーセンタイル（線形補間）。空ならNone"""
+    if not values:
+        return None
+    xs = sorted(values)
+    k = (len(xs) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(xs) - 1)
+    return xs[lo] + (xs[hi] - xs[lo]) * (k - lo)
+
+
+class ModelHealthStore:
+    """
+    モデルごとの稼働状況
+
+    各モデルの状態: {"dead_until", "reason", "error_streak", "latencies", "last_ok", "last_error"}
+    latencies は {label: [秒, ...]}。出力長の違う呼び出し種別を混ぜて比べないため
+    """
+
+    def __init__(self, path: Optional[Path], not_found_cooldown: float = 7 * 86400, error_threshold: int = 3,
+                 error_cooldown: float = 600, prefer_fastest: bool = True, min_samples: int = 5):
+        self.path = Path(path) if path is not None else None
+        self.not_found_cooldown = not_found_cooldown
+        self.error_threshold = error_threshold
+        self.error_cooldown = error_cooldown
+        self.prefer_fastest = prefer_fastest
+        self.min_samples = min_samples
+        self.lock = threading.Lock()
+        self.models: Dict[str, Dict] = {}
+        if self.path is not None and self.path.exists():
+            try:
+                self.models = json.loads(self.path.read_text(encoding="utf-8")).get("models", {})
+            except Exception:
+                self.models = {}
+        for st in self.models.values():
+            # 旧形式（種別を区別しないリスト）は比較に使えないので捨てる
+            if not isinstance(st.get("latencies"), dict):
+                st["latencies"] = {}
+
+    def _state(self, model: str) -> Dict:
+        return self.models.setdefault(model, {
+            "dead_until": 0.0, "reason": "", "error_streak": 0, "latencies": {}, "last_ok": 0.0, "last_error": "",
+        })
+
+    def is_available(self, model: str, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        return self.models.get(model, {}).get("dead_until", 0.0) <= now
+
+    def p50(self, model: str, label: str = "") -> Optional[float]:
+        return self.latency_percentile(model, label, 50)
+
+    def latency_percentile(self, model: str, label: str, p: float) -> Optional[float]:
+        """label の計測値のpパーセンタイル（計測件数が min_samples 未満ならNone）"""
+        lat = self.models.get(model, {}).get("latencies", {}).get(label, [])
+        return percentile(lat, p) if len(lat) >= self.min_samples else None
+
+    def record_sample(self, model: str, label: str, value: float) -> None:
+        """成功・失敗の判定に関わらない計測値（初回トークンまでの時間など）を記録"""
+        with self.lock:
+            lat = self._state(model)["latencies"]
+            lat[label] = (lat.get(label, []) + [round(value, 3)])[-MAX_SAMPLES:]
+
+    def order(self, models: List[str], label: str = "") -> List[str]:
+        """
+        試行順を返す
+
+        スキップ期間中のモデルは除外（すべて除外される場合は設定順のまま全件）。
+        prefer_fastest の場合、同じ label の計測件数が足りているモデルをp50の速い順に
+        先頭へ並べ、残りは設定順に続ける。
+        """
+        with self.lock:
+            now = time.time()
+            alive = [m for m in models if self.is_available(m, now)]
+            if not alive:
+                return list(models)
+            if not self.prefer_fastest:
+                return alive
+            p50 = {m: self.p50(m, label) for m in alive}
+            measured = sorted((m for m in alive if p50[m] is not None), key=p50.get)
+            return measured + [m for m in alive if p50[m] is None]
+
+    def record_success(self, model: str, latency: Optional[float], label: str = "") -> None:
+        """成功を記録。latency が None（打ち切った呼び出しなど）ならレイテンシは記録しない"""
+        with self.lock:
+            st = self._state(model)
+            recovered = st["dead_until"] > 0 or st["error_streak"] > 0
+            st.update(dead_until=0.0, reason="", error_streak=0, last_ok=time.time())
+            if latency is not None:
+                lat = st["latencies"]
+                lat[label] = (lat.get(label, []) + [round(latency, 3)])[-MAX_SAMPLES:]
+        if recovered:
+            print(f"[モデル] {model} が復帰しました")
+            self.save()
+
+    def record_not_found(self, model: str, error: str = "") -> None:
+        """404 / not_found: 長期間スキップ"""
+        with self.lock:
+            st = self._state(model)
+            st.update(dead_until=time.time() + self.not_found_cooldown, reason="not_found", last_error=error[:200])
+        print(f"[モデル] {model} は利用できないため、{self.not_found_cooldown / 86400:.0f}日間スキップします")
+        self.save()
+
+    def record_error(self, model: str, error: str = "") -> None:
+        """一時的なエラー: 連続 error_threshold 回でしばらくスキップ"""
+        with self.lock:
+            st = self._state(model)
+            st["error_streak"] += 1
+            st["last_error"] = error[:200]
+            tripped = st["error_streak"] >= self.error_threshold
+            if tripped:
+                st.update(dead_until=time.time() + self.error_cooldown, reason="errors", error_streak=0)
+        if tripped:
+            print(f"[モデル] {model} でエラーが{self.error_threshold}回続いたため、{self.error_cooldown:.0f}秒間スキップします")
+            self.save()
+
+    def summary_lines(self) -> List[str]:
+        lines = []
+        now = time.time()
+        for model, st in sorted(self.models.items()):
+            status = "利用可" if st.get("dead_until", 0) <= now else f"スキップ中（{st.get('reason', '')}）"
+            lines.append(f"[モデル] {model}: {status}")
+            for label, lat in sorted(st.get("latencies", {}).items()):
+                if lat:
+                    lines.append(f"[モデル]   {label or '(未分類)'}: p50 {percentile(lat, 50):.2f}秒 / "
+                                 f"p90 {percentile(lat, 90):.2f}秒（{len(lat)}件）")
+        return lines
+
+    def save(self) -> None:
+        if self.path is None:
+            return
+        with self.lock:
+            data = json.dumps({"models": self.models}, ensure_ascii=False)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            tmp.write_text(data, encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"[警告] モデル稼働状況の保存に失敗: {e}")
@@ -2,13 +2,40 @@
 """
 model_helper.py
 Claude APIのモデル選択とフォールバック機能を提供
+- プロセス全体で共有するAnthropicクライアント（接続プール・keep-alive設定付き）
+- 呼び出しごとのレイテンシを接続時間とサーバー応答時間に分けて記録
+- 固定プロンプトのキャッシュ指定（prompt caching）とキャッシュ読み書きトークン数の記録
+- ストリーミング生成（受信中のテキストを逐次チェックして早期に打ち切る）
+- モデルの稼働状況を記録し、利用できないモデルをスキップ（model_health.py）
+- 全呼び出しを共有のレート制限（llm_scheduler.RateLimiter）経由にし、一時的なエラーは
+  retry-after を尊重したジッター付き指数バックオフで再試行
+- 呼び出し種別（label）ごとのモデル・パラメータの振り分け（claude.routes）と、種別ごとのコスト集計
+- ストリーミング生成のヘッジ（出力開始が遅いときに次のモデルにも送り、先に完了した方を採用）
+- 呼び出し種別を優先度付きレーン（claude.scheduler）に割り当て、スコアリングが生成の枠を奪わないようにする
 """
+import os
+import json
+import time
+import atexit
+import threading
 import yaml
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from anthropic import Anthropic, APIError
+from typing import Callable, Dict, List, Optional
+from dotenv import dotenv_values
+from anthropic import Anthropic, APIStatusError, APIConnectionError, NotFoundError
+
+from model_health import ModelHealthStore
+from prompt_budget import estimate_tokens
+from llm_scheduler import (RateLimiter, PriorityScheduler, is_rate_limited, is_retryable, retry_after_seconds,
+                           backoff_delay)
 
 BASE = Path(__file__).resolve().parent.parent
 CFG = yaml.safe_load(open(BASE / "config" / "config.yaml", "r", encoding="utf-8"))
+HEALTH_PATH = BASE / "state" / "model_health.json"
+# 環境変数 MODEL_HEALTH_PATH で保存先を変更できる（空文字なら保存しない。テスト用）
+HEALTH_PATH_ENV = "MODEL_HEALTH_PATH"
+USAGE_LOG_PATH = BASE / "state" / "llm_usage.jsonl"
 
 
 def get_claude_config():
@@ -35,65 +62,700 @@ def get_temperature():
     return claude_cfg.get("temperature", 0.2)
 
 
-def create_message_with_fallback(client: Anthropic, system: str, messages: list,
-                                  max_tokens: int = None, temperature: float = None, timeout: float = None):
+def get_http_config():
+    """config.yamlからHTTP接続プールの設定を取得"""
+    return get_claude_config().get("http", {})
+
+
+# ===== 呼び出し種別ごとの振り分け =====
+
+def get_route(label: str = "", input_tokens: int = None) -> Dict:
     """
-    フォールバック機能付きでClaudeメッセージを作成
+    呼び出し種別（label）に使うモデル列とパラメータ
 
-    Args:
-        client: Anthropicクライアント
-        system: システムプロンプト
-        messages: メッセージリスト
-        max_tokens: 最大トークン数（Noneの場合は設定ファイルから取得）
-        temperature: 温度パラメータ（Noneの場合は設定ファイルから取得）
-        timeout: タイムアウト秒数（Noneの場合はデフォルト値を使用）
+    claude.routes.<label> の models / max_tokens / temperature を使い、未指定なら全体の設定。
+    short_input.max_input_tokens が正で input_tokens がそれ以下なら short_input.models を使う。
 
     Returns:
-        APIレスポンス
+        {"rule": "default" / "short_input", "models": [...], "max_tokens": int, "temperature": float}
+    """
+    cfg = get_claude_config().get("routes", {}).get(label) or {}
+    route = {
+        "rule": "default",
+        "models": cfg.get("models") or get_available_models(),
+        "max_tokens": cfg.get("max_tokens", get_max_tokens()),
+        "temperature": cfg.get("temperature", get_temperature()),
+    }
+    short = cfg.get("short_input") or {}
+    limit = short.get("max_input_tokens", 0)
+    if limit and input_tokens is not None and input_tokens <= limit and short.get("models"):
+        route.update(rule="short_input", models=short["models"])
+    return route
 
-    Raises:
-        Exception: すべてのモデルで失敗した場合
+
+def route_models(label: str = "") -> List[str]:
+    """label の呼び出しで使われうるモデルすべて（キャッシュの照合用）"""
+    cfg = get_claude_config().get("routes", {}).get(label) or {}
+    models = list(cfg.get("models") or get_available_models())
+    models += [m for m in (cfg.get("short_input") or {}).get("models", []) if m not in models]
+    return models
+
+
+def call_cost(model: str, tokens: Dict[str, int]) -> float:
+    """1回の呼び出しの料金（USD、claude.pricing にないモデルは0）"""
+    price = get_claude_config().get("pricing", {}).get(model)
+    if not price:
+        return 0.0
+    per_in = price.get("input", 0.0) / 1e6
+    return (tokens.get("input_tokens", 0) * per_in
+            + tokens.get("cache_write_tokens", 0) * per_in * 1.25
+            + tokens.get("cache_read_tokens", 0) * per_in * 0.1
+            + tokens.get("output_tokens", 0) * price.get("output", 0.0) / 1e6)
+
+
+# ===== 共有クライアント =====
+
+_clients: Dict[str, Anthropic] = {}
+_clients_lock = threading.Lock()
+_trace = threading.local()
+_latencies: List[Dict] = []
+_latencies_lock = threading.Lock()
+_health: Optional[ModelHealthStore] = None
+_scheduler: Optional[PriorityScheduler] = None
+_limiter: Optional[RateLimiter] = None
+
+
+def _on_trace(name: str, info: dict) -> None:
+    """httpcoreのトレースイベントから接続・送信・応答ヘッダ受信の時刻を記録"""
+    t = getattr(_trace, "current", None)
+    if t is None:
+        return
+    now = time.perf_counter()
+    if name.endswith(".started"):
+        t.setdefault(name[:-len(".started")], [now, None])
+    elif name.endswith(".complete") or name.endswith(".failed"):
+        key = name.rsplit(".", 1)[0]
+        if key in t:
+            t[key][1] = now
+
+
+def _on_request(request) -> None:
+    _trace.current = {}
+    request.extensions["trace"] = _on_trace
+
+
+def _span(t: dict, *keys: str) -> float:
+    return sum(t[k][1] - t[k][0] for k in keys if k in t and t[k][1] is not None)
+
+
+def _on_response(response) -> None:
     """
-    models = get_available_models()
+    直前のリクエストの接続時間とサーバー時間を計算
 
-    if max_tokens is None:
-        max_tokens = get_max_tokens()
+    - connect: TCP接続 + TLSハンドシェイク（keep-aliveで再利用した場合は0）
+    - server: リクエスト送信完了から応答ヘッダ受信まで（サーバー側の処理時間）
+    """
+    t = getattr(_trace, "current", None) or {}
+    connect = _span(t, "connection.connect_tcp", "connection.start_tls")
+    server = 0.0
+    for proto in ("http11", "http2"):
+        sent = t.get(f"{proto}.send_request_body") or t.get(f"{proto}.send_request_headers")
+        recv = t.get(f"{proto}.receive_response_headers")
+        if sent and recv and sent[1] is not None and recv[1] is not None:
+            server = recv[1] - sent[1]
+    _trace.last = {"connect": connect, "server": server, "reused": "connection.connect_tcp" not in t}
+    _trace.current = None
+    headers = getattr(response, "headers", None)
+    if headers is not None:
+        get_rate_limiter().update_from_headers(headers)
 
-    if temperature is None:
-        temperature = get_temperature()
 
+def _build_client(api_key: str) -> Anthropic:
+    """接続プールの上限・keep-alive・トレース用フックを設定したクライアントを作成"""
+    import httpx
+
+    http = get_http_config()
+    limits = httpx.Limits(
+        max_connections=http.get("max_connections", 20),
+        max_keepalive_connections=http.get("max_keepalive_connections", 10),
+        keepalive_expiry=http.get("keepalive_expiry", 60),
+    )
+    timeout = httpx.Timeout(http.get("timeout", 120), connect=http.get("connect_timeout", 10))
+    http_client = httpx.Client(
+        limits=limits,
+        timeout=timeout,
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+    # 再試行は call_with_rate_limit で行うため、SDK側の自動再試行は無効にする
+    return Anthropic(api_key=api_key, http_client=http_client, timeout=timeout, max_retries=0)
+
+
+def get_client(api_key: str = None) -> Anthropic:
+    """
+    プロセス全体で共有するAnthropicクライアントを取得（初回呼び出し時に作成）
+
+    Args:
+        api_key: APIキー（Noneの場合は .env または環境変数 ANTHROPIC_API_KEY）
+    """
+    if api_key is None:
+        api_key = dotenv_values(BASE / ".env").get("ANTHROPIC_API_KEY") or os.environ.get("ANTHROPIC_API_KEY")
+    if not api_key:
+        raise SystemExit("ANTHROPIC_API_KEY が .env にありません。")
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = _clients[api_key] = _build_client(api_key)
+        return client
+
+
+def last_call_timing() -> Optional[Dict]:
+    """このスレッドで直前に完了したHTTPリクエストの {"connect", "server", "reused"}"""
+    return getattr(_trace, "last", None)
+
+
+def cacheable_system(*blocks: str) -> List[Dict]:
+    """
+    固定の指示文をキャッシュ対象のsystemブロックにする
+
+    最後のブロックに cache_control を付けるため、それまでの内容（ブロックの並び順どおり）が
+    まとめてキャッシュされる。可変データはsystemではなくuserメッセージに置くこと。
+    """
+    system = [{"type": "text", "text": b} for b in blocks if b]
+    if system:
+        system[-1]["cache_control"] = {"type": "ephemeral"}
+    return system
+
+
+def _usage_tokens(usage) -> Dict[str, int]:
+    """レスポンスのusageから入出力・キャッシュ書き込み/読み込みトークン数を取り出す"""
+    get = lambda k: int(getattr(usage, k, 0) or 0)
+    return {
+        "input_tokens": get("input_tokens"),
+        "output_tokens": get("output_tokens"),
+        "cache_write_tokens": get("cache_creation_input_tokens"),
+        "cache_read_tokens": get("cache_read_input_tokens"),
+    }
+
+
+def record_latency(model: str, total: float, label: str = "", usage=None, ttft: float = None,
+                   rule: str = "default") -> Dict:
+    """呼び出し1件のレイテンシ（合計・接続・サーバー）・トークン数・料金・振り分けルールを記録"""
+    timing = last_call_timing() or {}
+    _trace.last = None
+    tokens = _usage_tokens(usage)
+    rec = {
+        "label": label,
+        "model": model,
+        "rule": rule,
+        "total": total,
+        "connect": timing.get("connect", 0.0),
+        "server": timing.get("server", 0.0),
+        "reused": timing.get("reused", False),
+        "ttft": ttft,
+        **tokens,
+        "cost": call_cost(model, tokens),
+    }
+    with _latencies_lock:
+        _latencies.append(rec)
+    return rec
+
+
+def latency_records() -> List[Dict]:
+    with _latencies_lock:
+        return list(_latencies)
+
+
+def print_latency_summary() -> None:
+    """記録したレイテンシとトークン使用量（キャッシュ読み書きを含む）、モデル稼働状況の集計を表示"""
+    if _health is not None:
+        for line in _health.summary_lines():
+            print(line)
+    if _scheduler is not None:
+        for line in _scheduler.summary_lines():
+            print(line)
+    recs = latency_records()
+    if not recs:
+        return
+    n = len(recs)
+    reused = sum(1 for r in recs if r["reused"])
+    avg = lambda k: sum(r[k] for r in recs) / n
+    print(f"[API] {n}回呼び出し: 平均 {avg('total'):.2f}秒"
+          f"（接続 {avg('connect'):.2f}秒 / サーバー {avg('server'):.2f}秒）、接続再利用 {reused}/{n}回")
+    total = lambda k: sum(r[k] for r in recs)
+    cached_in = total("cache_write_tokens") + total("cache_read_tokens")
+    all_in = total("input_tokens") + cached_in
+    if all_in:
+        print(f"[API] 入力 {all_in}トークン（キャッシュ読み込み {total('cache_read_tokens')} / "
+              f"書き込み {total('cache_write_tokens')} / 通常 {total('input_tokens')}）、出力 {total('output_tokens')}トークン")
+    for s in usage_by_label(recs):
+        print(f"[API] {s['label'] or '(未分類)'}: {s['calls']}回、平均 {s['avg_seconds']:.2f}秒、"
+              f"出力 {s['output_tokens']}トークン、${s['cost']:.4f}（{', '.join(f'{m} {c}回' for m, c in s['models'].items())}）")
+    if total("cost"):
+        print(f"[API] 合計 ${total('cost'):.4f}")
+
+
+def usage_by_label(recs: List[Dict] = None) -> List[Dict]:
+    """呼び出し種別ごとの回数・平均レイテンシ・トークン数・料金・モデル/振り分けルール別の回数"""
+    recs = latency_records() if recs is None else recs
+    summary = {}
+    for r in recs:
+        s = summary.setdefault(r["label"], {"label": r["label"], "calls": 0, "seconds": 0.0, "input_tokens": 0,
+                                            "output_tokens": 0, "cost": 0.0, "models": {}, "rules": {}})
+        s["calls"] += 1
+        s["seconds"] += r["total"]
+        s["input_tokens"] += r["input_tokens"] + r["cache_write_tokens"] + r["cache_read_tokens"]
+        s["output_tokens"] += r["output_tokens"]
+        s["cost"] += r.get("cost", 0.0)
+        s["models"][r["model"]] = s["models"].get(r["model"], 0) + 1
+        rule = r.get("rule", "default")
+        s["rules"][rule] = s["rules"].get(rule, 0) + 1
+    for s in summary.values():
+        s["avg_seconds"] = s["seconds"] / s["calls"]
+    return sorted(summary.values(), key=lambda s: s["label"])
+
+
+def log_usage_summary(path: Path = USAGE_LOG_PATH) -> None:
+    """今回の実行の種別ごとの集計を state/llm_usage.jsonl に追記（振り分け設定の調整用）"""
+    summary = usage_by_label()
+    if not summary:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"ts": time.time(), "labels": summary}, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[警告] API使用量の記録に失敗: {e}")
+
+
+def get_scheduler_config():
+    """config.yamlから優先度付きレーンの設定を取得"""
+    return get_claude_config().get("scheduler", {})
+
+
+def get_scheduler() -> PriorityScheduler:
+    """プロセス全体で共有する優先度付きレーン"""
+    global _scheduler
+    with _clients_lock:
+        if _scheduler is None:
+            cfg = get_scheduler_config()
+            _scheduler = PriorityScheduler(cfg.get("lanes", {}), max_concurrency=cfg.get("max_concurrency", 6))
+        return _scheduler
+
+
+def lane_for(label: str) -> str:
+    """呼び出し種別（label）のレーン名（どのレーンにも属さなければ "default"）"""
+    for lane, cfg in get_scheduler_config().get("lanes", {}).items():
+        if label in (cfg or {}).get("labels", []):
+            return lane
+    return "default"
+
+
+def get_rate_limit_config():
+    """config.yamlからレート制限・再試行の設定を取得"""
+    return get_claude_config().get("rate_limit", {})
+
+
+def get_rate_limiter() -> RateLimiter:
+    """プロセス全体で共有するレート制限（初期値は設定ファイル、以降はレスポンスヘッダで更新）"""
+    global _limiter
+    with _clients_lock:
+        if _limiter is None:
+            cfg = get_rate_limit_config()
+            _limiter = RateLimiter(
+                requests_per_minute=cfg.get("requests_per_minute", 50),
+                input_tokens_per_minute=cfg.get("input_tokens_per_minute", 30000),
+                output_tokens_per_minute=cfg.get("output_tokens_per_minute", 8000),
+            )
+        return _limiter
+
+
+def estimate_input_tokens(system, messages: list) -> int:
+    """入力トークン数の概算（prompt_budget.estimate_tokens で文字種ごとに数える）"""
+    def text_of(x):
+        if isinstance(x, str):
+            return x
+        if isinstance(x, dict):
+            return text_of(x.get("text") or x.get("content") or "")
+        if isinstance(x, list):
+            return "".join(text_of(i) for i in x)
+        return ""
+    return estimate_tokens(text_of(system)) + estimate_tokens(text_of(messages)) + 10
+
+
+def call_with_rate_limit(fn: Callable[[], object], input_tokens: int, output_tokens: int,
+                         usage_of: Callable[[object], object] = lambda r: getattr(r, "usage", None),
+                         lane: str = "default", deadline: float = None):
+    """
+    共有のレート制限を通してAPIを呼び出す
+
+    - レーン（lane）の実行枠と見積もりトークン数を優先度順に確保してから呼び出す
+      （deadline: time.monotonic() の期限。過ぎたら llm_scheduler.DeadlineExceeded）。
+      トークンの補充待ち・再試行の待機中は枠を持たない
+    - 確保した見積もりトークン数は応答の usage で精算
+    - 429/529 は retry-after（なければジッター付き指数バックオフ）の間、全呼び出しを一時停止して再試行
+    - 5xx・接続エラーはこの呼び出しだけ待って再試行（タイムアウトは再試行しない）
+
+    Args:
+        fn: API呼び出し（引数なし）
+        input_tokens: 入力トークン数の見積もり
+        output_tokens: 出力トークン数の見積もり（通常は max_tokens）
+        usage_of: 結果から usage を取り出す関数
+    """
+    limiter = get_rate_limiter()
+    cfg = get_rate_limit_config()
+    max_retries = cfg.get("max_retries", 4)
+    base_delay = cfg.get("base_delay", 1.0)
+    max_delay = cfg.get("max_delay", 60.0)
+
+    scheduler = get_scheduler()
+    for attempt in range(max_retries + 1):
+        try:
+            with scheduler.slot(lane, deadline, limiter, input_tokens, output_tokens):
+                result = fn()
+        except Exception as e:
+            if not is_retryable(e) or attempt >= max_retries:
+                raise
+            wait = retry_after_seconds(e)
+            if wait is None:
+                wait = backoff_delay(attempt, base_delay, max_delay)
+            wait = min(wait, max_delay)
+            status = getattr(e, "status_code", "") or type(e).__name__
+            if is_rate_limited(e):
+                print(f"[レート制限] {status} を受信。{wait:.1f}秒待機して再試行します（{attempt + 1}/{max_retries}）")
+                limiter.pause(wait)
+            else:
+                print(f"[再試行] {status}。{wait:.1f}秒後に再試行します（{attempt + 1}/{max_retries}）")
+                time.sleep(wait)
+            continue
+        usage = usage_of(result)
+        if usage is not None:
+            tokens = _usage_tokens(usage)
+            used_in = tokens["input_tokens"] + tokens["cache_write_tokens"]
+            limiter.settle(input_tokens, output_tokens, used_in, tokens["output_tokens"])
+        return result
+
+
+def get_model_health() -> ModelHealthStore:
+    """プロセス全体で共有するモデル稼働状況（初回呼び出し時に state/ から読み込み）"""
+    global _health
+    with _clients_lock:
+        if _health is None:
+            cfg = get_claude_config().get("health", {})
+            path = os.environ.get(HEALTH_PATH_ENV, HEALTH_PATH)
+            _health = ModelHealthStore(
+                path or None,
+                not_found_cooldown=cfg.get("not_found_cooldown_hours", 168) * 3600,
+                error_threshold=cfg.get("error_threshold", 3),
+                error_cooldown=cfg.get("error_cooldown_seconds", 600),
+                prefer_fastest=cfg.get("prefer_fastest", True),
+            )
+            atexit.register(_health.save)
+        return _health
+
+
+def _is_not_found(e: Exception) -> bool:
+    return isinstance(e, NotFoundError) or getattr(e, "status_code", None) == 404
+
+
+def _run_with_fallback(call: Callable[[str], object], label: str = "",
+                       measured: Callable[[object], bool] = lambda result: True, models: List[str] = None):
+    """
+    稼働状況に基づく順でモデルを試し、最初に成功した call(model) の結果を返す
+
+    - 404 / not_found: 記録して次のモデルへ
+    - その他のHTTPエラー: 5xx（529を除く）は記録した上で再送出
+    - タイムアウト・接続エラー: 記録して次のモデルへ
+    - それ以外の例外（プログラムの誤りなど）はモデルの不調ではないので記録せずそのまま送出
+    成功時のレイテンシは label ごとに記録する（measured(result) が偽なら記録しない）。
+    models を省略した場合は claude.models の順。
+    """
+    health = get_model_health()
     last_error = None
 
-    for model in models:
+    for model in health.order(models or get_available_models(), label):
+        start = time.perf_counter()
         try:
-            kwargs = {
-                "model": model,
-                "max_tokens": max_tokens,
-                "temperature": temperature,
-                "system": system,
-                "messages": messages
-            }
-            if timeout is not None:
-                kwargs["timeout"] = timeout
-
-            return client.messages.create(**kwargs)
-        except APIError as e:
+            result = call(model)
+        except APIStatusError as e:
             # 404エラー（モデルが存在しない）の場合は次のモデルを試行
-            if "404" in str(e) or "not_found" in str(e).lower():
+            if _is_not_found(e):
                 print(f"モデル {model} が利用できません。次のモデルを試行します...")
+                health.record_not_found(model, str(e))
                 last_error = e
                 continue
-            # その他のエラーは再送出
+            # その他のエラー（再試行しても回復しなかったもの）は再送出
+            status = getattr(e, "status_code", None) or 0
+            if status >= 500 and status != 529:
+                health.record_error(model, str(e))
             raise
-        except Exception as e:
+        except APIConnectionError as e:
             last_error = e
+            health.record_error(model, str(e))
             print(f"モデル {model} でエラーが発生: {str(e)[:100]}")
             continue
+        elapsed = time.perf_counter() - start
+        health.record_success(model, elapsed if measured(result) else None, label)
+        return result
 
     # すべてのモデルで失敗した場合
     raise Exception(f"すべてのモデルで失敗しました。最後のエラー: {last_error}")
 
 
+def _routed(label: str, messages: list) -> Dict:
+    """label と入力（systemを除く）の長さから振り分け先を決める（既定以外のルールなら表示）"""
+    route = get_route(label, estimate_input_tokens("", messages))
+    if route["rule"] != "default":
+        print(f"[振り分け] {label}: {route['rule']} → {route['models'][0]}")
+    return route
+
+
+def create_message_with_fallback(client: Optional[Anthropic], system, messages: list,
+                                  max_tokens: int = None, temperature: float = None, timeout: float = None,
+                                  label: str = "", deadline: float = None, **extra):
+    """
+    フォールバック機能付きでClaudeメッセージを作成
+
+    モデルは呼び出し種別ごとの設定（claude.routes。なければ claude.models）の順を基本に、
+    利用できないモデルを除き、速い順に試す（model_health.py）。
+
+    Args:
+        client: Anthropicクライアント（Noneの場合は共有クライアント）
+        system: システムプロンプト（文字列、または cacheable_system() のブロック列）
+        messages: メッセージリスト
+        max_tokens: 最大トークン数（Noneの場合は呼び出し種別の設定から取得）
+        temperature: 温度パラメータ（Noneの場合は呼び出し種別の設定から取得）
+        timeout: タイムアウト秒数（Noneの場合はデフォルト値を使用）
+        label: 呼び出し種別（scoring / generation など）。レイテンシはこの単位で比べ、
+               モデルの振り分け（claude.routes）と優先度付きレーン（claude.scheduler）もこれで決まる
+        deadline: 実行枠を待つ期限（time.monotonic() の時刻。Noneならレーンの queue_timeout）
+        extra: そのままAPIに渡す引数（tools / tool_choice など）
+
+    Returns:
+        APIレスポンス
+
+    Raises:
+        Exception: すべてのモデルで失敗した場合
+    """
+    if client is None:
+        client = get_client()
+
+    route = _routed(label, messages)
+    if max_tokens is None:
+        max_tokens = route["max_tokens"]
+
+    if temperature is None:
+        temperature = route["temperature"]
+
+    def call(model):
+        kwargs = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system,
+            "messages": messages,
+            **extra
+        }
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        start = time.perf_counter()
+        response = call_with_rate_limit(lambda: client.messages.create(**kwargs), est_input, max_tokens,
+                                        lane=lane_for(label), deadline=deadline)
+        record_latency(model, time.perf_counter() - start, label, usage=getattr(response, "usage", None),
+                       rule=route["rule"])
+        return response
+
+    est_input = estimate_input_tokens(system, messages)
+    return _run_with_fallback(call, label, models=route["models"])
+
+
+def get_hedge_config():
+    """config.yamlからヘッジ（応答の遅いモデルと並行して次のモデルにも送る）の設定を取得"""
+    return get_claude_config().get("hedge", {})
+
+
+def hedge_delay(model: str, label: str) -> Optional[float]:
+    """
+    model の初回トークンまでの時間がこの秒数を超えたら次のモデルにも送る（ヘッジしない場合はNone）
+
+    claude.hedge.percentile パーセンタイル（計測件数が足りなければヘッジしない）と min_delay の大きい方。
+    """
+    cfg = get_hedge_config()
+    if not cfg.get("enabled", False) or label not in cfg.get("labels", ["generation"]):
+        return None
+    p = get_model_health().latency_percentile(model, f"{label}:ttft", cfg.get("percentile", 90))
+    return None if p is None else max(p, cfg.get("min_delay", 3.0))
+
+
+def stream_message_with_fallback(client: Optional[Anthropic], system, messages: list,
+                                 check: Callable[[str], Optional[str]] = None,
+                                 stop_sequences: List[str] = None,
+                                 max_tokens: int = None, temperature: float = None, timeout: float = None,
+                                 label: str = "",
+                                 new_check: Callable[[], Callable[[str], Optional[str]]] = None,
+                                 deadline: float = None) -> Dict:
+    """
+    フォールバック機能付きのストリーミング生成
+
+    受信するたびに check(受信済みテキスト全体) を呼び、中止理由（文字列）が返ったら
+    その場で接続を閉じて打ち切る（残りの出力トークンは生成・課金されない）。
+
+    ヘッジ（claude.hedge）が有効な場合、最初のモデルが過去の初回トークンまでの時間の
+    パーセンタイルを過ぎても出力を始めなければ、同じリクエストを次のモデルにも送り、
+    先に完了した方を採用してもう一方は打ち切る。
+
+    Args:
+        check: 逐次チェック関数（Noneの場合はチェックしない）
+        stop_sequences: 生成を止める文字列
+        new_check: 逐次チェック関数を作る関数。状態を持つチェック（IncrementalHtmlValidator など）は
+                   こちらで渡す（ヘッジで並行する呼び出しごとに別のチェックを使うため）
+        その他: create_message_with_fallback と同じ
+
+    Returns:
+        {
+            "text": 受信したテキスト,
+            "stop_reason": "end_turn" / "stop_sequence" / "max_tokens" / "aborted" など,
+            "abort_reason": 打ち切った理由（打ち切っていなければNone）,
+            "model": 使用したモデル,
+            "usage": トークン使用量（打ち切った場合はNone）
+        }
+
+    Raises:
+        Exception: すべてのモデルで失敗した場合
+    """
+    if client is None:
+        client = get_client()
+
+    route = _routed(label, messages)
+    if max_tokens is None:
+        max_tokens = route["max_tokens"]
+
+    if temperature is None:
+        temperature = route["temperature"]
+
+    def call(model, cancel: threading.Event = None, started: threading.Event = None):
+        kwargs = {
+            "model": model,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "system": system,
+            "messages": messages
+        }
+        if stop_sequences:
+            kwargs["stop_sequences"] = stop_sequences
+        if timeout is not None:
+            kwargs["timeout"] = timeout
+
+        def run():
+            text = ""
+            start = time.perf_counter()
+            ttft = None
+            checker = new_check() if new_check else check
+            with client.messages.stream(**kwargs) as stream:
+                for delta in stream.text_stream:
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                        if started is not None:
+                            started.set()
+                    text += delta
+                    if cancel is not None and cancel.is_set():
+                        reason = HEDGE_LOST
+                    else:
+                        reason = checker(text) if checker else None
+                    if reason:
+                        # withを抜けるとレスポンスが閉じられ、生成が止まる
+                        record_latency(model, time.perf_counter() - start, label, ttft=ttft, rule=route["rule"])
+                        return {"text": text, "stop_reason": "aborted", "abort_reason": reason,
+                                "model": model, "usage": None}
+                final = stream.get_final_message()
+            usage = getattr(final, "usage", None)
+            record_latency(model, time.perf_counter() - start, label, usage=usage, ttft=ttft, rule=route["rule"])
+            if ttft is not None:
+                get_model_health().record_sample(model, f"{label}:ttft", ttft)
+            return {"text": text, "stop_reason": getattr(final, "stop_reason", None), "abort_reason": None,
+                    "model": model, "usage": usage}
+
+        return call_with_rate_limit(run, est_input, max_tokens, usage_of=lambda r: r["usage"],
+                                    lane=lane_for(label), deadline=deadline)
+
+    est_input = estimate_input_tokens(system, messages)
+    # 途中で打ち切った呼び出しは所要時間が短く出るので、モデルの速さの比較には使わない
+    measured = lambda r: r["abort_reason"] is None
+    order = get_model_health().order(route["models"], label)
+    delay = hedge_delay(order[0], label) if len(order) > 1 else None
+    if delay is None:
+        return _run_with_fallback(call, label, measured=measured, models=order)
+    return _run_hedged(call, label, measured, order, delay)
+
+
+# ヘッジで負けた側の打ち切り理由
+HEDGE_LOST = "他のモデルの応答を採用"
+# 呼び出し側の都合（投機実行で他の候補が先に決まったなど）で打ち切る理由。
+# 逐次チェックがこれを返したら、ヘッジ中のもう一方も待たずに打ち切る
+CALLER_CANCELLED = "他の候補の処理で終了"
+
+
+def _run_hedged(call, label: str, measured, order: List[str], delay: float) -> Dict:
+    """
+    order[0] で開始し、delay 秒以内に出力が始まらなければ order[1] にも送る
+
+    先に完了した方を採用し、もう一方には打ち切りを指示する。逐次チェックで打ち切られた側は
+    失敗として扱い、もう一方の完了を待つ（ただし CALLER_CANCELLED はそのまま返す）。
+    両方とも打ち切られたら最初に打ち切られた結果を返し、両方とも例外なら残りのモデルで順に試す。
+    """
+    pool = ThreadPoolExecutor(max_workers=2)
+    legs = {}
+
+    def start_leg(model):
+        cancel, started = threading.Event(), threading.Event()
+        future = pool.submit(_run_with_fallback, lambda m: call(m, cancel, started), label, measured, [model])
+        legs[future] = (model, cancel, started)
+        return future, started
+
+    try:
+        primary, started = start_leg(order[0])
+        deadline = time.perf_counter() + delay
+        while not started.is_set() and not primary.done() and time.perf_counter() < deadline:
+            started.wait(min(0.05, max(0.0, deadline - time.perf_counter())))
+        if not started.is_set() and not primary.done():
+            print(f"[ヘッジ] {order[0]} が{delay:.1f}秒以内に応答しないため、{order[1]} にも送信します")
+            start_leg(order[1])
+
+        pending = set(legs)
+        last_error = None
+        aborted = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                try:
+                    result = f.result()
+                except Exception as e:
+                    last_error = e
+                    continue
+                if result["abort_reason"] == HEDGE_LOST:
+                    continue
+                if result["abort_reason"] not in (None, CALLER_CANCELLED):
+                    if pending:
+                        print(f"[ヘッジ] {result['model']} は打ち切り（{result['abort_reason']}）、"
+                              f"もう一方の応答を待ちます")
+                    aborted = aborted or result
+                    continue
+                for other, (model, cancel, _) in legs.items():
+                    if other is not f:
+                        cancel.set()
+                if len(legs) > 1:
+                    print(f"[ヘッジ] {result['model']} の応答を採用しました")
+                return result
+        if aborted is not None:
+            return aborted
+        rest = [m for m in order if m not in {model for model, _, _ in legs.values()}]
+        if not rest:
+            raise Exception(f"すべてのモデルで失敗しました。最後のエラー: {last_error}")
+        return _run_with_fallback(lambda m: call(m), label, measured=measured, models=rest)
+    finally:
+        pool.shutdown(wait=False)
+
+
 def get_primary_model():
     """プライマリモデル名を取得"""
     models = get_available_models()
@@ -1,16 +1,25 @@
 # -*- coding: utf-8 -*-
-import os, re, json, time, yaml, feedparser, math, hashlib
+import os, re, json, time, yaml, feedparser, hashlib, threading
 from pathlib import Path
 from urllib.parse import urlparse, urljoin
 from langdetect import detect, DetectorFactory
 from dotenv import dotenv_values
-from anthropic import Anthropic
 import requests
-from model_helper import create_message_with_fallback
+from model_helper import create_message_with_fallback, stream_message_with_fallback, cacheable_system, get_client, get_route, route_models, print_latency_summary, log_usage_summary, CALLER_CANCELLED
 from fact_checker import fact_check_article, print_fact_check_result, llm_fact_check_article, print_llm_fact_check_result
+from semantic_dedup import load_index
+from url_canon import UrlCanonicalizer, canonicalize_url
+from ranker import rank_candidates
+from speculation import speculative_results
+from stream_validator import IncrementalHtmlValidator, SOURCE_DIV_STOP
+from prompt_budget import fit_to_budget, output_max_tokens
+from article_cache import ArticleCache
+from article_repair import repair_messages, phase2_issues, record_attempt
+from check_report import format_stats
 from requests.auth import HTTPBasicAuth
 from difflib import SequenceMatcher
 from bs4 import BeautifulSoup
+from html import escape as html_escape
 
 DetectorFactory.seed = 0
 
@@ -35,6 +44,15 @@ def fetch_article_content(url: str, timeout: int = 15) -> str:
 
         soup = BeautifulSoup(response.text, 'html.parser')
 
+        # rel=canonical（なければリダイレクト後のURL）を記録し、次回以降の重複判定に使う
+        # （保存は main() の終了時にまとめて行う。ワーカースレッドからは保存しない）
+        try:
+            canonical = soup.find('link', rel='canonical')
+            href = canonical.get('href') if canonical else None
+            get_url_canonicalizer().remember_canonical(url, urljoin(response.url, href) if href else response.url)
+        except Exception as e:
+            print(f"[警告] rel=canonical の記録に失敗: {e}")
+
         # 不要な要素を削除
         for tag in soup(['script', 'style', 'nav', 'header', 'footer', 'aside', 'iframe', 'noscript']):
             tag.decompose()
@@ -66,9 +84,7 @@ def fetch_article_content(url: str, timeout: int = 15) -> str:
                 content = body.get_text(separator='\n', strip=True)
 
         if content:
-            # 長すぎる場合は切り詰め（トークン節約）
-            if len(content) > 8000:
-                content = content[:8000] + "..."
+            # 長さの調整はプロンプト組み立て時にトークン予算で行う（generation_prompt）
             return content
 
         return ""
@@ -84,6 +100,9 @@ POSTED_URLS_PATH = STATE_DIR/"posted_urls.json"
 DOMAIN_PATH      = STATE_DIR/"domain_last.json"
 FINGER_PATH      = STATE_DIR/"posted_fingerprints.json"
 IMG_HISTORY_PATH = STATE_DIR/"featured_image_history.json"
+SEMANTIC_INDEX_PATH = STATE_DIR/"semantic_index.npz"
+URL_CANON_CACHE_PATH = STATE_DIR/"url_canonical_cache.json"
+ARTICLE_CACHE_PATH = STATE_DIR/"article_cache.json"
 
 def load_json(p):
     if p.exists():
@@ -114,9 +133,48 @@ def save_posted_urls(s:set):
 def strip_html(s): return re.sub(r"<[^>]+>","", s or "").strip()
 
 def norm_url(u:str)->str:
-    u=(u or "").strip()
-    u=re.sub(r"#.*$","",u); u=re.sub(r"/+$","",u)
-    return u
+    return canonicalize_url(u)
+
+_url_canonicalizer=None
+_url_canonicalizer_lock=threading.Lock()
+
+def get_url_canonicalizer():
+    """リダイレクト解決キャッシュ付きのURL正規化器（プロセス内で共有）"""
+    global _url_canonicalizer
+    with _url_canonicalizer_lock:
+        if _url_canonicalizer is None:
+            uc=CFG.get("fetch",{}).get("url_canonical",{})
+            _url_canonicalizer=UrlCanonicalizer(
+                URL_CANON_CACHE_PATH,
+                resolve_redirects=uc.get("resolve_redirects",True),
+                ttl_days=uc.get("cache_ttl_days",30),
+                timeout=uc.get("timeout",5),
+            )
+        return _url_canonicalizer
+
+_article_cache=None
+
+def get_article_cache():
+    """合格済み記事のキャッシュ（プロセス内で共有、無効な場合はNone）"""
+    global _article_cache
+    ac=CFG.get("generate",{}).get("article_cache",{})
+    if not ac.get("enabled",True):
+        return None
+    if _article_cache is None:
+        _article_cache=ArticleCache(
+            ARTICLE_CACHE_PATH,
+            ttl_seconds=ac.get("ttl_hours",48)*3600,
+            max_entries=ac.get("max_entries",200),
+            max_publish_attempts=ac.get("max_publish_attempts",3),
+        )
+    return _article_cache
+
+def article_source_text(best, article_content):
+    """記事キャッシュのキーに使う元記事テキスト"""
+    return "\n".join([best.get("title",""), best.get("summary",""), article_content or ""])
+
+def article_url(best):
+    return best.get("canonical") or norm_url(best["link"])
 
 def guess_lang(t):
     t=(t or "").strip()
@@ -222,6 +280,41 @@ def is_near_duplicate(title:str, summary:str, fp_list:list, sha1_dup=True, simha
             continue
     return False
 
+def load_semantic_index(sel):
+    """投稿済み記事の意味的重複インデックスを読み込み、dup_window_daysより古い記事を削除"""
+    sem=sel.get("semantic_dedup",{})
+    index=load_index(SEMANTIC_INDEX_PATH, n_features=sem.get("n_features",4096))
+    index.evict(sel.get("dup_window_days",7))
+    return index
+
+def filter_semantic_duplicates(cands, sel):
+    """意味的に重複する候補（言い換え・翻訳記事）を除外"""
+    sem=sel.get("semantic_dedup",{})
+    if not sem.get("enabled",True) or not cands:
+        return cands
+    index=load_semantic_index(sel)
+    if len(index)==0:
+        return cands
+    dups=index.find_duplicates([(c["title"],c["summary"]) for c in cands],
+                               threshold=sem.get("threshold",0.4),
+                               cross_lang_threshold=sem.get("cross_lang_threshold",0.45),
+                               cross_lang_min_shared=sem.get("cross_lang_min_shared",1))
+    kept=[]
+    for c,dup in zip(cands,dups):
+        if dup:
+            print(f"[重複] 意味的に類似（{dup[0]:.2f}）: {c['title'][:40]} ≒ {dup[1][:40]}")
+            continue
+        kept.append(c)
+    return kept
+
+def record_semantic_index(title, summary, sel):
+    """投稿した記事を意味的重複インデックスに追加"""
+    if not sel.get("semantic_dedup",{}).get("enabled",True):
+        return
+    index=load_semantic_index(sel)
+    index.add(title, summary)
+    index.save(SEMANTIC_INDEX_PATH)
+
 def safe_html_cleanup(html):
     html=re.sub(r"<!--.*?-->", "", html, flags=re.S)
     html=re.sub(r"</?(script|style|section|table|iframe|form|noscript)\b[^>]*>.*?</\1>", "", html, flags=re.I|re.S)
@@ -246,45 +339,6 @@ def entry_published_ts(e):
     except: pass
     return None
 
-def score_candidate(c, sel, client):
-    W = sel["weights"]
-    now = time.time()
-    freshness=0.0
-    if c.get("ts"):
-        hours=max(1,(now-c["ts"])/3600.0)
-        freshness=max(0.0,min(1.0, math.exp(-hours/72.0)))
-    lang_score = sel.get("ja_priority",1.0) if c["lang"].startswith("ja") else sel.get("en_priority",0.8)
-    src_w = sel.get("source_weights",{}).get(c["domain"], 1.0)
-    kw_score = 0.0
-    title_lower=c["title"]
-    for kw in sel.get("keyword_boosts",[]):
-        if kw.lower() in title_lower.lower():
-            kw_score += 0.05
-    kw_score=min(1.0, kw_score)
-    prompt = f"""次のニュースが、LLM/生成AI領域で日本のビジネス読者にとって「話題になる/価値が高い」かを0.0〜1.0で数値のみ返答。
-特に公式発表・カンファレンス・DevDay・API更新・新機能リリースは高評価。説明不要。
-タイトル: {c["title"]}
-要約: {c["summary"]}"""
-    try:
-        msg = create_message_with_fallback(
-            client,
-            system="数値評価器。0.0〜1.0の実数のみを返す。",
-            messages=[{"role":"user","content":prompt}],
-            max_tokens=20,
-            temperature=0.0
-        )
-        txt="".join([p.text for p in msg.content if p.type=="text"]).strip()
-        m=re.findall(r"[0-1](?:\.\d+)?", txt)
-        vir=float(m[0]) if m else 0.5
-    except Exception:
-        vir=0.5
-    score = (W["freshness"]*freshness +
-             W["source"]*( (src_w-0.8)/0.4*0.5 ) +
-             W["language"]*lang_score +
-             W["keyword"]*kw_score +
-             W["llm_virality"]*vir)
-    return max(0.0, min(1.0, score))
-
 def pick_candidates(top_n=5):
     """
     記事候補を取得し、スコアの高い順にtop_n件を返す
@@ -304,7 +358,9 @@ def pick_candidates(top_n=5):
     scan_per_feed=sel.get("max_scan_per_feed",10)
     cooldown=sel.get("domain_cooldown_days",1)
     excluded_keywords=sel.get("excluded_keywords",[])
-    client=Anthropic(api_key=ENV.get("ANTHROPIC_API_KEY"))
+    client=get_client(ENV.get("ANTHROPIC_API_KEY"))
+    canon=get_url_canonicalizer()
+    seen=set()
     cands=[]
     for f in feeds:
         url=f.get("url");
@@ -317,6 +373,11 @@ def pick_candidates(top_n=5):
             nlink=norm_url(link)
             if nlink in posted_urls:
                 continue
+            # リダイレクタ・rel=canonical を解決した正規URLで再判定（同一記事の重複も除外）
+            clink=canon.canonical(link)
+            if clink in posted_urls or clink in seen:
+                continue
+            seen.add(clink)
             summary=strip_html(getattr(e,"summary","") or getattr(e,"description",""))
 
             # セール・商業記事の除外チェック
@@ -331,43 +392,29 @@ def pick_candidates(top_n=5):
 
             if is_near_duplicate(title, summary, fp_list, sha1_dup=True, simhash_thresh=3, title_sim=0.92):
                 continue
-            dom=urlparse(link).netloc
+            dom=urlparse(clink).netloc
             if not domain_ok(dom, domain_last, cooldown):
                 continue
             ts=entry_published_ts(e)
             lang=guess_lang((title+" "+summary)[:1000])
-            cands.append({"title":title,"link":link,"summary":summary,"domain":dom,"ts":ts,"lang":lang,"source":d.feed.get("title",url)})
+            cands.append({"title":title,"link":link,"canonical":clink,"summary":summary,"domain":dom,"ts":ts,"lang":lang,"source":d.feed.get("title",url)})
             if len(cands)>=cand_limit: break
         if len(cands)>=cand_limit: break
+    canon.save()
+    cands=filter_semantic_duplicates(cands, sel)
     if not cands: return [], posted_urls, domain_last, fp_list
-    scored=[]
-    for c in cands:
-        s=score_candidate(c, sel, client)
-        scored.append((s,c))
-    scored.sort(key=lambda x: x[0], reverse=True)
+    scored=rank_candidates(cands, sel, client, top_k=top_n)
     # 上位top_n件を返す
     top_candidates = [item[1] for item in scored[:top_n]]
     return top_candidates, posted_urls, domain_last, fp_list
 
-def main():
-    WP_URL=(ENV.get("WP_URL","") or "").rstrip("/")+"/"
-    WP_USER=(ENV.get("WP_USER","") or "")
-    WP_PASS=(ENV.get("WP_APP_PASSWORD","") or "")
-    if not (WP_URL and WP_USER and WP_PASS):
-        raise SystemExit("WP接続情報不足")
-    wp_cfg=(CFG.get("wordpress") or {})
-    cats=wp_cfg.get("category_ids") or []
-    status=wp_cfg.get("status","publish")
-
-    # 複数の候補を取得（上位5件）
-    candidates, posted_urls, domain_last, fp_list = pick_candidates(top_n=5)
-    if not candidates:
-        print("未投稿の候補が見つかりません。終了。"); return
-
-    print(f"\n{len(candidates)}件の候補記事を取得しました。")
+# 記事生成のシステムプロンプトと記事構成テンプレート（固定。prompt caching の対象）
+# 元記事情報など可変のデータはuserメッセージの末尾に置く
+# 生成プロンプト（GENERATION_SYSTEM / GENERATION_TEMPLATE / generation_prompt）を変更したら上げる
+# （記事キャッシュの古いエントリを無効化するため）
+GENERATION_PROMPT_VERSION = 1
 
-    client=Anthropic(api_key=ENV.get("ANTHROPIC_API_KEY"))
-    system="""あなたは技術ニュースライターです。
+GENERATION_SYSTEM="""あなたは技術ニュースライターです。
 
 【記事作成の原則】
 - ニュース記事として事実を正確に伝える
@@ -386,21 +433,7 @@ def main():
 - コードブロックマーカー（```html など）は絶対に出力しない
 - HTMLタグの外にテキストを書かない"""
 
-    # 候補を順に試す
-    for idx, best in enumerate(candidates, 1):
-        print(f"\n{'='*70}")
-        print(f"候補 {idx}/{len(candidates)}: {best['title'][:60]}...")
-        print(f"{'='*70}")
-
-        # 元記事の本文を取得
-        print("\n[元記事を取得中...]")
-        article_content = fetch_article_content(best['link'])
-        if article_content:
-            print(f"✅ 元記事を取得しました（{len(article_content)}文字）")
-        else:
-            print("⚠️ 元記事の取得に失敗。RSS要約のみで生成します。")
-
-        user=f"""以下の元記事から、わかりやすい日本語ニュース記事を作成してください。
+GENERATION_TEMPLATE="""以下の構成で記事を作成してください。
 
 【記事構成】
 
@@ -469,7 +502,29 @@ def main():
 - 逆ピラミッド構造：重要な情報を最初に
 - 箇条書きは必要最小限、基本は文章で説明
 - 「できること・できないこと」「影響」は文章形式
-- 専門用語には必ず説明と具体例をつける
+- 専門用語には必ず説明と具体例をつける"""
+
+
+def budget_cfg():
+    return CFG.get("generate",{}).get("budget",{})
+
+
+def generation_max_tokens():
+    """記事の目標文字数（generate.body_target_chars）から決めた生成の max_tokens"""
+    g=CFG.get("generate",{})
+    return output_max_tokens(g.get("body_target_chars",2000), budget_cfg().get("output_tokens_per_char",3.0),
+                             limit=get_route("generation")["max_tokens"])
+
+
+def generation_prompt(best, article_content):
+    """
+    記事生成のuserメッセージ（元記事情報のみ。固定の指示はsystem側）
+
+    元記事本文は generate.budget.source_tokens 以内に段落・文の区切りで切り詰める。
+    """
+    article_content=fit_to_budget(article_content, budget_cfg().get("source_tokens",4000))
+    return f"""以下の元記事から、わかりやすい日本語ニュース記事を作成してください。
+記事構成と重要な指示はシステムプロンプトに従ってください。
 
 元記事情報：
 - タイトル: {best['title']}
@@ -484,78 +539,342 @@ def main():
 
 HTMLのみで出力してください。Markdown禁止。コードブロックマーカーは使用禁止。""".strip()
 
-        print("\n[記事生成中...]")
-        msg=create_message_with_fallback(client, system=system, messages=[{"role":"user","content":user}])
+
+def source_div(best):
+    """出典の<div>（生成させずに元記事情報から組み立てる）"""
+    return f'{SOURCE_DIV_STOP}<strong>出典：</strong>{html_escape(best["title"])}（{html_escape(best["domain"])}）</div>'
+
+
+def generate_article_html(best, messages, client, system, cancel, tag, label="generation", deadline=None):
+    """
+    記事HTMLを生成（messages は生成依頼、または article_repair.repair_messages の修正依頼）
+
+    ストリーミング有効時は受信しながら検査し、コードブロックマーカー・使用禁止タグ・
+    <h1>の欠落を見つけた時点で打ち切る。出典<div>の手前で生成を止め、出典は手元で付け足す。
+    stop_reason が max_tokens の場合は途中で切れた記事として破棄する。
+
+    Returns:
+        (HTML, 使用したモデル, 出力トークン数)。破棄した場合のHTML・モデルはNone
+    """
+    stream_cfg=CFG.get("generate",{}).get("streaming",{})
+    if stream_cfg.get("enabled", True):
+        def new_check():
+            validator=IncrementalHtmlValidator(stream_cfg.get("h1_within_chars", 800))
+            return lambda text: CALLER_CANCELLED if cancel.is_set() else validator.check(text)
+        result=stream_message_with_fallback(client, system=system, messages=messages,
+                                            new_check=new_check, stop_sequences=[SOURCE_DIV_STOP],
+                                            max_tokens=generation_max_tokens(), label=label, deadline=deadline)
+        if result["abort_reason"]:
+            print(f"{tag} ❌ 生成を{len(result['text'])}文字で打ち切り: {result['abort_reason']}")
+            return None, None, 0
+        html, stop_reason, model=result["text"].strip(), result["stop_reason"], result["model"]
+        usage=result["usage"]
+    else:
+        msg=create_message_with_fallback(client, system=system, messages=messages,
+                                         max_tokens=generation_max_tokens(), label=label, deadline=deadline)
         html="".join([p.text for p in msg.content if p.type=="text"]).strip()
+        stop_reason=getattr(msg, "stop_reason", None)
+        model=getattr(msg, "model", None)
+        usage=getattr(msg, "usage", None)
+    output_tokens=getattr(usage, "output_tokens", 0) or 0
+
+    if not html:
+        print(f"{tag} ❌ 生成が空。次の候補へ。")
+        return None, None, output_tokens
+    if stop_reason=="max_tokens":
+        print(f"{tag} ❌ 最大トークン数に達し、記事が途中で切れています（{len(html)}文字）。次の候補へ。")
+        return None, None, output_tokens
+    if SOURCE_DIV_STOP not in html:
+        html=html.rstrip()+"\n\n"+source_div(best)
+    return html, model, output_tokens
+
+
+_print_lock = threading.Lock()
+
+
+def generate_checked_article(idx, best, client, system, cancel, total, deadline=None):
+    """
+    1件の候補について 元記事取得 → 生成 → Phase 1 → Phase 2 を実行
 
+    deadline（time.monotonic() の時刻）を過ぎてもAPIの実行枠が空かなければ、この候補は諦める。
+
+    Returns:
+        両方のファクトチェックに合格したHTML（不合格・中止の場合はNone）
+    """
+    tag=f"[候補 {idx + 1}/{total}]"
+    print(f"\n{tag} {best['title'][:60]}...")
+
+    # 元記事の本文を取得
+    article_content = fetch_article_content(best['link'])
+    if article_content:
+        print(f"{tag} ✅ 元記事を取得しました（{len(article_content)}文字）")
+    else:
+        print(f"{tag} ⚠️ 元記事の取得に失敗。RSS要約のみで生成します。")
+    if cancel.is_set():
+        return None
+
+    # 同じ元記事・同じプロンプトで合格済みの記事があれば、生成・チェックを省略
+    cache=get_article_cache()
+    source_text=article_source_text(best, article_content)
+    if cache:
+        hit=cache.lookup(article_url(best), source_text, GENERATION_PROMPT_VERSION, route_models("generation"))
+        if hit:
+            print(f"{tag} ✅ 合格済みの記事をキャッシュから再利用します（{hit['model']}、"
+                  f"Phase 2 スコア: {hit['phase2'].get('score')}/100）")
+            return hit["html"]
+
+    # 生成し、不合格なら指摘を返して修正（generate.repair.max_attempts 回まで）
+    repair_cfg=CFG.get("generate",{}).get("repair",{})
+    max_repairs=repair_cfg.get("max_attempts",1) if repair_cfg.get("enabled",True) else 0
+    user=generation_prompt(best, article_content)
+    messages=[{"role":"user","content":user}]
+    kind, label="generate", "generation"
+    for attempt in range(max_repairs+1):
+        start=time.perf_counter()
+        print(f"{tag} [{'記事生成中' if kind=='generate' else f'記事を修正中（{attempt}/{max_repairs}回目）'}...]")
+        html, model, output_tokens=generate_article_html(best, messages, client, system, cancel, tag,
+                                                               label=label, deadline=deadline)
+        if cancel.is_set():
+            return None
         if not html:
-            print("❌ 生成が空。次の候補へ。")
-            continue
+            record_attempt(kind, False, "generate", time.perf_counter()-start, output_tokens)
+            return None
+        failed, issues, fact_check_result, llm_result=check_article(best, html, client, cancel, tag, deadline)
+        if cancel.is_set():
+            return None
+        record_attempt(kind, failed is None, failed, time.perf_counter()-start, output_tokens,
+                       legacy_date_rejected=bool(fact_check_result["details"].get("legacy_date_issues")))
+        if failed is None:
+            break
+        if attempt>=max_repairs or not issues:
+            print(f"{tag} ❌ {failed} 不合格。この記事を破棄して次の候補へ。\n")
+            return None
+        print(f"{tag} 🔧 {failed} の指摘（{len(issues)}件）を返して修正を依頼します")
+        draft=html.split(SOURCE_DIV_STOP)[0].rstrip()
+        messages=repair_messages(user, draft, issues)
+        kind, label="repair", "repair"
+
+    if cache and model:
+        # 保存するだけでは投稿待ちにならない（投稿に失敗した時点で record_publish_failure により投稿待ちになる）
+        cache.store(article_url(best), source_text, GENERATION_PROMPT_VERSION, model, best, html,
+                    fact_check_result, llm_result)
+    return html
 
-        # Phase 1: ルールベースのファクトチェック
-        print("\n[Phase 1: ルールベースのファクトチェック中...]")
-        fact_check_result = fact_check_article(best, html)
+
+def check_article(best, html, client, cancel, tag, deadline=None):
+    """
+    Phase 1 → Phase 2 のファクトチェック
+
+    Returns:
+        (不合格の段階 "Phase 1" / "Phase 2"（合格ならNone）, 修正に使う指摘, Phase 1 の結果, Phase 2 の結果)
+        Phase 2 がAPIエラーなどで判定できなかった場合、指摘は空（修正しても意味がないため）
+    """
+    # Phase 1: ルールベースのファクトチェック
+    fact_check_result = fact_check_article(best, html)
+    with _print_lock:
+        print(f"\n{tag} [Phase 1: ルールベースのファクトチェック]")
         print_fact_check_result(fact_check_result)
+    if not fact_check_result["passed"]:
+        return "Phase 1", fact_check_result["issues"], fact_check_result, None
+    print(f"{tag} ✅ Phase 1 合格！")
+    if cancel.is_set():
+        return "Phase 1", [], fact_check_result, None
+
+    # Phase 2: LLMベースのファクトチェック
+    print(f"{tag} [Phase 2: LLMベースのファクトチェック中...]")
+    llm_result = llm_fact_check_article(best, html, client,
+                                        max_article_tokens=budget_cfg().get("check_article_tokens",5000),
+                                        deadline=deadline)
+    with _print_lock:
+        print(f"\n{tag} [Phase 2: LLMベースのファクトチェック]")
+        print_llm_fact_check_result(llm_result)
+    if not llm_result["passed"]:
+        print(f"{tag} ❌ Phase 2 不合格（スコア: {llm_result['score']}/100）")
+        issues=[] if llm_result.get("error") else phase2_issues(llm_result)
+        return "Phase 2", issues, fact_check_result, llm_result
+
+    print(f"{tag} ✅ Phase 2 合格（スコア: {llm_result['score']}/100）！")
+    return None, [], fact_check_result, llm_result
+
+
+def publish_article(best, html, wp, posted_urls):
+    """ファクトチェック済みの記事をWordPressに投稿し、投稿済み情報を記録（成功時True）"""
+    meta=""
+    m=re.search(r'<p[^>]*data-meta=["\\\']description["\\\'][^>]*>(.*?)</p>', html, flags=re.I|re.S)
+    if m:
+        meta=re.sub(r"<[^>]+>","",m.group(1)).strip()
+        if len(meta)>120: meta=meta[:119]+"…"
+    html=safe_html_cleanup(html)
+    mt=re.search(r"<h1[^>]*>(.*?)</h1>", html, flags=re.I|re.S)
+    title=re.sub(r"<[^>]+>","",mt.group(1)).strip()[:62] if mt else "(自動生成)AIニュース"
+
+    url=urljoin(wp["url"],"wp-json/wp/v2/posts")
+    payload={"title":title,"content":html,"status":wp["status"],"categories":wp["categories"],"excerpt":meta}
+
+    # アイキャッチ画像をランダム選択
+    featured_img_id = select_featured_image()
+    if featured_img_id:
+        payload["featured_media"] = featured_img_id
+        print(f"アイキャッチ画像: ID {featured_img_id}")
+
+    r=requests.post(url,auth=HTTPBasicAuth(wp["user"],wp["password"]),json=payload,timeout=40)
+    print("POST STATUS:", r.status_code)
+    try:
+        data=r.json()
+        print(json.dumps({k:data.get(k) for k in["id","status","link","date","categories"]},ensure_ascii=False,indent=2))
+        if r.status_code==201:
+            posted_urls.add(norm_url(best["link"]))
+            posted_urls.add(get_url_canonicalizer().canonical(best.get("canonical") or best["link"], allow_network=False))
+            save_posted_urls(posted_urls)
+            fp_list = load_json(FINGER_PATH).get("items",[])
+            fp_list.append(fingerprint_record(best["title"], best["summary"]))
+            if len(fp_list) > 2000:
+                fp_list = fp_list[-1000:]
+            save_json(FINGER_PATH, {"items": fp_list})
+            record_semantic_index(best["title"], best["summary"], CFG.get("selection",{}))
+            domain_last=load_json(DOMAIN_PATH); domain_last[best["domain"]] = time.time(); save_json(DOMAIN_PATH, domain_last)
+            return True
+    except Exception as e:
+        print(f"投稿エラー: {e}")
+        print(r.text[:500])
+    return False
 
-        if not fact_check_result["passed"]:
-            print(f"❌ Phase 1 不合格。この記事を破棄して次の候補へ。\n")
-            continue
 
-        print("✅ Phase 1 合格！")
+def batch_conflict(best, sel):
+    """
+    投稿直前の再確認（同じ実行内で先に投稿した記事・キャッシュ保存後に投稿した記事との衝突）。
+    問題があれば理由、なければNone
 
-        # Phase 2: LLMベースのファクトチェック
-        print("\n[Phase 2: LLMベースのファクトチェック中...]")
-        llm_result = llm_fact_check_article(best, html, client)
-        print_llm_fact_check_result(llm_result)
+    投稿のたびに domain_last・指紋・意味的重複インデックスが更新されるため、
+    同じドメインのクールダウンと、投稿済みの記事との重複をここで弾ける。
+    """
+    if not domain_ok(best["domain"], load_json(DOMAIN_PATH), sel.get("domain_cooldown_days",1)):
+        return "同じドメインの記事を投稿済み（クールダウン中）"
+    if is_near_duplicate(best["title"], best["summary"], load_json(FINGER_PATH).get("items",[])):
+        return "投稿済みの記事とほぼ同じ"
+    if not filter_semantic_duplicates([best], sel):
+        return "投稿済みの記事と意味的に重複"
+    return None
+
+
+def publish_pending_articles(wp, posted_urls, sel):
+    """
+    前回までに合格したが投稿に失敗した記事を投稿（生成・チェックはやり直さない）
+
+    保存後に同じドメインや同じ話題の記事を投稿していれば、候補と同じ確認（batch_conflict）で破棄する。
 
-        if not llm_result["passed"]:
-            print(f"❌ Phase 2 不合格（スコア: {llm_result['score']}/100）。この記事を破棄して次の候補へ。\n")
+    Returns:
+        投稿した候補（dict） / False: 投稿に失敗（WordPress側の障害が続いている） / None: 投稿待ちなし
+    """
+    cache=get_article_cache()
+    if not cache:
+        return None
+    canon=get_url_canonicalizer()
+    for entry in cache.pending():
+        best=entry["item"]
+        if norm_url(best["link"]) in posted_urls or canon.canonical(best.get("canonical") or best["link"], allow_network=False) in posted_urls:
+            cache.forget(entry["url"])
+            continue
+        reason=batch_conflict(best, sel)
+        if reason:
+            print(f"\n[記事キャッシュ] 未投稿の記事を破棄: {reason}（{best['title'][:60]}）")
+            cache.forget(entry["url"])
             continue
+        print(f"\n[記事キャッシュ] 合格済みで未投稿の記事を投稿します: {best['title'][:60]}")
+        if publish_article(best, entry["html"], wp, posted_urls):
+            cache.forget(entry["url"])
+            return best
+        cache.record_publish_failure(entry["url"])
+        return False
+    return None
 
-        # 両方のファクトチェック合格 → 投稿処理
-        print(f"✅ Phase 2 合格（スコア: {llm_result['score']}/100）！")
-        print("✅ 全てのファクトチェックに合格！記事を投稿します。\n")
-
-        meta=""
-        m=re.search(r'<p[^>]*data-meta=["\\\']description["\\\'][^>]*>(.*?)</p>', html, flags=re.I|re.S)
-        if m:
-            meta=re.sub(r"<[^>]+>","",m.group(1)).strip()
-            if len(meta)>120: meta=meta[:119]+"…"
-        html=safe_html_cleanup(html)
-        mt=re.search(r"<h1[^>]*>(.*?)</h1>", html, flags=re.I|re.S)
-        title=re.sub(r"<[^>]+>","",mt.group(1)).strip()[:62] if mt else "(自動生成)AIニュース"
-
-        url=urljoin(WP_URL,"wp-json/wp/v2/posts")
-        payload={"title":title,"content":html,"status":status,"categories":cats,"excerpt":meta}
-
-        # アイキャッチ画像をランダム選択
-        featured_img_id = select_featured_image()
-        if featured_img_id:
-            payload["featured_media"] = featured_img_id
-            print(f"アイキャッチ画像: ID {featured_img_id}")
-
-        r=requests.post(url,auth=HTTPBasicAuth(WP_USER,WP_PASS),json=payload,timeout=40)
-        print("POST STATUS:", r.status_code)
-        try:
-            data=r.json()
-            print(json.dumps({k:data.get(k) for k in["id","status","link","date","categories"]},ensure_ascii=False,indent=2))
-            if r.status_code==201:
-                posted_urls.add(norm_url(best["link"]))
-                save_posted_urls(posted_urls)
-                fp_list = load_json(FINGER_PATH).get("items",[])
-                fp_list.append(fingerprint_record(best["title"], best["summary"]))
-                if len(fp_list) > 2000:
-                    fp_list = fp_list[-1000:]
-                save_json(FINGER_PATH, {"items": fp_list})
-                domain_last=load_json(DOMAIN_PATH); domain_last[best["domain"]] = time.time(); save_json(DOMAIN_PATH, domain_last)
-                print("\n✅ 記事投稿成功！")
-                return  # 成功したら終了
-        except Exception as e:
-            print(f"投稿エラー: {e}")
-            print(r.text[:500])
-            continue  # エラーの場合は次の候補へ
 
-    print("\n❌ すべての候補記事がファクトチェックまたは投稿に失敗しました。")
+def main():
+    WP_URL=(ENV.get("WP_URL","") or "").rstrip("/")+"/"
+    WP_USER=(ENV.get("WP_USER","") or "")
+    WP_PASS=(ENV.get("WP_APP_PASSWORD","") or "")
+    if not (WP_URL and WP_USER and WP_PASS):
+        raise SystemExit("WP接続情報不足")
+    wp_cfg=(CFG.get("wordpress") or {})
+    wp={"url":WP_URL,"user":WP_USER,"password":WP_PASS,
+        "categories":wp_cfg.get("category_ids") or [],"status":wp_cfg.get("status","publish")}
+
+    gen_cfg=CFG.get("generate",{})
+    sel=CFG.get("selection",{})
+    # 1回の実行で投稿する記事数（2以上で複数記事モード）
+    n_articles=max(1, gen_cfg.get("articles_per_run",1))
+    published=0
+
+    # 合格済みで未投稿の記事があれば、生成せずにそれを投稿
+    pending=publish_pending_articles(wp, load_posted_urls(), sel)
+    if pending is False:
+        print("\n❌ キャッシュ済みの記事の投稿に失敗しました。次回の実行で再試行します。")
+        return
+    if pending:
+        print("\n✅ 記事投稿成功！（キャッシュ済みの記事）")
+        published+=1
+        if published>=n_articles:
+            return
+
+    # 複数の候補を取得（上位5件、複数記事モードでは1記事あたり3件）
+    candidates, posted_urls, domain_last, fp_list = pick_candidates(top_n=max(5, 3*(n_articles-published)))
+    if not candidates:
+        print("未投稿の候補が見つかりません。終了。"); return
+
+    print(f"\n{len(candidates)}件の候補記事を取得しました。")
+
+    client=get_client(ENV.get("ANTHROPIC_API_KEY"))
+    system=cacheable_system(GENERATION_SYSTEM, GENERATION_TEMPLATE)
+
+    # 上位 speculation_width 件を並列に生成・チェックし、合格した中で上位の候補から投稿
+    # （1の場合は従来どおり1件ずつ順に試す）。投稿している間も残りの候補の取得・生成・チェックは進む。
+    # 複数記事モードでは少なくとも記事数ぶん並列に処理する
+    width=max(gen_cfg.get("speculation_width",1), n_articles-published)
+    if width>1:
+        print(f"[投機生成] 上位{width}件を並列に生成・チェックします")
+    deadline_min=gen_cfg.get("run_deadline_minutes")
+    deadline=time.monotonic()+deadline_min*60 if deadline_min else None
+    check=lambda i, best, cancel: generate_checked_article(i, best, client, system, cancel, len(candidates), deadline)
+    # 先に投稿した記事と衝突する候補（同じドメイン・重複記事）は生成しない
+    skip=lambda i, best: published>0 and batch_conflict(best, sel) is not None
+    for idx, best, html in speculative_results(candidates, check, width=width, skip=skip):
+        if published>0:
+            reason=batch_conflict(best, sel)
+            if reason:
+                print(f"\n[候補 {idx + 1}] 投稿を見送り: {reason}")
+                # 合格時に保存した記事も消す（次回の実行で衝突したまま再利用しない）
+                cache=get_article_cache()
+                if cache:
+                    cache.forget(article_url(best))
+                continue
+        print(f"\n✅ 候補 {idx + 1} が全てのファクトチェックに合格！記事を投稿します。\n")
+        cache=get_article_cache()
+        if publish_article(best, html, wp, posted_urls):
+            if cache:
+                cache.forget(article_url(best))
+            published+=1
+            print(f"\n✅ 記事投稿成功！（{published}/{n_articles}件）")
+            if published>=n_articles:
+                return  # 目標数に達したら終了（並列実行中の残りの候補は中止）
+            continue
+        if cache:
+            cache.record_publish_failure(article_url(best))
+
+    if published:
+        print(f"\n⚠️ 候補が尽きたため、投稿は{published}/{n_articles}件でした。")
+    else:
+        print("\n❌ すべての候補記事がファクトチェックまたは投稿に失敗しました。")
 
 if __name__=="__main__":
-    main()
+    try:
+        main()
+    finally:
+        # 元記事取得中に記録した rel=canonical はメインスレッドでまとめて保存
+        get_url_canonicalizer().save()
+        print_latency_summary()
+        log_usage_summary()
+        # Phase 2 の応答形式の不正（形式の直しで回復した分は、以前なら記事ごと破棄していた）
+        line=format_stats.summary_line()
+        if line:
+            print(line)
+        format_stats.log()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+prompt_budget.py
+トークン数の見積もりと、トークン予算に合わせたプロンプト素材の切り詰め
+- 日本語（かな・漢字）は1文字≒1トークン、英数字は単語ごとに約4文字≒1トークンとして数える
+  （文字数で一律に切ると、英語は無駄に短く・日本語は長すぎることがあるため）
+- 予算を超える本文は段落単位で残し、はみ出した段落は文の区切りで切る（文の途中で切らない）
+- 生成記事の目標文字数から max_tokens を決める
+"""
+import math
+import re
+from typing import Optional
+
+# かな・漢字・全角記号（ほぼ1文字1トークン）
+_CJK_RE = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]")
+# 英数字の連続（約4文字で1トークン）
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+# 1文（句点・感嘆符・疑問符、または空白か末尾が続くピリオドまで。「3.5」では切らない）
+_SENTENCE_RE = re.compile(r".+?(?:[。．！？!?]+|\.(?=\s|$)|$)\s*")
+
+# 切り詰めた箇所に付ける印
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の見積もり（APIを呼ばずにローカルで計算。やや多めに出る）"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    words = _WORD_RE.findall(text)
+    latin = sum(math.ceil(len(w) / 4) for w in words)
+    # 残り（記号・空白以外）は1文字1トークン
+    rest = len(re.sub(r"\s", "", text)) - cjk - sum(len(w) for w in words)
+    return cjk + latin + max(0, rest)
+
+
+def _cut_sentences(paragraph: str, max_tokens: int) -> str:
+    """段落を文の区切りで、予算内に収まるところまで残す"""
+    kept = ""
+    for sentence in _SENTENCE_RE.findall(paragraph):
+        if estimate_tokens(kept + sentence) > max_tokens:
+            break
+        kept += sentence
+    return kept.strip()
+
+
+def fit_to_budget(text: str, max_tokens: int) -> str:
+    """
+    text を max_tokens 以内に収める
+
+    先頭から段落（改行区切り）単位で残し、収まらない段落は文の区切りで切る。
+    切り詰めた場合は末尾に「…」を付ける。
+    """
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    budget = max(0, max_tokens - estimate_tokens(ELLIPSIS))
+    kept = []
+    used = 0
+    for paragraph in text.split("\n"):
+        cost = estimate_tokens(paragraph) + 1  # 改行ぶん
+        if used + cost <= budget:
+            kept.append(paragraph)
+            used += cost
+            continue
+        partial = _cut_sentences(paragraph, budget - used - 1)
+        if partial:
+            kept.append(partial)
+        break
+    return "\n".join(kept).rstrip() + ELLIPSIS
+
+
+def output_max_tokens(target_chars: int, tokens_per_char: float, limit: Optional[int] = None,
+                      minimum: int = 1000) -> int:
+    """
+    記事の目標文字数から max_tokens を決める
+
+    tokens_per_char は本文1文字あたりに見込むトークン数（HTMLタグ・リード・見出しなどの分も含める）。
+    limit（モデル・設定の上限）を超えない。
+    """
+    tokens = max(minimum, math.ceil(target_chars * tokens_per_char))
+    return min(tokens, limit) if limit else tokens
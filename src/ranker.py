@@ -0,0 +1,451 @@
+# -*- coding: utf-8 -*-
+"""
+ranker.py
+候補記事のスコアリングと順位付け
+- ヒューリスティック部分（鮮度・ソース・言語・キーワード）
+- LLMによる話題性（virality）評価（1件ずつ、または複数件をまとめて1リクエスト）
+- 評価結果は title+summary とプロンプト版数のハッシュで永続キャッシュ
+- 未評価の候補は selection.scoring_concurrency 件まで並列にLLM評価
+- selection.virality_model.mode でローカル予測モデル（virality_model.py）に切り替え・A/B比較
+"""
+import re
+import json
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from model_helper import create_message_with_fallback
+from cache_store import JsonCache, content_hash
+from llm_scheduler import AdaptiveExecutor
+import virality_model
+
+BASE = Path(__file__).resolve().parent.parent
+SCORE_CACHE_PATH = BASE / "state" / "virality_cache.json"
+
+# 評価プロンプトを変更したら上げる（古いキャッシュを無効化するため）
+VIRALITY_PROMPT_VERSION = 1
+
+VIRALITY_SYSTEM = "数値評価器。0.0〜1.0の実数のみを返す。"
+VIRALITY_BATCH_SYSTEM = "数値評価器。指定された形式のJSON配列のみを返す。"
+DEFAULT_VIRALITY = 0.5
+
+
+def heuristic_components(c: Dict, sel: Dict) -> Dict[str, float]:
+    """LLMを使わないスコア要素（鮮度・言語・ソース重み・キーワード）"""
+    now = time.time()
+    freshness = 0.0
+    if c.get("ts"):
+        hours = max(1, (now - c["ts"]) / 3600.0)
+        freshness = max(0.0, min(1.0, math.exp(-hours / 72.0)))
+    lang_score = sel.get("ja_priority", 1.0) if c["lang"].startswith("ja") else sel.get("en_priority", 0.8)
+    src_w = sel.get("source_weights", {}).get(c["domain"], 1.0)
+    kw_score = 0.0
+    title_lower = c["title"].lower()
+    for kw in sel.get("keyword_boosts", []):
+        if kw.lower() in title_lower:
+            kw_score += 0.05
+    kw_score = min(1.0, kw_score)
+    return {"freshness": freshness, "language": lang_score, "source": src_w, "keyword": kw_score}
+
+
+def heuristic_score(c: Dict, sel: Dict) -> float:
+    """スコアのうちLLM virality以外の部分（重み付き和）"""
+    W = sel["weights"]
+    h = heuristic_components(c, sel)
+    return (W["freshness"] * h["freshness"] +
+            W["source"] * ((h["source"] - 0.8) / 0.4 * 0.5) +
+            W["language"] * h["language"] +
+            W["keyword"] * h["keyword"])
+
+
+def combine_score(base: float, vir: float, sel: Dict) -> float:
+    """ヒューリスティック部分とviralityを合成し、0〜1に丸める"""
+    score = base + sel["weights"]["llm_virality"] * vir
+    return max(0.0, min(1.0, score))
+
+
+def _clamp_virality(v) -> float:
+    try:
+        return max(0.0, min(1.0, float(v)))
+    except (TypeError, ValueError):
+        return DEFAULT_VIRALITY
+
+
+def virality_prompt(c: Dict) -> str:
+    return f"""次のニュースが、LLM/生成AI領域で日本のビジネス読者にとって「話題になる/価値が高い」かを0.0〜1.0で数値のみ返答。
+特に公式発表・カンファレンス・DevDay・API更新・新機能リリースは高評価。説明不要。
+タイトル: {c["title"]}
+要約: {c["summary"]}"""
+
+
+def virality_batch_prompt(cands: List[Dict]) -> str:
+    items = "\n\n".join(
+        f"[{i}]\nタイトル: {c['title']}\n要約: {c['summary']}" for i, c in enumerate(cands)
+    )
+    return f"""次の{len(cands)}件のニュースそれぞれについて、LLM/生成AI領域で日本のビジネス読者にとって「話題になる/価値が高い」かを0.0〜1.0で評価。
+特に公式発表・カンファレンス・DevDay・API更新・新機能リリースは高評価。説明不要。
+
+{items}
+
+次の形式のJSON配列のみを返答（全{len(cands)}件、idは上記の番号）:
+[{{"id": 0, "score": 0.7}}, {{"id": 1, "score": 0.3}}]"""
+
+
+def _parse_virality_raw(txt: str) -> Optional[float]:
+    m = re.findall(r"[0-1](?:\.\d+)?", txt or "")
+    return _clamp_virality(m[0]) if m else None
+
+
+def parse_virality(txt: str) -> float:
+    """1件評価の応答から数値を取り出す（取れない場合は0.5）"""
+    v = _parse_virality_raw(txt)
+    return DEFAULT_VIRALITY if v is None else v
+
+
+def _parse_virality_batch_raw(txt: str, n: int) -> Dict[int, float]:
+    """バッチ評価の応答から {番号: スコア} を取り出す（解析できた項目のみ）"""
+    scores: Dict[int, float] = {}
+    txt = re.sub(r"```(?:json)?", "", txt or "")
+    start, end = txt.find("["), txt.rfind("]")
+    items = []
+    if start != -1 and end > start:
+        try:
+            items = json.loads(txt[start:end + 1])
+        except ValueError:
+            items = []
+    if not isinstance(items, list) or not items:
+        # JSONとして壊れている場合は個々のオブジェクトを拾う
+        items = [{"id": i, "score": s} for i, s in
+                 re.findall(r'"id"\s*:\s*(\d+)\s*,\s*"score"\s*:\s*([0-9.]+)', txt)]
+
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        try:
+            idx = int(it.get("id"))
+            val = float(it.get("score"))
+        except (TypeError, ValueError):
+            continue
+        if 0 <= idx < n and idx not in scores:
+            scores[idx] = _clamp_virality(val)
+    return scores
+
+
+def parse_virality_batch(txt: str, n: int) -> Tuple[List[float], int]:
+    """
+    バッチ評価の応答（JSON配列）を解析
+
+    Returns:
+        (n件のスコア, 解析できなかった件数)  ※解析できなかった項目は0.5
+    """
+    scores = _parse_virality_batch_raw(txt, n)
+    out = [scores.get(i, DEFAULT_VIRALITY) for i in range(n)]
+    return out, n - len(scores)
+
+
+_score_cache = None
+
+
+def get_score_cache(sel: Dict) -> Optional[JsonCache]:
+    """virality評価キャッシュ（プロセス内で共有、無効な場合はNone）"""
+    global _score_cache
+    sc = sel.get("score_cache", {})
+    if not sc.get("enabled", True):
+        return None
+    if _score_cache is None:
+        _score_cache = JsonCache(
+            SCORE_CACHE_PATH,
+            ttl_seconds=sc.get("ttl_hours", 72) * 3600,
+            max_entries=sc.get("max_entries", 5000),
+        )
+    return _score_cache
+
+
+def virality_cache_key(c: Dict) -> str:
+    return content_hash(c.get("title", ""), c.get("summary", ""), VIRALITY_PROMPT_VERSION)
+
+
+def _call_virality(c: Dict, client) -> Optional[float]:
+    """1件評価のAPI呼び出し（APIエラーは送出、解析できない場合はNone）"""
+    msg = create_message_with_fallback(
+        client,
+        system=VIRALITY_SYSTEM,
+        messages=[{"role": "user", "content": virality_prompt(c)}],
+        max_tokens=20,
+        temperature=0.0,
+        label="virality"
+    )
+    txt = "".join([p.text for p in msg.content if p.type == "text"]).strip()
+    return _parse_virality_raw(txt)
+
+
+def _llm_virality_raw(c: Dict, client) -> Optional[float]:
+    try:
+        return _call_virality(c, client)
+    except Exception:
+        return None
+
+
+def llm_virality(c: Dict, client) -> float:
+    """1件ずつLLMで話題性を評価（失敗した場合は0.5）"""
+    v = _llm_virality_raw(c, client)
+    return DEFAULT_VIRALITY if v is None else v
+
+
+def _call_virality_batch(cands: List[Dict], client) -> Dict[int, float]:
+    """バッチ評価のAPI呼び出し（APIエラーは送出、解析できた項目のみ返す）"""
+    msg = create_message_with_fallback(
+        client,
+        system=VIRALITY_BATCH_SYSTEM,
+        messages=[{"role": "user", "content": virality_batch_prompt(cands)}],
+        max_tokens=30 * len(cands) + 50,
+        temperature=0.0,
+        label="virality_batch"
+    )
+    txt = "".join([p.text for p in msg.content if p.type == "text"]).strip()
+    scores = _parse_virality_batch_raw(txt, len(cands))
+    failed = len(cands) - len(scores)
+    if failed:
+        print(f"[警告] バッチ評価で{failed}/{len(cands)}件を解析できず、0.5として扱います")
+    return scores
+
+
+def _llm_virality_batch_raw(cands: List[Dict], client) -> Dict[int, float]:
+    try:
+        return _call_virality_batch(cands, client)
+    except Exception as e:
+        print(f"[警告] バッチ評価に失敗: {str(e)[:100]}")
+        return {}
+
+
+def llm_virality_batch(cands: List[Dict], client) -> List[float]:
+    """複数件をまとめて1リクエストでLLM評価（失敗した項目は0.5）"""
+    if not cands:
+        return []
+    scores = _llm_virality_batch_raw(cands, client)
+    return [scores.get(i, DEFAULT_VIRALITY) for i in range(len(cands))]
+
+
+def cached_virality(c: Dict, sel: Dict) -> Optional[float]:
+    """キャッシュ済みのvirality（なければNone）"""
+    cache = get_score_cache(sel)
+    return cache.get(virality_cache_key(c)) if cache is not None else None
+
+
+def store_virality(c: Dict, sel: Dict, vir: Optional[float]) -> None:
+    """
+    LLMで評価できたviralityをキャッシュし、ローカルモデルの学習データとして記録
+
+    失敗時の0.5は保存しない。
+    """
+    if vir is None:
+        return
+    cache = get_score_cache(sel)
+    if cache is not None:
+        cache.set(virality_cache_key(c), vir)
+    if sel.get("virality_model", {}).get("record_history", True):
+        try:
+            virality_model.record_history(c, vir)
+        except OSError as e:
+            print(f"[警告] 評価履歴の記録に失敗: {e}")
+
+
+_local_model = None
+
+
+def get_local_model() -> Optional["virality_model.ViralityModel"]:
+    """最新版のローカル話題性モデル（プロセス内で共有、なければNone）"""
+    global _local_model
+    if _local_model is None:
+        _local_model = virality_model.load_latest_model()
+    return _local_model
+
+
+def virality_mode(sel: Dict) -> str:
+    """
+    virality評価の方式
+
+    - llm: LLMで評価（既定）
+    - local: ローカルモデルで評価（モデルがなければLLM）
+    - ab: LLMで評価しつつ、ローカルモデルの予測と比較して記録
+    """
+    mode = sel.get("virality_model", {}).get("mode", "llm")
+    if mode in ("local", "ab") and get_local_model() is None:
+        print("[警告] 学習済みの話題性モデルがないため、LLMで評価します")
+        return "llm"
+    return mode
+
+
+def score_candidate(c: Dict, sel: Dict, client, vir: float = None) -> float:
+    """
+    候補記事のスコア（0〜1）を計算
+
+    Args:
+        vir: 評価済みのvirality（Noneの場合はキャッシュを確認し、なければLLMで1件評価。
+             selection.virality_model.mode が local の場合はローカルモデルで予測、
+             ab の場合はLLM評価とローカル予測の差を表示）
+    """
+    mode = virality_mode(sel)
+    if vir is None and mode == "local":
+        vir = float(get_local_model().predict([c])[0])
+    if vir is None:
+        vir = cached_virality(c, sel)
+    if vir is None:
+        raw = _llm_virality_raw(c, client)
+        store_virality(c, sel, raw)
+        vir = DEFAULT_VIRALITY if raw is None else raw
+    if mode == "ab":
+        local = float(get_local_model().predict([c])[0])
+        print(f"[A/B] virality LLM {vir:.2f} / ローカル {local:.2f}: {c.get('title', '')[:40]}")
+    return combine_score(heuristic_score(c, sel), vir, sel)
+
+
+def _score_wave(cands: List[Dict], idxs: List[int], sel: Dict, client,
+                executor: AdaptiveExecutor) -> Dict[int, float]:
+    """
+    未評価の候補（idxs）をLLMで評価し、{候補番号: virality} を返す（失敗は0.5）
+
+    バッチ（またはバッチ無効時は1件）単位の呼び出しを並列に実行する。
+    """
+    batch_size = sel.get("virality_batch_size", 1) or 1
+    jobs = [idxs[k:k + batch_size] for k in range(0, len(idxs), batch_size)]
+    if batch_size > 1:
+        call = lambda job: _call_virality_batch([cands[i] for i in job], client)
+    else:
+        call = lambda job: {0: _call_virality(cands[job[0]], client)}
+
+    results = executor.map(call, jobs, default={})
+
+    out: Dict[int, float] = {}
+    for job, scores in zip(jobs, results):
+        for j, i in enumerate(job):
+            v = scores.get(j)
+            store_virality(cands[i], sel, v)
+            out[i] = DEFAULT_VIRALITY if v is None else v
+    return out
+
+
+def _kth_best(scores: Dict[int, float], k: int) -> float:
+    if len(scores) < k:
+        return float("-inf")
+    return sorted(scores.values(), reverse=True)[k - 1]
+
+
+def rank_candidates(cands: List[Dict], sel: Dict, client, top_k: Optional[int] = None) -> List[Tuple[float, Dict]]:
+    """
+    候補をスコアリングし、スコアの降順に並べて返す
+
+    キャッシュ済みの候補はLLMを呼ばない。selection.virality_batch_size が2以上の場合は、
+    未評価の候補をその件数ずつまとめてLLM評価し、各リクエストは
+    selection.scoring_concurrency 件まで並列に実行する。
+
+    top_k を指定し selection.two_stage が有効な場合は二段階で評価する:
+      1. 全候補のヒューリスティック部分と、virality=1.0 を仮定した上限スコアを計算
+      2. 上限スコアの高い順にLLM評価し、上限が現在のK位のスコアに届かない候補は評価しない
+    この場合も上位K件は全件評価した場合と同一になる（戻り値は評価済みの候補のみ）。
+    """
+    n = len(cands)
+    base = [heuristic_score(c, sel) for c in cands]
+    mode = virality_mode(sel)
+
+    if mode == "local":
+        model = get_local_model()
+        start = time.time()
+        preds = model.predict(cands)
+        print(f"[ローカルモデル v{model.version}] {n}件を{(time.time() - start) * 1000:.1f}msで評価")
+        order = sorted(range(n), key=lambda i: (-combine_score(base[i], float(preds[i]), sel), i))
+        return [(combine_score(base[i], float(preds[i]), sel), cands[i]) for i in order]
+
+    virs: Dict[int, float] = {}
+    exact: Dict[int, float] = {}
+    for i, c in enumerate(cands):
+        v = cached_virality(c, sel)
+        if v is not None:
+            virs[i] = v
+            exact[i] = combine_score(base[i], v, sel)
+
+    executor = AdaptiveExecutor(max_workers=sel.get("scoring_concurrency", 1) or 1)
+    batch_size = sel.get("virality_batch_size", 1) or 1
+    # 1回の並列実行で評価する件数（二段階時は two_stage_wave_batches バッチ分ずつ評価して枝刈りする。
+    # 小さいほどLLM呼び出しは減るが、段数が増えて待ち時間は延びる）
+    if top_k and sel.get("two_stage", True):
+        wave_size = batch_size * (sel.get("two_stage_wave_batches", 1) or 1)
+    else:
+        wave_size = batch_size * (sel.get("scoring_concurrency", 1) or 1)
+    pending = [i for i in range(n) if i not in exact]
+    two_stage = bool(top_k) and sel.get("two_stage", True)
+
+    if two_stage:
+        upper = {i: combine_score(base[i], 1.0, sel) for i in pending}
+        pending.sort(key=lambda i: upper[i], reverse=True)
+        llm_count = 0
+        while pending:
+            kth = _kth_best(exact, top_k)
+            # 上限がK位に届かない候補は、viralityが何であっても上位K件に入らない
+            pending = [i for i in pending if upper[i] >= kth]
+            if not pending:
+                break
+            wave, pending = pending[:wave_size], pending[wave_size:]
+            for i, v in _score_wave(cands, wave, sel, client, executor).items():
+                virs[i] = v
+                exact[i] = combine_score(base[i], v, sel)
+            llm_count += len(wave)
+        print(f"[二段階ランキング] LLM評価 {llm_count}/{len(upper)}件（キャッシュ済み {n - len(upper)}件）")
+    else:
+        for i, v in _score_wave(cands, pending, sel, client, executor).items():
+            virs[i] = v
+            exact[i] = combine_score(base[i], v, sel)
+
+    # 元の順序を保った安定ソート（全件評価時と同じ並び）
+    order = sorted(exact, key=lambda i: (-exact[i], i))
+    scored = [(exact[i], cands[i]) for i in order]
+
+    if mode == "ab":
+        report_ab(cands, base, virs, sel, top_k or 5)
+
+    cache = get_score_cache(sel)
+    if cache is not None:
+        print(cache.stats_line("virality評価"))
+        cache.save()
+    return scored
+
+
+AB_LOG_PATH = BASE / "state" / "virality_ab.jsonl"
+
+
+def report_ab(cands: List[Dict], base: List[float], virs: Dict[int, float], sel: Dict, k: int) -> Dict:
+    """
+    LLM評価とローカルモデル予測を比較し、結果を表示・記録
+
+    比較項目: viralityの平均絶対誤差、上位k件の一致数、予測時間
+    """
+    idxs = sorted(virs)
+    if not idxs:
+        return {}
+    model = get_local_model()
+    start = time.time()
+    preds = model.predict([cands[i] for i in idxs])
+    elapsed_ms = (time.time() - start) * 1000
+
+    llm = {i: virs[i] for i in idxs}
+    local = {i: float(p) for i, p in zip(idxs, preds)}
+    top = lambda vs: set(sorted(idxs, key=lambda i: (-combine_score(base[i], vs[i], sel), i))[:k])
+    result = {
+        "ts": time.time(),
+        "model_version": model.version,
+        "n": len(idxs),
+        "mae": sum(abs(llm[i] - local[i]) for i in idxs) / len(idxs),
+        "top_k": k,
+        "top_k_overlap": len(top(llm) & top(local)),
+        "local_ms": elapsed_ms,
+    }
+    print(f"[A/B] ローカルモデル v{model.version}: LLMとの平均誤差 {result['mae']:.3f}、"
+          f"上位{k}件の一致 {result['top_k_overlap']}/{min(k, len(idxs))}件、予測 {elapsed_ms:.1f}ms")
+    try:
+        AB_LOG_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with open(AB_LOG_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[警告] A/B結果の記録に失敗: {e}")
+    return result
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+semantic_dedup.py
+ハッシュ化TF-IDFベクトルによるローカルな意味的重複検出
+- ネットワーク・GPU不要（NumPyのみ）
+- 言語を意識したトークナイズ（英語: 単語、日本語: 文字bigram + カタカナ語）
+- 投稿済み記事のベクトルをfloat32行列で保持し、コサイン類似度のtop-kを一括計算
+
+特徴空間の前半を英数字・固有名詞トークン、後半を日本語bigramに割り当てる。
+日英をまたぐ比較（英語記事 vs 日本語記事）では、共通して現れる英数字・固有名詞
+（OpenAI, GPT-5, Gemini 3 など）の部分空間だけでコサイン類似度を計算する。
+ただし企業名・製品ブランド名だけの一致では同じ会社の別ニュースも重複扱いになるため、
+それ以外の英数字トークン（GPT-5, API, Sora など）を一定数以上共有する場合に限る。
+"""
+import re
+import time
+import zlib
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+N_FEATURES = 4096
+TITLE_WEIGHT = 2
+
+# 英語のストップワード（類似度に寄与しない頻出語）
+STOPWORDS = {
+    "a", "an", "the", "and", "or", "but", "if", "of", "to", "in", "on", "at",
+    "by", "for", "with", "from", "as", "into", "about", "over", "after",
+    "is", "are", "was", "were", "be", "been", "being", "has", "have", "had",
+    "it", "its", "this", "that", "these", "those", "you", "your", "we", "our",
+    "they", "their", "he", "she", "his", "her", "will", "can", "could",
+    "would", "should", "may", "might", "not", "no", "new", "now", "says",
+    "said", "how", "what", "why", "when", "who", "which", "more", "than",
+    "just", "also", "up", "out", "all", "some", "any", "so", "do", "does",
+}
+
+# 日英で表記が分かれる主要な固有名詞（カタカナ表記 → 英語表記）
+ALIASES = {
+    "グーグル": "google",
+    "オープンエーアイ": "openai",
+    "アンソロピック": "anthropic",
+    "マイクロソフト": "microsoft",
+    "エヌビディア": "nvidia",
+    "アマゾン": "amazon",
+    "アップル": "apple",
+    "メタ": "meta",
+    "クロード": "claude",
+    "ジェミニ": "gemini",
+    "チャットジーピーティー": "chatgpt",
+}
+
+# 日英比較で「内容の一致」として数えない語（企業名・ブランド名・一般語）
+ENTITY_TOKENS = set(ALIASES.values()) | {
+    "ai", "llm", "llms", "genai", "xai", "grok", "copilot", "llama", "mistral", "deepseek",
+    "perplexity", "samsung", "tesla", "ibm", "intel", "amd", "qualcomm", "youtube", "android",
+    "ios", "windows", "x",
+}
+
+_NUMERIC_RE = re.compile(r"^\d+(?:\.\d+)*$")
+_LATIN_RE = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_KATAKANA_RE = re.compile(r"[ァ-ヶー]{2,}")
+_CJK_RE = re.compile(r"[ぁ-んァ-ヶー一-龥々]+")
+_HIRAGANA_RE = re.compile(r"^[ぁ-ん]+$")
+
+
+def tokenize_split(text: str) -> Tuple[List[str], List[str]]:
+    """
+    言語を意識したトークナイズ
+
+    - NFKC正規化 + 小文字化（全角英数字も半角として扱う）
+    - 英数字: 単語単位（ストップワード除去）
+    - カタカナ語: 語単位（主要な固有名詞は英語表記に寄せ、英数字側に入れる）
+    - 漢字・かな: 文字bigram（ひらがなのみのbigramは助詞が多いため除外）
+
+    Returns:
+        (英数字・固有名詞トークン, 日本語トークン)
+    """
+    t = unicodedata.normalize("NFKC", text or "").lower()
+    latin, cjk = [], []
+
+    for w in _LATIN_RE.findall(t):
+        if w in STOPWORDS or (len(w) < 2 and not w.isdigit()):
+            continue
+        latin.append(w)
+
+    for k in _KATAKANA_RE.findall(t):
+        if k in ALIASES:
+            latin.append(ALIASES[k])
+        else:
+            cjk.append(k)
+
+    for run in _CJK_RE.findall(t):
+        for i in range(len(run) - 1):
+            bg = run[i:i + 2]
+            if _HIRAGANA_RE.match(bg):
+                continue
+            cjk.append(bg)
+
+    return latin, cjk
+
+
+def tokenize(text: str) -> List[str]:
+    """言語を意識したトークナイズ（英数字・日本語トークンを連結して返す）"""
+    latin, cjk = tokenize_split(text)
+    return latin + cjk
+
+
+def _bucket(token: str, size: int) -> Tuple[int, float]:
+    """トークンをハッシュ化（バケット番号と符号。符号付きで足し合わせ、衝突の影響を平均的に打ち消す）"""
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % size, (1.0 if (h >> 31) & 1 == 0 else -1.0)
+
+
+def term_vector(title: str, summary: str, n_features: int = N_FEATURES) -> np.ndarray:
+    """
+    タイトル + 要約のハッシュ化TF（サブリニア）ベクトル
+
+    前半 n_features/2 次元が英数字・固有名詞、後半が日本語トークン。
+    タイトルの語はTITLE_WEIGHT倍で数える。IDFは類似度計算時に付与する。
+    """
+    half = n_features // 2
+    counts: Dict[Tuple[int, str], float] = {}
+    for weight, text in ((TITLE_WEIGHT, title), (1, summary)):
+        latin, cjk = tokenize_split(text)
+        for offset, toks in ((0, latin), (half, cjk)):
+            for tok in toks:
+                counts[(offset, tok)] = counts.get((offset, tok), 0.0) + weight
+    v = np.zeros(n_features, dtype=np.float32)
+    for (offset, tok), c in counts.items():
+        # 符号はトークンごとに掛けてから足す（同じバケットに衝突した語は打ち消し合う）
+        idx, sign = _bucket(tok, half)
+        v[offset + idx] += sign * (1.0 + np.log(c))
+    return v
+
+
+def content_tokens(title: str, summary: str) -> List[str]:
+    """日英比較用の内容語: 英数字トークンから企業名・ブランド名・数字だけの語を除いたもの"""
+    latin = tokenize_split(title)[0] + tokenize_split(summary)[0]
+    return [t for t in latin if t not in ENTITY_TOKENS and not _NUMERIC_RE.match(t)]
+
+
+def content_mask(title: str, summary: str, n_features: int = N_FEATURES) -> np.ndarray:
+    """内容語のハッシュバケット（0/1、英数字側の n_features/2 次元）"""
+    m = np.zeros(n_features // 2, dtype=np.uint8)
+    for tok in content_tokens(title, summary):
+        m[_bucket(tok, n_features // 2)[0]] = 1
+    return m
+
+
+def is_cjk_vector(m: np.ndarray) -> np.ndarray:
+    """
+    日本語トークンを含む行（日本語記事）を判定
+
+    日本語記事の見出しは英数字の固有名詞が大半を占めることが多いため（「GoogleがGemini 3を発表」など）、
+    重みの多寡ではなく日本語トークンの有無で判定する。
+    """
+    half = m.shape[1] // 2
+    return np.abs(m[:, half:]).sum(axis=1) > 0
+
+
+def _idf_weighted(m: np.ndarray, idf: np.ndarray) -> np.ndarray:
+    """IDF重み付け + L2正規化"""
+    w = m * idf
+    norms = np.linalg.norm(w, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return w / norms
+
+
+class SemanticIndex:
+    """
+    投稿済み記事のハッシュ化TFベクトルを保持するインデックス
+
+    ベクトルはfloat32行列（記事数 × n_features）に格納し、
+    IDFは検索時にインデックスとクエリ全体の文書頻度から算出する。
+    """
+
+    def __init__(self, n_features: int = N_FEATURES):
+        self.n_features = n_features
+        self.matrix = np.zeros((0, n_features), dtype=np.float32)
+        self.created_at = np.zeros(0, dtype=np.float64)
+        self.content = np.zeros((0, n_features // 2), dtype=np.uint8)
+        self.titles: List[str] = []
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def add(self, title: str, summary: str, created_at: Optional[float] = None) -> None:
+        """記事をインデックスに追加"""
+        v = term_vector(title, summary, self.n_features)
+        self.matrix = np.vstack([self.matrix, v[None, :]])
+        self.content = np.vstack([self.content, content_mask(title, summary, self.n_features)[None, :]])
+        self.created_at = np.append(self.created_at, created_at or time.time())
+        self.titles.append((title or "")[:120])
+
+    def evict(self, max_age_days: float, now: Optional[float] = None) -> int:
+        """max_age_daysより古い記事を削除し、削除件数を返す"""
+        now = now or time.time()
+        keep = (now - self.created_at) <= max_age_days * 86400
+        removed = int((~keep).sum())
+        if removed:
+            self.matrix = self.matrix[keep]
+            self.content = self.content[keep]
+            self.created_at = self.created_at[keep]
+            self.titles = [t for t, k in zip(self.titles, keep) if k]
+        return removed
+
+    def similarities(self, queries: List[Tuple[str, str]],
+                     cross_lang_min_shared: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        クエリ（title, summary）とインデックス全行のコサイン類似度行列を計算
+
+        同一言語のペアは全特徴、日英をまたぐペアは英数字・固有名詞の部分空間で比較する。
+        日英をまたぐペアのうち、内容語（content_tokens）の共通が cross_lang_min_shared 個
+        未満のものは類似度0とする（企業名だけの一致を除外）。
+
+        Returns:
+            (類似度行列 [クエリ数 × 記事数], 日英をまたぐペアのマスク)
+        """
+        q = np.vstack([term_vector(t, s, self.n_features) for t, s in queries])
+        corpus = np.vstack([self.matrix, q])
+        df = np.count_nonzero(corpus, axis=0).astype(np.float32)
+        idf = (np.log((1.0 + corpus.shape[0]) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        full = _idf_weighted(q, idf) @ _idf_weighted(self.matrix, idf).T
+        half = self.n_features // 2
+        latin = _idf_weighted(q[:, :half], idf[:half]) @ _idf_weighted(self.matrix[:, :half], idf[:half]).T
+
+        cross = is_cjk_vector(q)[:, None] != is_cjk_vector(self.matrix)[None, :]
+        qc = np.vstack([content_mask(t, s, self.n_features) for t, s in queries]).astype(np.int32)
+        shared = qc @ self.content.astype(np.int32).T
+        latin = np.where(shared >= cross_lang_min_shared, latin, 0.0)
+        return np.where(cross, latin, full), cross
+
+    def top_k(self, queries: List[Tuple[str, str]], k: int = 3) -> List[List[Tuple[float, int]]]:
+        """
+        各クエリ（title, summary）について類似度上位k件を返す
+
+        Returns:
+            クエリごとの [(コサイン類似度, インデックス行番号), ...]（類似度の降順）
+        """
+        if not queries:
+            return []
+        if len(self) == 0:
+            return [[] for _ in queries]
+
+        sims, _ = self.similarities(queries)
+        k = min(k, len(self))
+        top = np.argsort(-sims, axis=1)[:, :k]
+        return [[(float(sims[i, j]), int(j)) for j in row] for i, row in enumerate(top)]
+
+    def find_duplicates(self, queries: List[Tuple[str, str]], threshold: float,
+                        cross_lang_threshold: Optional[float] = None,
+                        cross_lang_min_shared: int = 1) -> List[Optional[Tuple[float, str]]]:
+        """
+        閾値以上の類似記事があるクエリについて (類似度, 既存記事タイトル) を返す
+
+        Args:
+            queries: [(title, summary), ...]
+            threshold: 同一言語ペアの閾値
+            cross_lang_threshold: 日英をまたぐペアの閾値（Noneの場合はthresholdと同じ）
+            cross_lang_min_shared: 日英をまたぐペアで必要な内容語の共通数
+
+        Returns:
+            クエリごとの結果（重複なしの場合はNone）
+        """
+        if not queries:
+            return []
+        if len(self) == 0:
+            return [None for _ in queries]
+
+        if cross_lang_threshold is None:
+            cross_lang_threshold = threshold
+        sims, cross = self.similarities(queries, cross_lang_min_shared)
+        # 閾値で割った値が1以上なら重複（ペアごとに閾値が異なるため）
+        ratio = sims / np.where(cross, cross_lang_threshold, threshold)
+        best = np.argmax(ratio, axis=1)
+
+        out = []
+        for i, j in enumerate(best):
+            if ratio[i, j] >= 1.0:
+                out.append((float(sims[i, j]), self.titles[j]))
+            else:
+                out.append(None)
+        return out
+
+    def save(self, path: Path) -> None:
+        np.savez_compressed(
+            path,
+            matrix=self.matrix,
+            created_at=self.created_at,
+            content=self.content,
+            titles=np.array(self.titles, dtype=str),
+        )
+
+
+def load_index(path: Path, n_features: int = N_FEATURES) -> SemanticIndex:
+    """インデックスを読み込む（存在しない・次元が異なる場合は空のインデックス）"""
+    index = SemanticIndex(n_features)
+    if not Path(path).exists():
+        return index
+    try:
+        with np.load(path, allow_pickle=False) as d:
+            if d["matrix"].shape[1] != n_features:
+                return index
+            index.matrix = d["matrix"].astype(np.float32)
+            index.created_at = d["created_at"].astype(np.float64)
+            # 内容語マスクのない旧形式は、日英をまたぐ重複判定の対象外にする（誤検出を避ける）
+            if "content" in d.files:
+                index.content = d["content"].astype(np.uint8)
+            else:
+                index.content = np.zeros((index.matrix.shape[0], n_features // 2), dtype=np.uint8)
+            index.titles = [str(t) for t in d["titles"]]
+    except Exception as e:
+        print(f"[警告] 意味的重複インデックスの読み込みに失敗: {e}")
+    return index
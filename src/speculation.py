@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+speculation.py
+候補の投機的な並列処理
+- 上位 width 件を同時に処理し、1件終わるごとに次の候補を投入
+- 結果はランキング順に返す（上位の候補が失敗と確定するまで下位の合格は保留）
+- 呼び出し側がループを抜けたら cancel を立て、未着手の処理は破棄・実行中の処理は中断を促す
+- skip を渡すと、投入する直前に skip(index, item) が真の項目は処理せずに失敗として扱う
+  （先に返した結果によって不要になった候補を生成しないため）
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+
+def speculative_results(items: List[Any], fn: Callable[[int, Any, threading.Event], Any],
+                        width: int = 1, cancel: Optional[threading.Event] = None,
+                        skip: Optional[Callable[[int, Any], bool]] = None) -> Iterator[Tuple[int, Any, Any]]:
+    """
+    items を最大 width 件ずつ並列に fn(index, item, cancel) で処理し、
+    結果が真のものを (index, item, result) としてランキング順に返す
+
+    fn は cancel がセットされたら途中で処理をやめてNoneを返すこと。
+    fn が例外を送出した項目は失敗（None）として扱う。
+    """
+    cancel = cancel or threading.Event()
+    width = max(1, int(width))
+    results = {}
+    futures = {}
+    next_submit = 0
+    next_yield = 0
+
+    def run(i):
+        try:
+            return fn(i, items[i], cancel)
+        except Exception as e:
+            print(f"[候補 {i + 1}] 処理中にエラー: {str(e)[:100]}")
+            return None
+
+    pool = ThreadPoolExecutor(max_workers=min(width, len(items)) or 1)
+    try:
+        while next_yield < len(items):
+            if next_yield in results:
+                result = results.pop(next_yield)
+                i, next_yield = next_yield, next_yield + 1
+                if result:
+                    yield i, items[i], result
+                continue
+
+            # 実行中を width 件に保つ（ランキング順に投入）
+            while len(futures) < width and next_submit < len(items):
+                if skip and skip(next_submit, items[next_submit]):
+                    results[next_submit] = None
+                else:
+                    futures[pool.submit(run, next_submit)] = next_submit
+                next_submit += 1
+            if not futures:
+                continue
+
+            done, _ = wait(list(futures), return_when=FIRST_COMPLETED)
+            for f in done:
+                results[futures.pop(f)] = f.result()
+    finally:
+        cancel.set()
+        pool.shutdown(wait=False, cancel_futures=True)
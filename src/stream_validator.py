@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+stream_validator.py
+ストリーミング生成中のHTMLを逐次チェックし、明らかに不合格な生成を早期に打ち切る
+- コードブロックマーカー（```html など。check_posts_auth.py で検出している問題）
+- safe_html_cleanup で中身ごと削除されるタグ（script, table など）
+- 冒頭の一定文字数以内に <h1> がない
+"""
+import re
+from typing import Optional
+
+# 生成の中止理由になるタグ（safe_html_cleanup が中身ごと削除するもの）
+DISALLOWED_TAGS = ("script", "style", "section", "table", "iframe", "form", "noscript")
+CODE_FENCE_MARKERS = ("```", "&#96;&#96;&#96;")
+
+# 出典は生成させずに手元で付け足す（ここで生成を止める）
+SOURCE_DIV_STOP = '<div class="source">'
+
+_DISALLOWED_RE = re.compile(r"<\s*(%s)\b" % "|".join(DISALLOWED_TAGS), re.I)
+_H1_RE = re.compile(r"<h1\b", re.I)
+# チャンク境界をまたぐマーカー・タグを見逃さないために読み直す文字数
+_OVERLAP = 32
+
+
+class IncrementalHtmlValidator:
+    """
+    受信済みテキスト全体を渡すと、前回からの増分だけを検査する
+
+    check() は問題があれば中止理由（文字列）、なければNoneを返す。
+    """
+
+    def __init__(self, h1_within_chars: int = 800):
+        self.h1_within_chars = h1_within_chars
+        self.checked = 0
+        self.has_h1 = False
+
+    def check(self, text: str) -> Optional[str]:
+        if len(text) < self.checked:
+            # 再試行で最初から受信し直している
+            self.checked = 0
+            self.has_h1 = False
+        start = max(0, self.checked - _OVERLAP)
+        chunk = text[start:]
+        self.checked = len(text)
+
+        for marker in CODE_FENCE_MARKERS:
+            if marker in chunk:
+                return f"コードブロックマーカー（{marker}）を検出"
+        m = _DISALLOWED_RE.search(chunk)
+        if m:
+            return f"使用禁止タグ <{m.group(1).lower()}> を検出"
+        if not self.has_h1:
+            self.has_h1 = bool(_H1_RE.search(text))
+            if not self.has_h1 and len(text) > self.h1_within_chars:
+                return f"先頭{self.h1_within_chars}文字以内に<h1>がない"
+        return None
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+"""
+term_automaton.py
+複数の語の出現をまとめて調べるオートマトン（Aho-Corasick）
+- 元記事の語（固有名詞・数値・日付）から1度だけ作り、生成記事を1回走査して全語の有無を得る
+- 語とテキストはどちらも normalize_for_match（NFKC・小文字化）してから照合する
+  （大文字小文字・全角半角の違いは同じ語として扱う）
+- オートマトンの構築は語ごとの in 検索より重い（RSSの要約程度なら数倍）。TermMatcher は
+  語が少なければ in 検索だけを使い、多ければ2回目の照合から（同じ語の集合を使い回すときだけ）構築する
+"""
+import re
+import unicodedata
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Set
+
+# これより語が少なければオートマトンを作らない（走査だけでも in 検索より速くなるのは50〜60語から）
+AUTOMATON_MIN_TERMS = 64
+
+
+def normalize_for_match(text: str) -> str:
+    """照合用の正規化（NFKCで全角英数字を半角に揃え、小文字化）"""
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+class TermAutomaton:
+    """
+    語の集合から作るAho-Corasickオートマトン
+
+    語に使われていない文字は語をまたがないので、テキストは「語に使われる文字の連続」（区間）に分け、
+    語の最短長以上の区間だけを走査する。同じ区間は結果も同じなので1度だけ走査する。
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        # 正規化後の語 → 元の表記（"Claude" と "claude" など、同じ語になる表記をまとめる）
+        self.originals: Dict[str, List[str]] = {}
+        for term in terms:
+            key = normalize_for_match(term)
+            if key:
+                self.originals.setdefault(key, []).append(term)
+
+        # トライ（goto）と、各状態で見つかる語（out）
+        goto: List[Dict[str, int]] = [{}]
+        out: List[tuple] = [()]
+        for key in self.originals:
+            state = 0
+            for ch in key:
+                edges = goto[state]
+                nxt = edges.get(ch)
+                if nxt is None:
+                    nxt = edges[ch] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] += (key,)
+
+        # 失敗遷移（幅優先で、浅い状態から決める）
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                f = goto[f].get(ch, 0)
+                fail[nxt] = f
+                if out[f]:
+                    out[nxt] += out[f]
+        self.goto, self.fail, self.out = goto, fail, out
+
+        alphabet = {ch for edges in self.goto for ch in edges}
+        self._segment_re = None
+        if alphabet:
+            chars = "".join(re.escape(ch) for ch in sorted(alphabet))
+            self._segment_re = re.compile(f"[{chars}]{{{min(map(len, self.originals))},}}")
+
+    def present(self, text: str) -> Set[str]:
+        """テキストに含まれる語（元の表記）"""
+        if self._segment_re is None:
+            return set()
+        goto, fail, out = self.goto, self.fail, self.out
+        found = set()
+        for segment in set(self._segment_re.findall(normalize_for_match(text))):
+            state = 0
+            for ch in segment:
+                while state and ch not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(ch, 0)
+                if out[state]:
+                    found.update(out[state])
+            if len(found) == len(self.originals):
+                break
+        return {term for key in found for term in self.originals[key]}
+
+
+class TermMatcher:
+    """
+    語の有無を調べる（TermAutomaton と同じ照合を、語の数と使い回しに応じて安い方法で行う）
+
+    1回目の照合と、語が AUTOMATON_MIN_TERMS 未満の場合は正規化した語ごとの in 検索。
+    語が多く2回目以降の照合（同じ元記事で生成記事を何度も調べる場合）はオートマトンを構築して使う。
+    """
+
+    def __init__(self, terms: Iterable[str], min_terms: int = AUTOMATON_MIN_TERMS):
+        self.terms = list(terms)
+        self.keys = [normalize_for_match(t) for t in self.terms]
+        self.min_terms = min_terms
+        self.scans = 0
+        self.automaton: Optional[TermAutomaton] = None
+
+    def present(self, text: str) -> Set[str]:
+        """テキストに含まれる語（元の表記）"""
+        self.scans += 1
+        if self.automaton is None and self.scans > 1 and len(self.terms) >= self.min_terms:
+            self.automaton = TermAutomaton(self.terms)
+        if self.automaton is not None:
+            return self.automaton.present(text)
+        normalized = normalize_for_match(text)
+        return {term for term, key in zip(self.terms, self.keys) if key and key in normalized}
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+url_canon.py
+記事URLの正規化（canonicalization）
+- トラッキングパラメータ（utm_* など）の除去、ホスト名の小文字化
+- AMP版URL・Google AMPキャッシュ・google.com/url ラッパーの展開
+- feedburner / Google News などのリダイレクタはリダイレクト先を解決し、永続キャッシュに保存
+- 元記事取得時に見つけた rel=canonical をキャッシュに記録し、次回以降の重複判定に使う
+"""
+import re
+import base64
+import threading
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import requests
+
+from cache_store import JsonCache
+
+# 除去するトラッキングパラメータ
+TRACKING_PARAMS = {
+    "fbclid", "gclid", "dclid", "msclkid", "yclid", "igshid", "mc_cid", "mc_eid",
+    "ref", "ref_src", "ref_url", "referrer", "source", "src", "cmpid", "ocid",
+    "icid", "ncid", "sr_share", "smid", "_hsenc", "_hsmi", "guccounter",
+    "guce_referrer", "guce_referrer_sig", "spm", "s_cid", "rss",
+    "amp", "outputtype",
+}
+TRACKING_PREFIXES = ("utm_", "pk_", "hsa_", "mtm_", "__s", "_ga")
+
+# リダイレクト先の解決が必要なホスト
+REDIRECTOR_HOSTS = {
+    "feeds.feedburner.com",
+    "feedproxy.google.com",
+    "news.google.com",
+    "rss.app",
+    "t.co",
+    "bit.ly",
+    "lnkd.in",
+}
+
+_DEFAULT_PORTS = {"http": "80", "https": "443"}
+_AMP_CACHE_RE = re.compile(r"^[a-z0-9-]+\.cdn\.ampproject\.org$")
+_CANONICAL_RE = re.compile(r"^https?://", re.I)
+
+
+def _is_tracking(key: str) -> bool:
+    k = key.lower()
+    return k in TRACKING_PARAMS or k.startswith(TRACKING_PREFIXES)
+
+
+def _unwrap(u: str) -> str:
+    """google.com/url?q=... やGoogle AMPキャッシュのURLから元のURLを取り出す"""
+    parts = urlsplit(u)
+    host = parts.netloc.lower()
+
+    if host in ("www.google.com", "google.com") and parts.path == "/url":
+        q = dict(parse_qsl(parts.query))
+        target = q.get("url") or q.get("q")
+        if target and _CANONICAL_RE.match(target):
+            return target
+
+    # https://www-example-com.cdn.ampproject.org/c/s/www.example.com/path
+    if _AMP_CACHE_RE.match(host):
+        m = re.match(r"^/[a-z](?:/s)?/(.+)$", parts.path)
+        if m:
+            scheme = "https" if "/s/" in parts.path[:5] else "http"
+            return f"{scheme}://{m.group(1)}" + (f"?{parts.query}" if parts.query else "")
+
+    return u
+
+
+def canonicalize_url(u: str) -> str:
+    """
+    ネットワークアクセスなしでURLを正規化
+
+    - フラグメント・トラッキングパラメータを除去し、残りのクエリはキー順に並べる
+    - スキームとホストを小文字化し、http は https に、既定ポート・www. は省略
+    - AMP版（amp.サブドメイン、/amp パス、?amp=1）は通常版に寄せる
+    - 末尾のスラッシュを除去
+    """
+    u = (u or "").strip()
+    if not u:
+        return ""
+    u = _unwrap(u)
+    try:
+        parts = urlsplit(u)
+    except ValueError:
+        return u
+    if not parts.scheme or not parts.netloc:
+        return re.sub(r"/+$", "", re.sub(r"#.*$", "", u))
+
+    scheme = parts.scheme.lower()
+    if scheme == "http":
+        scheme = "https"
+
+    host = parts.hostname or ""
+    host = host.lower().rstrip(".")
+    for prefix in ("www.", "amp."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    if parts.port and str(parts.port) not in _DEFAULT_PORTS.values():
+        host = f"{host}:{parts.port}"
+
+    path = re.sub(r"/{2,}", "/", parts.path or "")
+    path = re.sub(r"/amp/?$", "", path, flags=re.I)
+    path = re.sub(r"\.amp(\.html?)?$", r"\1", path, flags=re.I)
+    path = re.sub(r"/+$", "", path)
+
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not _is_tracking(k)]
+    query.sort()
+
+    return urlunsplit((scheme, host, path, urlencode(query), ""))
+
+
+def needs_resolution(u: str) -> bool:
+    """リダイレクタ経由のURLかどうか"""
+    try:
+        host = (urlsplit(u).hostname or "").lower()
+    except ValueError:
+        return False
+    return host in REDIRECTOR_HOSTS
+
+
+def _decode_google_news(u: str) -> Optional[str]:
+    """
+    Google NewsのRSS記事URL（/rss/articles/CBMi...）から元記事URLを取り出す
+
+    旧形式のIDはbase64url化されたprotobufで、中に元記事URLがそのまま含まれる。
+    """
+    m = re.search(r"/articles/([A-Za-z0-9_-]+)", urlsplit(u).path)
+    if not m:
+        return None
+    token = m.group(1)
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+    except Exception:
+        return None
+    m = re.search(rb"https?://[\x21-\x7e]+", raw)
+    if not m:
+        return None
+    return m.group(0).decode("ascii", "ignore")
+
+
+class UrlCanonicalizer:
+    """
+    リダイレクト解決・rel=canonical を含むURL正規化
+
+    解決結果は {正規化済み元URL: 正規化済み解決先URL} として永続キャッシュに保存する。
+    複数スレッド（投機生成のワーカー）から同時に使ってよい。
+    """
+
+    def __init__(self, cache_path: Path, resolve_redirects: bool = True,
+                 ttl_days: float = 30, timeout: float = 5.0, max_entries: int = 5000):
+        self.cache = JsonCache(cache_path, ttl_seconds=ttl_days * 86400, max_entries=max_entries)
+        self.resolve_redirects = resolve_redirects
+        self.timeout = timeout
+        self.dirty = False
+        self.lock = threading.Lock()
+
+    def _remember(self, key: str, target: str) -> None:
+        with self.lock:
+            if target and target != key and self.cache.get(key) != target:
+                self.cache.set(key, target)
+                self.dirty = True
+
+    def _follow(self, u: str) -> Optional[str]:
+        """HTTPリダイレクトを辿って最終URLを取得"""
+        headers = {"User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36"}
+        try:
+            r = requests.head(u, headers=headers, timeout=self.timeout, allow_redirects=True)
+            if r.status_code >= 400 or needs_resolution(r.url):
+                r = requests.get(u, headers=headers, timeout=self.timeout, allow_redirects=True, stream=True)
+                r.close()
+            return r.url
+        except Exception as e:
+            print(f"[警告] リダイレクト解決に失敗: {u[:80]} ({e})")
+            return None
+
+    def canonical(self, u: str, allow_network: bool = True) -> str:
+        """
+        URLを正規化し、既知の解決先があればそれを返す
+
+        Args:
+            u: 元のURL
+            allow_network: Falseの場合はキャッシュのみ参照（リダイレクタを解決しない）
+        """
+        key = canonicalize_url(u)
+        cached = self.cache.get(key)
+        if cached:
+            return cached
+        if not (allow_network and self.resolve_redirects and needs_resolution(key)):
+            return key
+
+        target = None
+        if (urlsplit(key).hostname or "") == "news.google.com":
+            target = _decode_google_news(key)
+        if not target:
+            target = self._follow(u)
+        if not target:
+            return key
+
+        resolved = canonicalize_url(target)
+        if needs_resolution(resolved):
+            return key
+        self._remember(key, resolved)
+        return resolved
+
+    def remember_canonical(self, u: str, canonical_href: Optional[str]) -> None:
+        """元記事ページで見つけた rel=canonical（または最終URL）を記録"""
+        if not canonical_href or not _CANONICAL_RE.match(canonical_href):
+            return
+        key = canonicalize_url(u)
+        target = canonicalize_url(canonical_href)
+        if target and not needs_resolution(target):
+            self._remember(key, target)
+
+    def save(self) -> None:
+        with self.lock:
+            if self.dirty:
+                self.cache.save()
+                self.dirty = False
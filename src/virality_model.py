@@ -0,0 +1,313 @@
+# -*- coding: utf-8 -*-
+"""
+virality_model.py
+LLM話題性スコアを教師ラベルにしたローカル予測モデル
+- 特徴: title/summary のハッシュ化トークン、ソースドメイン、言語、キーワード一致数
+- モデル: ロジスティック回帰（NumPyのみ、ラベルは0〜1の連続値のまま学習）
+- 学習データ: ranker がLLM評価のたびに追記する state/virality_history.jsonl
+- モデルは state/virality_model_v{N}.npz に版数付きで保存
+
+使い方:
+    python src/virality_model.py train      # 履歴から学習して新しい版を保存
+    python src/virality_model.py evaluate   # 最新版を履歴で評価
+"""
+import re
+import sys
+import json
+import time
+import zlib
+import argparse
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import yaml
+
+from semantic_dedup import tokenize
+
+BASE = Path(__file__).resolve().parent.parent
+STATE_DIR = BASE / "state"
+HISTORY_PATH = STATE_DIR / "virality_history.jsonl"
+MODEL_GLOB = "virality_model_v*.npz"
+
+# 特徴量の作り方を変えたら上げる（古いモデルは読み込まない）
+FEATURE_VERSION = 1
+N_HASHED = 2 ** 12
+# ハッシュ特徴の後ろに続く数値特徴: キーワード一致数、タイトル長、要約長
+N_DENSE = 3
+N_FEATURES = N_HASHED + N_DENSE
+
+
+def _hash(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) % N_HASHED
+
+
+def featurize(c: Dict, keywords: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    候補記事を疎な特徴ベクトル（列番号, 値）に変換
+
+    同じ列が複数回現れた場合は加算される。
+    """
+    feats: Dict[int, float] = {}
+
+    def add(idx: int, v: float) -> None:
+        feats[idx] = feats.get(idx, 0.0) + v
+
+    title, summary = c.get("title", "") or "", c.get("summary", "") or ""
+    t_toks = set(tokenize(title))
+    s_toks = set(tokenize(summary[:1000]))
+    for tok in t_toks:
+        add(_hash("t:" + tok), 1.0 / np.sqrt(len(t_toks)))
+    for tok in s_toks:
+        add(_hash("s:" + tok), 1.0 / np.sqrt(len(s_toks)))
+    add(_hash("src:" + (c.get("domain") or "")), 1.0)
+    add(_hash("lang:" + (c.get("lang") or "unknown")[:2]), 1.0)
+
+    title_lower = title.lower()
+    kw_hits = sum(1 for kw in keywords if kw.lower() in title_lower)
+    add(N_HASHED, min(kw_hits, 10) / 10.0)
+    add(N_HASHED + 1, min(len(title), 200) / 200.0)
+    add(N_HASHED + 2, min(len(summary), 2000) / 2000.0)
+
+    cols = np.fromiter(feats.keys(), dtype=np.int64, count=len(feats))
+    vals = np.fromiter(feats.values(), dtype=np.float32, count=len(feats))
+    return cols, vals
+
+
+class SparseRows:
+    """疎行列（行ごとの列番号・値）をCOO形式で保持"""
+
+    def __init__(self, rows: List[Tuple[np.ndarray, np.ndarray]]):
+        self.n = len(rows)
+        lens = [len(c) for c, _ in rows]
+        self.row = np.repeat(np.arange(self.n), lens)
+        self.col = np.concatenate([c for c, _ in rows]) if rows else np.zeros(0, dtype=np.int64)
+        self.val = np.concatenate([v for _, v in rows]) if rows else np.zeros(0, dtype=np.float32)
+
+    def dot(self, w: np.ndarray) -> np.ndarray:
+        return np.bincount(self.row, weights=w[self.col] * self.val, minlength=self.n)
+
+    def t_dot(self, r: np.ndarray) -> np.ndarray:
+        return np.bincount(self.col, weights=r[self.row] * self.val, minlength=N_FEATURES)
+
+
+def _sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+
+class ViralityModel:
+    """ロジスティック回帰による話題性予測"""
+
+    def __init__(self, weights: Optional[np.ndarray] = None, bias: float = 0.0,
+                 keywords: Optional[List[str]] = None, meta: Optional[Dict] = None):
+        self.weights = weights if weights is not None else np.zeros(N_FEATURES, dtype=np.float32)
+        self.bias = float(bias)
+        self.keywords = keywords or []
+        self.meta = meta or {}
+
+    @property
+    def version(self) -> int:
+        return int(self.meta.get("version", 0))
+
+    def predict(self, cands: List[Dict]) -> np.ndarray:
+        """候補記事の話題性（0〜1）をまとめて予測"""
+        if not cands:
+            return np.zeros(0, dtype=np.float32)
+        X = SparseRows([featurize(c, self.keywords) for c in cands])
+        return _sigmoid(X.dot(self.weights) + self.bias).astype(np.float32)
+
+    def fit(self, cands: List[Dict], labels: np.ndarray, epochs: int = 300,
+            lr: float = 0.05, l2: float = 1e-3) -> None:
+        """交差エントロピー + L2正則化の勾配降下（Adam）で学習"""
+        X = SparseRows([featurize(c, self.keywords) for c in cands])
+        y = np.asarray(labels, dtype=np.float64)
+        w = np.zeros(N_FEATURES, dtype=np.float64)
+        b = float(np.log(max(y.mean(), 1e-3) / max(1 - y.mean(), 1e-3)))
+        m, v = np.zeros_like(w), np.zeros_like(w)
+        mb, vb = 0.0, 0.0
+        beta1, beta2, eps = 0.9, 0.999, 1e-8
+        for t in range(1, epochs + 1):
+            err = _sigmoid(X.dot(w) + b) - y
+            g = X.t_dot(err) / X.n + l2 * w
+            gb = float(err.mean())
+            m = beta1 * m + (1 - beta1) * g
+            v = beta2 * v + (1 - beta2) * g * g
+            mb = beta1 * mb + (1 - beta1) * gb
+            vb = beta2 * vb + (1 - beta2) * gb * gb
+            w -= lr * (m / (1 - beta1 ** t)) / (np.sqrt(v / (1 - beta2 ** t)) + eps)
+            b -= lr * (mb / (1 - beta1 ** t)) / (np.sqrt(vb / (1 - beta2 ** t)) + eps)
+        self.weights = w.astype(np.float32)
+        self.bias = b
+
+    def save(self, path: Path) -> None:
+        np.savez_compressed(
+            path,
+            weights=self.weights,
+            bias=np.array([self.bias]),
+            meta=np.array(json.dumps({**self.meta, "keywords": self.keywords}, ensure_ascii=False)),
+        )
+
+
+def model_paths(state_dir: Path = STATE_DIR) -> List[Tuple[int, Path]]:
+    """保存済みモデルの (版数, パス) を版数の昇順で返す"""
+    out = []
+    for p in Path(state_dir).glob(MODEL_GLOB):
+        m = re.search(r"_v(\d+)\.npz$", p.name)
+        if m:
+            out.append((int(m.group(1)), p))
+    return sorted(out)
+
+
+def load_model(path: Path) -> Optional[ViralityModel]:
+    try:
+        with np.load(path, allow_pickle=False) as d:
+            meta = json.loads(str(d["meta"]))
+            if meta.get("feature_version") != FEATURE_VERSION:
+                return None
+            return ViralityModel(d["weights"].astype(np.float32), float(d["bias"][0]),
+                                 keywords=meta.pop("keywords", []), meta=meta)
+    except Exception as e:
+        print(f"[警告] 話題性モデルの読み込みに失敗: {path.name} ({e})")
+        return None
+
+
+def load_latest_model(state_dir: Path = STATE_DIR) -> Optional[ViralityModel]:
+    """最新版のモデルを読み込む（なければNone）"""
+    for _, path in reversed(model_paths(state_dir)):
+        model = load_model(path)
+        if model is not None:
+            return model
+    return None
+
+
+def record_history(c: Dict, score: float, path: Path = HISTORY_PATH) -> None:
+    """LLMによる評価結果を学習データとして追記"""
+    rec = {
+        "title": c.get("title", ""),
+        "summary": (c.get("summary", "") or "")[:1000],
+        "domain": c.get("domain", ""),
+        "lang": c.get("lang", ""),
+        "score": float(score),
+        "ts": time.time(),
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+
+def load_history(path: Path = HISTORY_PATH, limit: int = 50000) -> List[Dict]:
+    """学習データを読み込む（同じ title+summary は最新の評価のみ）"""
+    if not path.exists():
+        return []
+    latest: Dict[Tuple[str, str], Dict] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                float(rec["score"])
+            except Exception:
+                continue
+            latest[(rec.get("title", ""), rec.get("summary", ""))] = rec
+    recs = sorted(latest.values(), key=lambda r: r.get("ts", 0))
+    return recs[-limit:]
+
+
+def _split(recs: List[Dict], holdout: float) -> Tuple[List[Dict], List[Dict]]:
+    """タイトルのハッシュで学習用・検証用に分割（実行ごとに同じ分割）"""
+    train, test = [], []
+    for r in recs:
+        bucket = zlib.crc32(r.get("title", "").encode("utf-8")) % 100
+        (test if bucket < holdout * 100 else train).append(r)
+    return train, test
+
+
+def evaluate(model: ViralityModel, recs: List[Dict]) -> Dict[str, float]:
+    """LLMスコアに対する平均絶対誤差と相関"""
+    if not recs:
+        return {"n": 0}
+    y = np.array([r["score"] for r in recs], dtype=np.float64)
+    p = model.predict(recs).astype(np.float64)
+    out = {
+        "n": len(recs),
+        "mae": float(np.abs(p - y).mean()),
+        "baseline_mae": float(np.abs(y.mean() - y).mean()),
+    }
+    if len(recs) > 1 and y.std() > 0 and p.std() > 0:
+        out["corr"] = float(np.corrcoef(p, y)[0, 1])
+    return out
+
+
+def train(state_dir: Path = STATE_DIR, history_path: Path = HISTORY_PATH, min_samples: int = 200,
+          holdout: float = 0.2, epochs: int = 300, l2: float = 1e-3) -> Optional[Path]:
+    """
+    履歴から学習し、新しい版のモデルを保存
+
+    Returns:
+        保存したモデルのパス（データ不足の場合はNone）
+    """
+    cfg = yaml.safe_load(open(BASE / "config" / "config.yaml", "r", encoding="utf-8"))
+    keywords = cfg.get("selection", {}).get("keyword_boosts", [])
+
+    recs = load_history(history_path)
+    if len(recs) < min_samples:
+        print(f"学習データが不足しています（{len(recs)}/{min_samples}件）")
+        return None
+
+    train_recs, test_recs = _split(recs, holdout)
+    model = ViralityModel(keywords=keywords)
+    start = time.time()
+    model.fit(train_recs, np.array([r["score"] for r in train_recs]), epochs=epochs, l2=l2)
+    elapsed = time.time() - start
+    metrics = evaluate(model, test_recs)
+
+    # 検証後は全データで学習し直して保存
+    model.fit(recs, np.array([r["score"] for r in recs]), epochs=epochs, l2=l2)
+    versions = model_paths(state_dir)
+    version = (versions[-1][0] + 1) if versions else 1
+    model.meta = {
+        "version": version,
+        "feature_version": FEATURE_VERSION,
+        "trained_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "n_samples": len(recs),
+        "holdout": metrics,
+    }
+    Path(state_dir).mkdir(parents=True, exist_ok=True)
+    path = Path(state_dir) / f"virality_model_v{version}.npz"
+    model.save(path)
+
+    print(f"学習データ: {len(train_recs)}件（検証 {len(test_recs)}件）、学習時間 {elapsed:.1f}秒")
+    print(f"検証結果: {json.dumps(metrics, ensure_ascii=False)}")
+    print(f"✅ モデルを保存しました: {path}")
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ローカル話題性モデルの学習・評価")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_train = sub.add_parser("train", help="履歴から学習して新しい版を保存")
+    p_train.add_argument("--min-samples", type=int, default=200)
+    p_train.add_argument("--epochs", type=int, default=300)
+    p_train.add_argument("--l2", type=float, default=1e-3)
+    p_train.add_argument("--holdout", type=float, default=0.2)
+    sub.add_parser("evaluate", help="最新版を履歴で評価")
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        path = train(min_samples=args.min_samples, epochs=args.epochs, l2=args.l2, holdout=args.holdout)
+        return 0 if path else 1
+
+    model = load_latest_model()
+    if model is None:
+        print("学習済みモデルがありません")
+        return 1
+    recs = load_history()
+    start = time.time()
+    metrics = evaluate(model, recs)
+    metrics["ms_per_50"] = (time.time() - start) / max(1, len(recs)) * 50 * 1000
+    print(f"モデル v{model.version}（{model.meta.get('trained_at')}）")
+    print(json.dumps(metrics, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
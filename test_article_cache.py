@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+合格済み記事のキャッシュ（article_cache）のテスト
+次回実行での再利用・キーの構成要素・投稿失敗の上限を検証
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from article_cache import ArticleCache
+
+URL = "https://example.com/news/story-1"
+ITEM = {"title": "OpenAI releases a new model", "summary": "summary", "link": URL, "domain": "example.com"}
+PHASE1 = {"passed": True, "issues": [], "warnings": ["w"], "details": {"character_count": 1200}}
+PHASE2 = {"passed": True, "score": 88, "issues": [], "analysis": {}}
+MODELS = ["model-a", "model-b"]
+
+
+def test_reuse_across_runs():
+    print("[テスト1] 合格済みの記事は次回実行で再利用できる")
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "article_cache.json"
+        ArticleCache(path).store(URL, "source text", 1, "model-b", ITEM, "<h1>記事</h1>", PHASE1, PHASE2)
+
+        cache = ArticleCache(path)
+        hit = cache.lookup(URL, "source text", 1, MODELS)
+        assert hit["html"] == "<h1>記事</h1>" and hit["model"] == "model-b"
+        assert hit["phase2"]["score"] == 88 and "details" not in hit["phase1"]
+        # 投稿を試みていない記事は投稿待ちにしない（投機生成で合格しただけの下位候補など）
+        assert cache.pending() == []
+        cache.record_publish_failure(URL)
+        assert [e["url"] for e in ArticleCache(path).pending()] == [URL]
+
+        # 元記事・プロンプト版数・モデルのどれかが違えば別の記事
+        assert cache.lookup(URL, "updated source text", 1, MODELS) is None
+        assert cache.lookup(URL, "source text", 2, MODELS) is None
+        assert cache.lookup(URL, "source text", 1, ["model-a"]) is None
+
+        cache.forget(URL)
+        assert ArticleCache(path).pending() == []
+    print("  ✅ OK")
+
+
+def test_publish_failures_and_ttl():
+    print("[テスト2] 投稿失敗が続いた記事・期限切れの記事は投稿しない")
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "article_cache.json"
+        cache = ArticleCache(path, max_publish_attempts=2)
+        cache.store(URL, "source text", 1, "model-a", ITEM, "<h1>記事</h1>", PHASE1, PHASE2)
+        cache.record_publish_failure(URL)
+        assert ArticleCache(path).pending()[0]["publish_failures"] == 1
+        cache.record_publish_failure(URL)
+        assert ArticleCache(path).pending() == []
+
+        expired = ArticleCache(path, ttl_seconds=-1)
+        expired.store(URL, "source text", 1, "model-a", ITEM, "<h1>記事</h1>", PHASE1, PHASE2)
+        expired.record_publish_failure(URL)
+        assert expired.pending() == []
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_reuse_across_runs()
+    test_publish_failures_and_ttl()
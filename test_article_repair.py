@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+不合格記事の修正（article_repair）のテスト
+修正依頼の組み立て・Phase 2 の指摘の作り方・試行記録の集計を検証
+"""
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from article_repair import repair_messages, phase2_issues, record_attempt, load_attempts, summarize
+
+
+def test_repair_messages():
+    print("[テスト1] 生成依頼・下書き・指摘の順で修正を依頼")
+    messages = repair_messages("元記事から記事を作成してください", "<h1>下書き</h1>",
+                               ["元記事の日付 'November 6, 2025' が正確に記載されていません"])
+    assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+    assert messages[1]["content"] == "<h1>下書き</h1>"
+    assert "- 元記事の日付 'November 6, 2025'" in messages[2]["content"]
+    assert "最小限" in messages[2]["content"]
+    print("  ✅ OK")
+
+
+def test_phase2_issues():
+    print("[テスト2] Phase 2 の指摘がなければ低い評価項目を指摘にする")
+    result = {"score": 65, "issues": [], "analysis": {"completeness": 40, "readability": 90}}
+    assert phase2_issues(result) == ["記事の完全性の評価が低い（40/100）"]
+    result = {"score": 65, "issues": ["結論が途中で切れている"], "analysis": {"completeness": 80}}
+    assert phase2_issues(result) == ["結論が途中で切れている"]
+    assert "総合評価" in phase2_issues({"score": 66, "issues": [], "analysis": {}})[0]
+    print("  ✅ OK")
+
+
+def test_attempt_summary():
+    print("[テスト3] 初回生成と修正の合格率・トークン数を比較できる")
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "attempts.jsonl"
+        record_attempt("generate", False, "phase1", 40.0, 6000, path=path)
+        record_attempt("repair", True, None, 30.0, 5000, path=path)
+        record_attempt("generate", True, None, 50.0, 7000, path=path, legacy_date_rejected=True)
+        summary = summarize(load_attempts(path))
+        assert summary["generate"]["n"] == 2 and summary["generate"]["pass_rate"] == 0.5
+        assert summary["generate"]["avg_output_tokens"] == 6500
+        # 日付を表記どおりに照合していたら2回目も不合格だった
+        assert summary["generate"]["legacy_pass_rate"] == 0.0
+        assert summary["repair"] == {"n": 1, "pass_rate": 1.0, "legacy_pass_rate": 1.0,
+                                     "avg_output_tokens": 5000, "avg_seconds": 30.0}
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_repair_messages()
+    test_phase2_issues()
+    test_attempt_summary()
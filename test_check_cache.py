@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 2 の結果キャッシュのテスト
+同じ記事のチェックはAPIを呼ばずに再利用し、記事が変われば呼び直し、エラー結果は保存しないことを検証
+"""
+import json
+import sys
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import fact_checker
+import model_helper
+from cache_store import JsonCache
+from model_health import ModelHealthStore
+from llm_scheduler import RateLimiter
+from fact_checker import llm_fact_check_article
+
+model_helper._health = ModelHealthStore(None, prefer_fastest=False)
+model_helper._limiter = RateLimiter(1e9, 1e12, 1e12)
+
+SOURCE = {"title": "OpenAI releases GPT-5", "summary": "Released on November 6, 2025."}
+SCORES = {"logical_consistency": 90, "factual_accuracy": 85, "completeness": 90,
+          "internal_coherence": 88, "readability": 92, "issues": [], "summary": "良好"}
+
+
+class FakeClient:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(model=kwargs["model"], usage=None,
+                               content=[SimpleNamespace(type="text", text=self.text)])
+
+
+def test_reuse_same_article():
+    print("[テスト1] 同じ記事はAPIを呼ばずに前回の結果を使う")
+    fact_checker._check_cache = JsonCache(Path(tempfile.mkdtemp()) / "fact_check_cache.json", ttl_seconds=3600)
+    client = FakeClient(json.dumps(SCORES))
+    first = llm_fact_check_article(SOURCE, "<h1>記事</h1><p>本文</p>", client)
+    assert first["passed"] and not first.get("cached") and client.calls == 1
+
+    # タグの違いだけなら同じ記事（キーはタグ除去後のテキスト）
+    second = llm_fact_check_article(SOURCE, "<h1>記事</h1>\n<p>本文</p>", client)
+    assert second["cached"] and second["score"] == first["score"] and client.calls == 1
+
+    llm_fact_check_article(SOURCE, "<h1>記事</h1><p>修正した本文</p>", client)
+    llm_fact_check_article(dict(SOURCE, summary="Updated summary."), "<h1>記事</h1><p>本文</p>", client)
+    assert client.calls == 3
+    print("  ✅ OK")
+
+
+def test_errors_are_not_cached():
+    print("[テスト2] 解析できなかった結果は保存しない")
+    fact_checker._check_cache = JsonCache(Path(tempfile.mkdtemp()) / "fact_check_cache.json", ttl_seconds=3600)
+    client = FakeClient("評価できませんでした")
+    assert "error" in llm_fact_check_article(SOURCE, "<p>本文</p>", client)
+    assert "error" in llm_fact_check_article(SOURCE, "<p>本文</p>", client)
+    # 1回のチェックにつき、本来の呼び出しと形式の直しの依頼の2回
+    assert client.calls == 4 and list(fact_checker._check_cache.items()) == []
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_reuse_same_article()
+    test_errors_are_not_cached()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 2 の応答形式（check_report）のテスト
+ツールの呼び出しで受け取った結果の検証と、形式が不正なときの形式の直しの依頼・集計、
+直しで作られた評価値を採用しないことを検証
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import fact_checker
+import model_helper
+from check_report import parse_check_response, format_stats, CHECK_TOOL_NAME
+from model_health import ModelHealthStore
+from llm_scheduler import RateLimiter
+from fact_checker import llm_fact_check_article
+
+model_helper._health = ModelHealthStore(None, prefer_fastest=False)
+model_helper._limiter = RateLimiter(1e9, 1e12, 1e12)
+
+SOURCE = {"title": "OpenAI releases GPT-5", "summary": "Released on November 6, 2025."}
+SCORES = {"logical_consistency": 90, "factual_accuracy": 85, "completeness": 90,
+          "internal_coherence": 88, "readability": 92, "issues": [], "summary": "良好"}
+
+
+def tool_use(payload):
+    return SimpleNamespace(type="tool_use", id="toolu_1", name=CHECK_TOOL_NAME, input=payload)
+
+
+def text(value):
+    return SimpleNamespace(type="text", text=value)
+
+
+class ScriptedClient:
+    """用意した応答を順に返し、受け取った引数を記録する"""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = []
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(model=kwargs["model"], usage=None, content=self.responses.pop(0))
+
+
+def test_parse():
+    print("[テスト1] ツールの入力をスキーマで検証し、なければテキスト中のJSONを読む")
+    report, error = parse_check_response(SimpleNamespace(content=[tool_use(SCORES)]))
+    assert report.factual_accuracy == 85 and error == ""
+    report, error = parse_check_response(SimpleNamespace(content=[tool_use(dict(SCORES, readability=130))]))
+    assert report is None and "readability" in error
+    report, _ = parse_check_response(SimpleNamespace(content=[text(
+        '評価結果は以下のとおりです。\n```json\n{"logical_consistency": 90, "factual_accuracy": 85, '
+        '"completeness": 90, "internal_coherence": 88, "readability": 92}\n```\n以上です。')]))
+    assert report.readability == 92 and report.issues == []
+    report, error = parse_check_response(SimpleNamespace(content=[text("評価できませんでした")]))
+    assert report is None and error
+    print("  ✅ OK")
+
+
+def test_tool_request_and_format_retry():
+    print("[テスト2] ツールを指定して依頼し、形式が不正なら記事を送らずに形式の直しだけ依頼")
+    # 同じ記事を何度もチェックするため、結果キャッシュは使わない
+    get_check_cache = fact_checker.get_check_cache
+    fact_checker.get_check_cache = lambda: None
+    try:
+        check_with_format_retry()
+    finally:
+        fact_checker.get_check_cache = get_check_cache
+    print("  ✅ OK")
+
+
+def check_with_format_retry():
+    before = format_stats.as_dict()
+    client = ScriptedClient([tool_use(SCORES)])
+    result = llm_fact_check_article(SOURCE, "<h1>記事</h1><p>本文</p>", client)
+    assert result["passed"] and result["format_retries"] == 0
+    assert client.requests[0]["tool_choice"] == {"type": "tool", "name": CHECK_TOOL_NAME}
+    assert client.requests[0]["tools"][0]["input_schema"]["required"][:2] == ["logical_consistency", "factual_accuracy"]
+
+    client = ScriptedClient([text("記事はよく書けています。論理 90、事実 85、完全性 90、整合性 88、読みやすさ 92。")],
+                            [tool_use(SCORES)])
+    result = llm_fact_check_article(SOURCE, "<h1>記事</h1><p>本文</p>", client)
+    assert result["passed"] and result["score"] == 89 and result["format_retries"] == 1
+    retry = client.requests[1]
+    assert "本文" not in retry["messages"][0]["content"] and "読みやすさ 92" in retry["messages"][0]["content"]
+    assert retry["model"] == "claude-haiku-4-5-20251001"
+
+    client = ScriptedClient([text("評価できません")], [text("やはり評価できません")])
+    result = llm_fact_check_article(SOURCE, "<h1>記事</h1><p>本文</p>", client)
+    assert "error" in result and not result["passed"]
+
+    # 元の出力にない評価値（読みやすさ）を直しの側が埋めたら採用しない
+    client = ScriptedClient([text("記事はよく書けています。論理 90、事実 85、完全性 90、整合性 88。")],
+                            [tool_use(SCORES)])
+    result = llm_fact_check_article(SOURCE, "<h1>記事</h1><p>本文</p>", client)
+    assert "error" in result and not result["passed"] and "readability" in result["error"]
+
+    after = format_stats.as_dict()
+    assert after["checks"] - before["checks"] == 4
+    assert after["invalid"] - before["invalid"] == 3 and after["recovered"] - before["recovered"] == 1
+
+
+if __name__ == "__main__":
+    test_parse()
+    test_tool_request_and_format_retry()
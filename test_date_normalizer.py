@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+日付の正規化（date_normalizer）のテスト
+英語・日本語・ISO・相対表現の日付を同じ日付として照合できることを検証
+"""
+import sys
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from date_normalizer import find_dates, normalize_date, date_mentioned, reference_date
+from fact_checker import fact_check_article
+
+REF = date(2025, 11, 7)
+
+
+def test_formats():
+    print("[テスト1] 表記の違う日付を (年, 月, 日) にそろえる")
+    for text in ("November 6, 2025", "Nov. 6, 2025", "nov 6th 2025", "6 November 2025",
+                 "2025年11月6日", "2025年 11月 6日", "2025-11-06", "2025/11/6", "yesterday", "昨日"):
+        assert normalize_date(text, REF) == (2025, 11, 6), text
+    assert normalize_date("11月6日", REF) == (None, 11, 6)
+    assert normalize_date("一昨日", REF) == (2025, 11, 5)
+    # 日付として正しくないもの・日付でないものは読まない
+    assert normalize_date("2025-13-40", REF) is None
+    assert find_dates("Version 3.5 ships in March 2025 and may 2x speed", REF) == set()
+    assert find_dates("2月29日と2025年2月29日", REF) == {(None, 2, 29)}
+    print("  ✅ OK")
+
+
+def test_mentioned():
+    print("[テスト2] 年がない表記は月日だけで比べる")
+    found = find_dates("同社は11月6日に発表し、2026年1月から提供する。", REF)
+    assert date_mentioned((2025, 11, 6), found)
+    assert date_mentioned((None, 11, 6), {(2025, 11, 6)})
+    assert not date_mentioned((2025, 11, 7), found)
+    assert reference_date(datetime(2025, 11, 6, 12).timestamp()) == date(2025, 11, 6)
+    print("  ✅ OK")
+
+
+def test_phase1_accepts_translated_dates():
+    print("[テスト3] 英語の日付を日本語で書いた記事を Phase 1 で不合格にしない")
+    source = {"title": "OpenAI releases GPT-5", "summary": "Released on November 6, 2025 and 2025-12-01.",
+              "ts": datetime(2025, 11, 7, 9).timestamp()}
+    body = "<p>" + "新しいモデルの解説です。" * 50 + "</p>"
+    html = "<h1>OpenAIのGPT-5</h1><p>2025年11月6日に公開され、12月1日から提供される。</p>" + body
+    result = fact_check_article(source, html)
+    assert result["issues"] == []
+    # 従来の表記どおりの照合なら2件とも不合格だった
+    assert sorted(result["details"]["legacy_date_issues"]) == ["2025-12-01", "November 6, 2025"]
+
+    result = fact_check_article(source, "<h1>OpenAIのGPT-5</h1><p>2025年11月5日に公開された。</p>" + body)
+    assert sorted(result["issues"]) == ["元記事の日付 '2025-12-01' が正確に記載されていません",
+                                        "元記事の日付 'November 6, 2025' が正確に記載されていません"]
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_formats()
+    test_mentioned()
+    test_phase1_accepts_translated_dates()
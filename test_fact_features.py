@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Phase 1 の特徴抽出（TextFeatures）のテスト
+1回の走査で、重なって現れる数値・日付・固有名詞も従来どおり拾えることと、
+オートマトン（TermAutomaton）・TermMatcher による有無の確認を検証
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from fact_checker import TextFeatures, fact_check_article
+from term_automaton import TermAutomaton, TermMatcher
+
+SOURCE = ("On November 6, 2025, OpenAI released GPT-5 with a 35% gain. "
+          "Google Cloud and claude users get it on 2025-12-01. 価格は3.5ドルで、2025年11月6日に提供開始。"
+          "ChatGPT のアップデートも12月1日に予定。The model ships today.")
+
+
+def test_single_scan_features():
+    print("[テスト1] 数値・日付・固有名詞を1回の走査で取り出す")
+    f = TextFeatures(SOURCE)
+    assert f.numbers == {"6", "2025", "5", "35", "35%", "12", "01", "3.5", "11", "1"}
+    assert f.dates == {"November 6, 2025", "2025-12-01", "2025年11月6日", "11月6日", "12月1日"}
+    # 日付の月名は固有名詞に含めず、文頭の一般的な単語も除外する
+    assert f.latin_nouns == {"Google Cloud"}
+    assert f.tech_names == {"OpenAI", "GPT-5", "Google", "claude", "ChatGPT"}
+    assert f.katakana == {"ドル", "アップデート"}
+    print("  ✅ OK")
+
+
+def test_fact_check_uses_features():
+    print("[テスト2] 元記事の日付がなければ不合格、数値・固有名詞は警告")
+    source = {"title": "OpenAI releases GPT-5", "summary": "Released on 2025-11-06 with a 35% gain."}
+    body = "<p>" + "新しいモデルの解説です。" * 50 + "</p>"
+    result = fact_check_article(source, "<h1>OpenAIのGPT-5</h1>" + body)
+    assert result["issues"] == ["元記事の日付 '2025-11-06' が正確に記載されていません"]
+    assert "元記事の数値 '35%' が見つかりません" in result["warnings"]
+    assert "固有名詞 'GPT-5' が見つかりません" not in result["warnings"]
+
+    result = fact_check_article(source, "<h1>OpenAIのGPT-5</h1><p>2025-11-06に35%向上</p>" + body)
+    assert result["passed"] and not any("数値" in w for w in result["warnings"])
+    assert sorted(result["details"]["source_dates"]) == ["2025-11-06"]
+    print("  ✅ OK")
+
+
+def test_term_automaton():
+    print("[テスト3] 重なる語・大文字小文字・全角半角の違いも1回の走査で判定")
+    terms = ["35", "35%", "3.5", "2025", "GPT-5", "Claude", "claude", "Claude Sonnet", "Sonnet 4.5", "Gemini"]
+    automaton = TermAutomaton(terms)
+    text = "ＣＬＡＵＤＥ Sonnet 4.5は前年比35%増。gpt-5も2025年に登場"
+    assert automaton.present(text) == {"35", "35%", "2025", "GPT-5", "Claude", "claude", "Claude Sonnet", "Sonnet 4.5"}
+    # 語ごとに in で調べた結果と一致する
+    for t in ("", "3.35", "Gemini 3.5", "claude sonnet 4.5 / 352025"):
+        assert automaton.present(t) == {x for x in terms if x.lower() in t.lower()}
+    assert TermAutomaton([]).present(text) == set()
+    print("  ✅ OK")
+
+
+def test_term_matcher():
+    print("[テスト4] 語が少なければ in 検索のまま、多ければ2回目の照合からオートマトンを使う")
+    terms = ["35", "35%", "3.5", "2025", "GPT-5", "Claude", "claude", "Claude Sonnet", "Sonnet 4.5", "Gemini"]
+    text = "ＣＬＡＵＤＥ Sonnet 4.5は前年比35%増。gpt-5も2025年に登場"
+    expected = TermAutomaton(terms).present(text)
+
+    few = TermMatcher(terms)
+    for _ in range(3):
+        assert few.present(text) == expected
+    assert few.automaton is None
+
+    many = TermMatcher(terms, min_terms=len(terms))
+    assert many.present(text) == expected and many.automaton is None
+    assert many.present(text) == expected and many.automaton is not None
+    assert many.present("3.35 / Gemini") == {"35", "Gemini"}
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_single_scan_features()
+    test_fact_check_uses_features()
+    test_term_automaton()
+    test_term_matcher()
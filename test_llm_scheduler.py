@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+"""
+LLM呼び出しの並列実行（llm_scheduler）のテスト
+並列化による短縮と、429受信時の待機・再試行を検証
+"""
+import sys
+import time
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from llm_scheduler import AdaptiveExecutor, RateLimiter, PriorityScheduler, DeadlineExceeded, retry_after_seconds
+
+
+class FakeRateLimitError(Exception):
+    """anthropic.RateLimitError 相当（status_code と response.headers を持つ）"""
+
+    def __init__(self, headers):
+        super().__init__("rate limited")
+        self.status_code = 429
+        self.response = type("Response", (), {"headers": headers})()
+
+
+def test_parallel_latency():
+    print("[テスト1] 並列実行で合計時間が最も遅い呼び出しに近づく")
+    executor = AdaptiveExecutor(max_workers=8)
+    start = time.time()
+    results = executor.map(lambda i: (time.sleep(0.1), i * 2)[1], list(range(8)))
+    elapsed = time.time() - start
+    print(f"  8件 × 0.1秒 → {elapsed:.2f}秒")
+    assert results == [i * 2 for i in range(8)]
+    assert elapsed < 0.4
+    print("  ✅ OK")
+
+
+def test_rate_limit_backoff():
+    print("[テスト2] 429受信時は retry-after 待機後に再試行し、同時実行数を絞る（max_retries 指定時）")
+    executor = AdaptiveExecutor(max_workers=4, max_retries=3)
+    failed_once = set()
+    lock = threading.Lock()
+
+    def call(i):
+        with lock:
+            first = i not in failed_once
+            failed_once.add(i)
+        if first and i == 0:
+            raise FakeRateLimitError({"retry-after": "0.2"})
+        return i
+
+    start = time.time()
+    assert executor.map(call, list(range(6))) == list(range(6))
+    assert executor.throttled == 1
+    assert executor.limit <= 4
+    assert time.time() - start >= 0.2
+    print("  ✅ OK")
+
+
+def test_no_retry_by_default():
+    print("[テスト2b] 既定では429を再試行せず（model_helper側で再試行済み）、同時実行数だけ絞る")
+    executor = AdaptiveExecutor(max_workers=4)
+    calls = []
+
+    def call(i):
+        calls.append(i)
+        if i == 0:
+            raise FakeRateLimitError({"retry-after": "0.05"})
+        return i
+
+    assert executor.map(call, list(range(4)), default=-1) == [-1, 1, 2, 3]
+    assert calls.count(0) == 1
+    assert executor.throttled == 1 and executor.limit < 4
+    print("  ✅ OK")
+
+
+def test_non_rate_limit_errors_fall_back():
+    print("[テスト3] レート制限以外の失敗は再試行せず default を返す")
+    executor = AdaptiveExecutor(max_workers=2)
+    calls = []
+
+    def call(i):
+        calls.append(i)
+        raise ValueError("bad request")
+
+    assert executor.map(call, [1, 2], default={}) == [{}, {}]
+    assert sorted(calls) == [1, 2]
+    print("  ✅ OK")
+
+
+def test_retry_after_headers():
+    print("[テスト4] 待機秒数ヘッダの解釈")
+    assert retry_after_seconds(FakeRateLimitError({"retry-after": "3"})) == 3.0
+    wait = retry_after_seconds(FakeRateLimitError({"anthropic-ratelimit-requests-reset": "2099-01-01T00:00:00Z"}))
+    assert wait is not None and wait > 0
+    assert retry_after_seconds(FakeRateLimitError({})) is None
+    print("  ✅ OK")
+
+
+def test_token_bucket_limiter():
+    print("[テスト5] トークンバケット: 上限超過で待機し、ヘッダの残量に合わせる")
+    limiter = RateLimiter(requests_per_minute=600, input_tokens_per_minute=6000, output_tokens_per_minute=6000)
+    assert limiter.acquire(100, 100) < 0.05
+    # 出力トークンを使い切ると、補充（100トークン/秒）を待つ
+    limiter.acquire(0, 5900)
+    start = time.time()
+    limiter.acquire(0, 20)
+    assert 0.1 < time.time() - start < 1.0
+
+    # 実際の使用量が見積もりより少なければ精算で戻る
+    limiter.settle(0, 5000, 0, 100)
+    assert limiter.acquire(0, 4000) < 0.05
+
+    limiter.update_from_headers({
+        "anthropic-ratelimit-requests-limit": "50",
+        "anthropic-ratelimit-input-tokens-limit": "40000",
+        "anthropic-ratelimit-input-tokens-remaining": "10",
+    })
+    assert limiter.buckets["requests"].capacity == 50
+    assert limiter.buckets["input-tokens"].capacity == 40000
+    assert limiter.buckets["input-tokens"].tokens <= 10
+    print("  ✅ OK")
+
+
+def test_priority_lanes():
+    print("[テスト7] 空いた枠は優先度の高いレーンへ、期限を過ぎた待ちは諦める")
+    lanes = {
+        "generation": {"priority": 0, "max_concurrency": 1},
+        "scoring": {"priority": 2, "max_concurrency": 2, "queue_timeout": 0.15},
+    }
+    scheduler = PriorityScheduler(lanes, max_concurrency=1)
+    order = []
+    release = threading.Event()
+
+    def hold():
+        with scheduler.slot("scoring"):
+            release.wait()
+
+    def run(lane, name, deadline=None):
+        try:
+            with scheduler.slot(lane, deadline):
+                order.append(name)
+                time.sleep(0.01)
+        except DeadlineExceeded:
+            order.append(f"{name}:expired")
+
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.02)
+    # スコアリング2件が先に並び、後から生成が来る
+    threads = [threading.Thread(target=run, args=("scoring", f"s{i}", time.monotonic() + 5)) for i in range(2)]
+    threads.append(threading.Thread(target=run, args=("generation", "g")))
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+    release.set()
+    for t in threads + [holder]:
+        t.join()
+    # 生成が待ち行列のスコアリングを追い越す
+    assert order == ["g", "s0", "s1"]
+
+    # レーンの queue_timeout を過ぎた呼び出しは DeadlineExceeded
+    release.clear()
+    holder = threading.Thread(target=hold)
+    holder.start()
+    time.sleep(0.02)
+    start = time.time()
+    run("scoring", "late")
+    assert order[-1] == "late:expired" and 0.1 < time.time() - start < 1.0
+    release.set()
+    holder.join()
+    assert scheduler.stats["scoring"]["expired"] == 1
+    print("  ✅ OK")
+
+
+def test_priority_token_budget():
+    print("[テスト8] トークンも優先度順に割り当て、補充待ちの間は枠を持たない")
+    lanes = {"generation": {"priority": 0}, "scoring": {"priority": 2}}
+    scheduler = PriorityScheduler(lanes, max_concurrency=2)
+    limiter = RateLimiter(requests_per_minute=600, input_tokens_per_minute=6000, output_tokens_per_minute=6000)
+    # 出力トークンを使い切る（補充は100トークン/秒）
+    limiter.acquire(0, 6000)
+    order = []
+    held = []
+
+    def run(lane, name):
+        with scheduler.slot(lane, limiter=limiter, output_tokens=20):
+            order.append(name)
+
+    threads = [threading.Thread(target=run, args=("scoring", "s")),
+               threading.Thread(target=run, args=("generation", "g"))]
+    for t in threads:
+        t.start()
+        time.sleep(0.02)
+        held.append(scheduler.total)
+    start = time.time()
+    for t in threads:
+        t.join()
+    # 先に並んだスコアリングより、後から来た生成が先にトークンを得る
+    assert order == ["g", "s"]
+    assert held == [0, 0]
+    assert 0.2 < time.time() - start < 1.5
+    assert scheduler.total == 0
+
+    # 待たずに確保できなければ何も取らない
+    assert limiter.try_acquire(0, 5000) > 0
+    assert limiter.try_acquire(0, 0) == 0
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_parallel_latency()
+    test_rate_limit_backoff()
+    test_no_retry_by_default()
+    test_non_rate_limit_errors_fall_back()
+    test_retry_after_headers()
+    test_token_bucket_limiter()
+    test_priority_lanes()
+    test_priority_token_budget()
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+モデル稼働状況（model_health）のテスト
+404の記憶・連続エラーでのスキップ・再プローブ・速い順の並べ替えを検証
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import model_helper
+from anthropic import NotFoundError, APIConnectionError
+from model_health import ModelHealthStore, percentile
+from llm_scheduler import RateLimiter
+
+MODELS = ["model-a", "model-b", "model-c"]
+
+# レート制限は実質無制限に（ダミー呼び出しで待たされないように）
+model_helper._limiter = RateLimiter(1e9, 1e12, 1e12)
+
+
+def not_found(message):
+    """404のNotFoundError（ダミーのレスポンスで作ったもの）"""
+    return NotFoundError(message, response=SimpleNamespace(status_code=404, request=None, headers={}), body=None)
+
+
+def test_not_found_persists_across_runs():
+    print("[テスト1] 404のモデルは次回実行でもスキップ")
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "health.json"
+        store = ModelHealthStore(path, prefer_fastest=False)
+        store.record_not_found("model-a", "not_found_error")
+        assert store.order(MODELS) == ["model-b", "model-c"]
+
+        reloaded = ModelHealthStore(path, prefer_fastest=False)
+        assert reloaded.order(MODELS) == ["model-b", "model-c"]
+
+        # すべて利用不可なら設定順で全件試す
+        for m in MODELS:
+            reloaded.record_not_found(m)
+        assert reloaded.order(MODELS) == MODELS
+    print("  ✅ OK")
+
+
+def test_error_streak_and_reprobe():
+    print("[テスト2] 連続エラーで一時スキップし、期間後に再プローブ")
+    with tempfile.TemporaryDirectory() as d:
+        store = ModelHealthStore(Path(d) / "health.json", error_threshold=2,
+                                 error_cooldown=0.05, prefer_fastest=False)
+        store.record_error("model-a", "timeout")
+        assert store.order(MODELS) == MODELS
+        store.record_error("model-a", "timeout")
+        assert store.order(MODELS) == ["model-b", "model-c"]
+
+        time.sleep(0.06)
+        assert store.order(MODELS)[0] == "model-a"
+        store.record_success("model-a", 1.0)
+        assert store.models["model-a"]["dead_until"] == 0.0
+    print("  ✅ OK")
+
+
+def test_fastest_first():
+    print("[テスト3] 計測済みのモデルはp50の速い順")
+    with tempfile.TemporaryDirectory() as d:
+        store = ModelHealthStore(Path(d) / "health.json", min_samples=3)
+        for lat in (4.0, 5.0, 6.0):
+            store.record_success("model-a", lat, "scoring")
+        for lat in (1.0, 2.0, 9.0):
+            store.record_success("model-c", lat, "scoring")
+        assert store.order(MODELS, "scoring") == ["model-c", "model-a", "model-b"]
+        assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+
+        # 呼び出し種別が違えば別に比べる（短い評価呼び出しの速さで生成の順を決めない）
+        for lat in (30.0, 31.0, 32.0):
+            store.record_success("model-c", lat, "generation")
+        for lat in (20.0, 21.0, 22.0):
+            store.record_success("model-b", lat, "generation")
+        assert store.order(MODELS, "generation") == ["model-b", "model-c", "model-a"]
+        assert store.order(MODELS, "scoring") == ["model-c", "model-a", "model-b"]
+
+        # 打ち切った呼び出し（latency=None）は成功として扱うが計測には入れない
+        store.record_success("model-a", None, "generation")
+        assert store.p50("model-a", "generation") is None
+    print("  ✅ OK")
+
+
+def test_fallback_skips_retired_model():
+    print("[テスト4] 一度404を返したモデルは次の呼び出しで試さない")
+    with tempfile.TemporaryDirectory() as d:
+        original_health = model_helper._health
+        original_models = model_helper.get_available_models
+        model_helper._health = ModelHealthStore(Path(d) / "health.json", prefer_fastest=False)
+        model_helper.get_available_models = lambda: list(MODELS)
+        calls = []
+
+        def create(**kwargs):
+            calls.append(kwargs["model"])
+            if kwargs["model"] == "model-a":
+                raise not_found("model: model-a not_found")
+            return SimpleNamespace(content=[], usage=None)
+
+        try:
+            client = SimpleNamespace(messages=SimpleNamespace(create=create))
+            msgs = [{"role": "user", "content": "x"}]
+            model_helper.create_message_with_fallback(client, "sys", msgs)
+            model_helper.create_message_with_fallback(client, "sys", msgs)
+            assert calls == ["model-a", "model-b", "model-b"]
+        finally:
+            model_helper._health = original_health
+            model_helper.get_available_models = original_models
+    print("  ✅ OK")
+
+
+def test_only_api_errors_count():
+    print("[テスト5] 404の判定はステータスのみ・プログラムの誤りはエラー連続に数えない")
+    with tempfile.TemporaryDirectory() as d:
+        original_health = model_helper._health
+        original_models = model_helper.get_available_models
+        original_rate_cfg = model_helper.get_rate_limit_config
+        model_helper._health = ModelHealthStore(Path(d) / "health.json", error_threshold=1, prefer_fastest=False)
+        model_helper.get_available_models = lambda: list(MODELS)
+        model_helper.get_rate_limit_config = lambda: {"max_retries": 0}
+        msgs = [{"role": "user", "content": "x"}]
+
+        def client_raising(exc):
+            def create(**kwargs):
+                raise exc
+            return SimpleNamespace(messages=SimpleNamespace(create=create))
+
+        try:
+            # 本文に「404」を含むだけの例外はモデルの404ではない
+            try:
+                model_helper.create_message_with_fallback(client_raising(TypeError("got 404 items")), "sys", msgs)
+                assert False, "TypeError が送出されるべき"
+            except TypeError:
+                pass
+            assert model_helper._health.order(MODELS) == MODELS
+            assert model_helper._health.models.get("model-a", {}).get("error_streak", 0) == 0
+
+            # 接続エラーは記録して次のモデルへ
+            calls = []
+
+            def create(**kwargs):
+                calls.append(kwargs["model"])
+                if kwargs["model"] == "model-a":
+                    raise APIConnectionError(request=None)
+                return SimpleNamespace(content=[], usage=None)
+
+            model_helper.create_message_with_fallback(
+                SimpleNamespace(messages=SimpleNamespace(create=create)), "sys", msgs)
+            assert calls == ["model-a", "model-b"]
+            assert model_helper._health.order(MODELS) == ["model-b", "model-c"]
+        finally:
+            model_helper._health = original_health
+            model_helper.get_available_models = original_models
+            model_helper.get_rate_limit_config = original_rate_cfg
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_not_found_persists_across_runs()
+    test_error_streak_and_reprobe()
+    test_fastest_first()
+    test_fallback_skips_retired_model()
+    test_only_api_errors_count()
@@ -0,0 +1,361 @@
+# -*- coding: utf-8 -*-
+"""
+model_helper のテスト
+共有クライアントのレイテンシ計測（接続時間 / サーバー時間）をトレースイベントで検証
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import model_helper
+from model_health import ModelHealthStore
+from llm_scheduler import RateLimiter
+from model_helper import create_message_with_fallback, last_call_timing
+
+# モデル稼働状況は一時ディレクトリに分離（state/ を汚さず、試行順も設定順に固定）
+model_helper._health = ModelHealthStore(Path(tempfile.mkdtemp()) / "model_health.json", prefer_fastest=False)
+# レート制限は実質無制限に（ダミー呼び出しで待たされないように）
+model_helper._limiter = RateLimiter(1e9, 1e12, 1e12)
+
+
+def simulate_request(events):
+    """httpxのイベントフックとhttpcoreのトレースを模擬"""
+    request = SimpleNamespace(extensions={})
+    model_helper._on_request(request)
+    trace = request.extensions["trace"]
+    for name, delay in events:
+        trace(name, {})
+        time.sleep(delay)
+    model_helper._on_response(SimpleNamespace())
+
+
+def test_connect_and_server_split():
+    print("[テスト1] 新規接続: 接続時間とサーバー時間を分けて計測")
+    simulate_request([
+        ("connection.connect_tcp.started", 0.02),
+        ("connection.connect_tcp.complete", 0),
+        ("connection.start_tls.started", 0.02),
+        ("connection.start_tls.complete", 0),
+        ("http11.send_request_headers.started", 0),
+        ("http11.send_request_headers.complete", 0),
+        ("http11.send_request_body.started", 0),
+        ("http11.send_request_body.complete", 0.05),
+        ("http11.receive_response_headers.started", 0),
+        ("http11.receive_response_headers.complete", 0),
+    ])
+    t = last_call_timing()
+    assert not t["reused"]
+    assert 0.035 < t["connect"] < 0.2
+    assert 0.045 < t["server"] < 0.2
+    print("  ✅ OK")
+
+
+def test_reused_connection():
+    print("[テスト2] keep-alive再利用時は接続時間0")
+    simulate_request([
+        ("http11.send_request_headers.started", 0),
+        ("http11.send_request_headers.complete", 0),
+        ("http11.send_request_body.started", 0),
+        ("http11.send_request_body.complete", 0.02),
+        ("http11.receive_response_headers.started", 0),
+        ("http11.receive_response_headers.complete", 0),
+    ])
+    t = last_call_timing()
+    assert t["reused"] and t["connect"] == 0.0 and t["server"] > 0.015
+    print("  ✅ OK")
+
+
+def test_fallback_records_latency():
+    print("[テスト3] create_message_with_fallback が呼び出しごとに記録")
+
+    class FakeMessages:
+        def create(self, **kwargs):
+            simulate_request([
+                ("http11.send_request_body.started", 0),
+                ("http11.send_request_body.complete", 0.01),
+                ("http11.receive_response_headers.started", 0),
+                ("http11.receive_response_headers.complete", 0),
+            ])
+            return SimpleNamespace(content=[])
+
+    before = len(model_helper.latency_records())
+    create_message_with_fallback(SimpleNamespace(messages=FakeMessages()), "sys",
+                                 [{"role": "user", "content": "hi"}])
+    recs = model_helper.latency_records()[before:]
+    assert len(recs) == 1
+    assert recs[0]["model"] == model_helper.get_primary_model()
+    assert recs[0]["total"] >= recs[0]["server"] > 0
+    print("  ✅ OK")
+
+
+def test_cacheable_system_and_usage():
+    print("[テスト4] 固定プロンプトのキャッシュ指定とキャッシュトークンの記録")
+    system = model_helper.cacheable_system("固定の指示", "記事構成テンプレート")
+    assert [b["text"] for b in system] == ["固定の指示", "記事構成テンプレート"]
+    assert "cache_control" not in system[0]
+    assert system[1]["cache_control"] == {"type": "ephemeral"}
+
+    usage = SimpleNamespace(input_tokens=120, output_tokens=800,
+                            cache_creation_input_tokens=None, cache_read_input_tokens=1500)
+
+    class FakeMessages:
+        def create(self, **kwargs):
+            assert kwargs["system"] is system
+            return SimpleNamespace(content=[], usage=usage)
+
+    before = len(model_helper.latency_records())
+    create_message_with_fallback(SimpleNamespace(messages=FakeMessages()), system,
+                                 [{"role": "user", "content": "元記事情報"}])
+    rec = model_helper.latency_records()[before]
+    assert rec["cache_read_tokens"] == 1500 and rec["cache_write_tokens"] == 0
+    assert rec["input_tokens"] == 120 and rec["output_tokens"] == 800
+    print("  ✅ OK")
+
+
+class FakeStream:
+    """messages.stream の戻り値を模擬（閉じられたかどうかと送出した文字数を記録）"""
+
+    def __init__(self, chunks, stop_reason):
+        self.chunks = chunks
+        self.stop_reason = stop_reason
+        self.sent = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.closed = True
+
+    @property
+    def text_stream(self):
+        for c in self.chunks:
+            self.sent += len(c)
+            yield c
+
+    def get_final_message(self):
+        return SimpleNamespace(stop_reason=self.stop_reason, usage=None)
+
+
+def test_stream_abort_and_stop_reason():
+    print("[テスト5] ストリーミング生成: 逐次チェックでの打ち切りとstop_reason")
+    chunks = ["<p>説明</p>", "```html", "<h1>見出し</h1>"] + ["<p>本文</p>"] * 100
+    stream = FakeStream(chunks, "end_turn")
+    client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: stream))
+    result = model_helper.stream_message_with_fallback(
+        client, "sys", [{"role": "user", "content": "x"}],
+        check=lambda text: "コードブロック" if "```" in text else None)
+    assert result["stop_reason"] == "aborted" and result["abort_reason"] == "コードブロック"
+    assert stream.closed and stream.sent == len("<p>説明</p>```html")
+
+    captured = {}
+
+    def make_stream(**kw):
+        captured.update(kw)
+        return FakeStream(["<h1>見出し</h1>", "<p>本文</p>"], "stop_sequence")
+
+    client = SimpleNamespace(messages=SimpleNamespace(stream=make_stream))
+    result = model_helper.stream_message_with_fallback(
+        client, "sys", [{"role": "user", "content": "x"}],
+        check=lambda text: None, stop_sequences=['<div class="source">'])
+    assert result["text"] == "<h1>見出し</h1><p>本文</p>"
+    assert result["stop_reason"] == "stop_sequence" and result["abort_reason"] is None
+    assert captured["stop_sequences"] == ['<div class="source">']
+    print("  ✅ OK")
+
+
+def test_rate_limit_retry():
+    print("[テスト6] 429は retry-after だけ待って再試行、それ以外の4xxは再試行しない")
+
+    class RateLimited(Exception):
+        status_code = 429
+        response = SimpleNamespace(headers={"retry-after": "0.1"})
+
+    class BadRequest(Exception):
+        status_code = 400
+
+    calls = []
+
+    def flaky():
+        calls.append(time.time())
+        if len(calls) == 1:
+            raise RateLimited("rate_limit_error")
+        return SimpleNamespace(usage=None)
+
+    model_helper.call_with_rate_limit(flaky, 100, 100)
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.09
+
+    def bad():
+        calls.append(time.time())
+        raise BadRequest("invalid_request_error")
+
+    calls.clear()
+    try:
+        model_helper.call_with_rate_limit(bad, 100, 100)
+        assert False
+    except BadRequest:
+        pass
+    assert len(calls) == 1
+    print("  ✅ OK")
+
+
+def test_route_by_task_and_input_length():
+    print("[テスト7] 呼び出し種別・入力の長さでモデルを振り分け、種別ごとに料金を集計")
+    original_cfg = model_helper.get_claude_config
+    cfg = {
+        "models": ["model-big", "model-mid"],
+        "max_tokens": 8000,
+        "temperature": 0.2,
+        "routes": {
+            "virality": {"models": ["model-small"], "max_tokens": 20, "temperature": 0.0},
+            "generation": {"short_input": {"max_input_tokens": 100, "models": ["model-small"]}},
+        },
+        "pricing": {"model-small": {"input": 1.0, "output": 5.0}, "model-big": {"input": 3.0, "output": 15.0}},
+    }
+    model_helper.get_claude_config = lambda: cfg
+    try:
+        assert model_helper.get_route("virality") == {
+            "rule": "default", "models": ["model-small"], "max_tokens": 20, "temperature": 0.0}
+        assert model_helper.get_route("fact_check")["models"] == ["model-big", "model-mid"]
+        assert model_helper.get_route("generation", 50)["rule"] == "short_input"
+        assert model_helper.get_route("generation", 5000)["models"] == ["model-big", "model-mid"]
+        assert model_helper.route_models("generation") == ["model-big", "model-mid", "model-small"]
+
+        calls = []
+
+        class FakeMessages:
+            def create(self, **kwargs):
+                calls.append((kwargs["model"], kwargs["max_tokens"]))
+                return SimpleNamespace(content=[], usage=SimpleNamespace(input_tokens=1000, output_tokens=10))
+
+        client = SimpleNamespace(messages=FakeMessages())
+        create_message_with_fallback(client, "sys", [{"role": "user", "content": "短い元記事"}], label="generation")
+        create_message_with_fallback(client, "sys", [{"role": "user", "content": "x"}], label="virality")
+        assert calls == [("model-small", 8000), ("model-small", 20)]
+
+        recs = model_helper.latency_records()[-2:]
+        assert [r["rule"] for r in recs] == ["short_input", "default"]
+        virality = [s for s in model_helper.usage_by_label(recs) if s["label"] == "virality"][0]
+        assert virality["calls"] == 1 and virality["models"] == {"model-small": 1}
+        assert abs(virality["cost"] - (1000 * 1.0 + 10 * 5.0) / 1e6) < 1e-12
+    finally:
+        model_helper.get_claude_config = original_cfg
+    print("  ✅ OK")
+
+
+class SlowStream(FakeStream):
+    """最初のチャンクまで first_delay 秒、以降チャンクごとに delay 秒かかるストリーム"""
+
+    def __init__(self, chunks, stop_reason, first_delay, delay):
+        super().__init__(chunks, stop_reason)
+        self.first_delay = first_delay
+        self.delay = delay
+
+    @property
+    def text_stream(self):
+        time.sleep(self.first_delay)
+        for c in self.chunks:
+            self.sent += len(c)
+            yield c
+            time.sleep(self.delay)
+
+
+def test_hedged_stream():
+    print("[テスト8] ヘッジ: 最初のモデルの出力開始が遅ければ次のモデルにも送り、先に完了した方を採用")
+    original_cfg = model_helper.get_claude_config
+    original_health = model_helper._health
+    model_helper.get_claude_config = lambda: {
+        "models": ["model-slow", "model-fast"],
+        "hedge": {"enabled": True, "percentile": 90, "min_delay": 0.05, "labels": ["generation"]},
+    }
+    model_helper._health = ModelHealthStore(None, prefer_fastest=False)
+    for _ in range(5):
+        model_helper._health.record_sample("model-slow", "generation:ttft", 0.02)
+    streams = {
+        "model-slow": SlowStream(["<h1>遅い</h1>"] * 50, "end_turn", first_delay=0.3, delay=0.01),
+        "model-fast": SlowStream(["<h1>速い</h1>", "<p>本文</p>"], "end_turn", first_delay=0.0, delay=0.0),
+    }
+    checks = []
+
+    def new_check():
+        seen = []
+        checks.append(seen)
+        return lambda text: seen.append(text) and None
+
+    try:
+        client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: streams[kw["model"]]))
+        start = time.time()
+        result = model_helper.stream_message_with_fallback(
+            client, "sys", [{"role": "user", "content": "x"}], label="generation", new_check=new_check)
+        assert result["model"] == "model-fast" and result["text"] == "<h1>速い</h1><p>本文</p>"
+        assert time.time() - start < 0.3
+        # 負けた側は出力が始まった時点で打ち切られる。チェックは呼び出しごとに別
+        time.sleep(0.4)
+        slow = streams["model-slow"]
+        assert slow.closed and slow.sent < len("<h1>遅い</h1>") * 50
+        assert len(checks) == 2
+        # 計測が足りなければヘッジしない
+        assert model_helper.hedge_delay("model-fast", "generation") is None
+    finally:
+        model_helper.get_claude_config = original_cfg
+        model_helper._health = original_health
+    print("  ✅ OK")
+
+
+def test_hedged_stream_leg_aborted():
+    print("[テスト9] ヘッジ: 先に終わった側が逐次チェックで打ち切られたら、もう一方の応答を待つ")
+    original_cfg = model_helper.get_claude_config
+    original_health = model_helper._health
+    model_helper.get_claude_config = lambda: {
+        "models": ["model-slow", "model-fast"],
+        "hedge": {"enabled": True, "percentile": 90, "min_delay": 0.05, "labels": ["generation"]},
+    }
+    model_helper._health = ModelHealthStore(None, prefer_fastest=False)
+    for _ in range(5):
+        model_helper._health.record_sample("model-slow", "generation:ttft", 0.02)
+
+    def streams():
+        return {
+            "model-slow": SlowStream(["<h1>遅い</h1>", "<p>本文</p>"], "end_turn", first_delay=0.3, delay=0.0),
+            "model-fast": SlowStream(["```html", "<h1>速い</h1>"], "end_turn", first_delay=0.0, delay=0.0),
+        }
+
+    def run(check):
+        current = streams()
+        client = SimpleNamespace(messages=SimpleNamespace(stream=lambda **kw: current[kw["model"]]))
+        return model_helper.stream_message_with_fallback(
+            client, "sys", [{"role": "user", "content": "x"}], label="generation", check=check)
+
+    try:
+        result = run(lambda text: "コードブロックマーカー" if "```" in text else None)
+        assert result["model"] == "model-slow" and result["abort_reason"] is None
+        assert result["text"] == "<h1>遅い</h1><p>本文</p>"
+
+        # 呼び出し側の打ち切りは、もう一方を待たずにそのまま返す
+        start = time.time()
+        result = run(lambda text: model_helper.CALLER_CANCELLED)
+        assert result["model"] == "model-fast" and result["abort_reason"] == model_helper.CALLER_CANCELLED
+        assert time.time() - start < 0.3
+
+        # 両方とも打ち切られたら、最初に打ち切られた結果を返す
+        result = run(lambda text: "不正なタグ")
+        assert result["model"] == "model-fast" and result["abort_reason"] == "不正なタグ"
+    finally:
+        model_helper.get_claude_config = original_cfg
+        model_helper._health = original_health
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_connect_and_server_split()
+    test_reused_connection()
+    test_fallback_records_latency()
+    test_cacheable_system_and_usage()
+    test_stream_abort_and_stop_reason()
+    test_rate_limit_retry()
+    test_route_by_task_and_input_length()
+    test_hedged_stream()
+    test_hedged_stream_leg_aborted()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+トークン予算（prompt_budget）のテスト
+文字種ごとの見積もり・段落と文の区切りでの切り詰め・max_tokens の決め方を検証
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from prompt_budget import estimate_tokens, fit_to_budget, output_max_tokens, ELLIPSIS
+
+
+def test_estimate_by_script():
+    print("[テスト1] 日本語と英語で文字数あたりのトークン数が違う")
+    ja = "生成AIの新しいモデルが発表された。" * 10
+    en = "A new generative AI model was announced today. " * 10
+    # 日本語は1文字≒1トークン、英語は約4文字で1トークン
+    assert estimate_tokens(ja) >= len(ja) * 0.9
+    assert estimate_tokens(en) <= len(en) / 3
+    assert estimate_tokens("") == 0
+    print(f"  日本語 {len(ja)}文字 → {estimate_tokens(ja)} / 英語 {len(en)}文字 → {estimate_tokens(en)}")
+    print("  ✅ OK")
+
+
+def test_fit_keeps_paragraphs_and_sentences():
+    print("[テスト2] 予算超過時は段落・文の区切りで切る")
+    paragraphs = [f"Paragraph {i} starts here. Version 3.5 ships with {i} new features. It ends here." for i in range(40)]
+    text = "\n".join(paragraphs)
+    fitted = fit_to_budget(text, 100)
+    assert estimate_tokens(fitted) <= 100
+    assert fitted.endswith(ELLIPSIS)
+    body = fitted[:-len(ELLIPSIS)]
+    # 先頭から段落単位で残り、最後の段落も文の途中（「3.」など）で切れていない
+    lines = body.split("\n")
+    assert lines[:-1] == paragraphs[:len(lines) - 1]
+    assert lines[-1].endswith(".") and paragraphs[len(lines) - 1].startswith(lines[-1])
+
+    ja = "\n".join(["新モデルは推論性能が向上した。価格は据え置きとなる。提供は来月から始まる。"] * 50)
+    fitted = fit_to_budget(ja, 80)
+    assert estimate_tokens(fitted) <= 80 and fitted[:-len(ELLIPSIS)].endswith("。")
+
+    # 予算内ならそのまま
+    assert fit_to_budget("短い本文。", 100) == "短い本文。"
+    assert fit_to_budget("", 100) == ""
+    print("  ✅ OK")
+
+
+def test_output_max_tokens():
+    print("[テスト3] 目標文字数から max_tokens を決め、上限を超えない")
+    assert output_max_tokens(2000, 3.0, limit=8000) == 6000
+    assert output_max_tokens(4000, 3.0, limit=8000) == 8000
+    assert output_max_tokens(100, 3.0) == 1000
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_estimate_by_script()
+    test_fit_keeps_paragraphs_and_sentences()
+    test_output_max_tokens()
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+候補記事スコアリング（ranker）のテスト
+API呼び出しはダミークライアントで置き換えて検証
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import ranker
+import model_helper
+from model_health import ModelHealthStore
+from llm_scheduler import RateLimiter
+from ranker import parse_virality, parse_virality_batch, rank_candidates, score_candidate
+
+# モデル稼働状況は一時ディレクトリに分離（state/ を汚さず、試行順も設定順に固定）
+model_helper._health = ModelHealthStore(Path(tempfile.mkdtemp()) / "model_health.json", prefer_fastest=False)
+# レート制限は実質無制限に（ダミー呼び出しで待たされないように）
+model_helper._limiter = RateLimiter(1e9, 1e12, 1e12)
+
+BASE = Path(__file__).resolve().parent
+CFG = yaml.safe_load(open(BASE / "config" / "config.yaml", "r", encoding="utf-8"))
+
+
+def selection(**overrides):
+    """テスト用のselection設定（キャッシュ・評価履歴の記録は無効）"""
+    sel = dict(CFG["selection"])
+    sel["score_cache"] = {"enabled": False}
+    sel["virality_model"] = {"mode": "llm", "record_history": False}
+    sel.update(overrides)
+    return sel
+
+
+class FakeClient:
+    """messages.create の呼び出し回数を数え、決まった応答を返すダミー"""
+
+    def __init__(self, reply):
+        self.calls = []
+        self.reply = reply
+        self.messages = self
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        text = self.reply(kwargs) if callable(self.reply) else self.reply
+        return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)])
+
+
+def single_reply_for(virs):
+    """1件評価のダミー応答（タイトルごとに決まったvirality）"""
+    def reply(kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        title = prompt.split("タイトル: ")[1].split("\n")[0]
+        return str(virs[title])
+    return reply
+
+
+def batch_reply_for(virs):
+    """バッチ評価のダミー応答（JSON配列）"""
+    def reply(kwargs):
+        prompt = kwargs["messages"][0]["content"]
+        items = []
+        for block in prompt.split("\n\n[")[1:]:
+            idx = int(block.split("]")[0])
+            title = block.split("タイトル: ")[1].split("\n")[0]
+            items.append(f'{{"id": {idx}, "score": {virs[title]}}}')
+        return "[" + ", ".join(items) + "]"
+    return reply
+
+
+def make_candidates(n):
+    now = time.time()
+    return [{
+        "title": f"OpenAI news {i}" if i % 2 else f"Other news {i}",
+        "summary": f"summary {i}",
+        "domain": "openai.com" if i % 3 == 0 else "theverge.com",
+        "lang": "ja" if i % 4 == 0 else "en",
+        "ts": now - i * 3600,
+        "link": f"https://example.com/{i}",
+    } for i in range(n)]
+
+
+def test_parse_virality():
+    print("[テスト1] 応答の解析")
+    assert parse_virality("0.8") == 0.8
+    assert parse_virality("評価できません") == 0.5
+    scores, failed = parse_virality_batch('```json\n[{"id": 0, "score": 0.9}, {"id": 2, "score": "x"}]\n```', 3)
+    assert scores == [0.9, 0.5, 0.5] and failed == 2
+    # JSONとして壊れていても拾えるものは拾う
+    scores, failed = parse_virality_batch('結果: {"id": 1, "score": 0.2}, {"id": 0, "score": 1.4', 2)
+    assert scores == [1.0, 0.2] and failed == 0
+    print("  ✅ OK")
+
+
+def test_batch_matches_single():
+    print("[テスト2] バッチ評価と1件ずつの評価で順位が一致")
+    sel = selection()
+    cands = make_candidates(23)
+    virs = {c["title"]: (i * 7 % 10) / 10 for i, c in enumerate(cands)}
+
+    sel["virality_batch_size"] = 1
+    single = FakeClient(single_reply_for(virs))
+    expected = rank_candidates(cands, sel, single)
+
+    sel["virality_batch_size"] = 10
+    batch = FakeClient(batch_reply_for(virs))
+    got = rank_candidates(cands, sel, batch)
+
+    assert [c["title"] for _, c in got] == [c["title"] for _, c in expected]
+    assert [round(s, 6) for s, _ in got] == [round(s, 6) for s, _ in expected]
+    assert len(single.calls) == 23 and len(batch.calls) == 3
+    print(f"  API呼び出し: 1件ずつ {len(single.calls)}回 → バッチ {len(batch.calls)}回")
+    print("  ✅ OK")
+
+
+def test_fallback_on_error():
+    print("[テスト3] API失敗時は0.5として扱う")
+    sel = selection()
+    c = make_candidates(1)[0]
+
+    class BrokenClient(FakeClient):
+        def create(self, **kwargs):
+            raise RuntimeError("boom")
+
+    assert score_candidate(c, sel, BrokenClient("")) == score_candidate(c, sel, None, vir=0.5)
+    print("  ✅ OK")
+
+
+def test_two_stage_identical_top_k():
+    print("[テスト4] 二段階ランキングの上位K件が全件評価と一致")
+    cands = make_candidates(50)
+    virs = {c["title"]: ((i * 37) % 101) / 100 for i, c in enumerate(cands)}
+
+    # 鮮度スコアが呼び出しごとにずれないよう現在時刻を固定
+    original_time = ranker.time
+    now = time.time()
+    ranker.time = SimpleNamespace(time=lambda: now)
+    try:
+        full = FakeClient(single_reply_for(virs))
+        expected = rank_candidates(cands, selection(virality_batch_size=1, two_stage=False), full)
+        for batch_size, reply in ((1, single_reply_for(virs)), (4, batch_reply_for(virs))):
+            for k in (1, 5, 10):
+                pruned = FakeClient(reply)
+                got = rank_candidates(cands, selection(virality_batch_size=batch_size, two_stage=True), pruned, top_k=k)
+                assert [c["title"] for _, c in got[:k]] == [c["title"] for _, c in expected[:k]]
+                assert [s for s, _ in got[:k]] == [s for s, _ in expected[:k]]
+                print(f"  batch={batch_size} K={k}: API呼び出し {len(pruned.calls)}回（全件評価 {len(full.calls)}回）")
+                assert len(pruned.calls) < len(full.calls)
+    finally:
+        ranker.time = original_time
+    print("  ✅ OK")
+
+
+def test_two_stage_default_saves_calls():
+    print("[テスト4b] 既定設定（10件バッチ × 並列4）でも二段階で呼び出しが減る")
+    cands = make_candidates(50)
+    virs = {c["title"]: ((i * 37) % 101) / 100 for i, c in enumerate(cands)}
+    full = FakeClient(batch_reply_for(virs))
+    rank_candidates(cands, selection(two_stage=False), full, top_k=5)
+    pruned = FakeClient(batch_reply_for(virs))
+    rank_candidates(cands, selection(), pruned, top_k=5)
+    print(f"  API呼び出し {len(pruned.calls)}回（全件評価 {len(full.calls)}回）")
+    assert len(pruned.calls) < len(full.calls) - 1
+    print("  ✅ OK")
+
+
+def test_score_cache():
+    print("[テスト5] 評価キャッシュ")
+    cands = make_candidates(12)
+    with tempfile.TemporaryDirectory() as d:
+        original = ranker.SCORE_CACHE_PATH
+        ranker.SCORE_CACHE_PATH = Path(d) / "virality_cache.json"
+        ranker._score_cache = None
+        try:
+            sel = selection(virality_batch_size=5, score_cache={"enabled": True, "ttl_hours": 1, "max_entries": 100})
+
+            # 1回目: 全件LLM評価（id 3 は解析失敗 → キャッシュしない）
+            def reply(kwargs):
+                n = kwargs["messages"][0]["content"].count("タイトル: ")
+                return "[" + ", ".join(f'{{"id": {i}, "score": 0.6}}' for i in range(n) if i != 3) + "]"
+            first = FakeClient(reply)
+            rank_candidates(cands, sel, first)
+            assert len(first.calls) == 3
+            assert ranker.SCORE_CACHE_PATH.exists()
+
+            # 2回目（別プロセス相当）: 解析失敗した2件のみ再評価
+            ranker._score_cache = None
+            second = FakeClient(reply)
+            rank_candidates(cands, sel, second)
+            assert len(second.calls) == 1
+            assert second.calls[0]["messages"][0]["content"].count("タイトル: ") == 2
+            cache = ranker.get_score_cache(sel)
+            assert cache.hits == 10 and cache.misses == 2
+
+            # score_candidate もキャッシュを参照する
+            third = FakeClient("0.9")
+            score_candidate(cands[0], sel, third)
+            assert len(third.calls) == 0
+        finally:
+            ranker.SCORE_CACHE_PATH = original
+            ranker._score_cache = None
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_parse_virality()
+    test_batch_matches_single()
+    test_fallback_on_error()
+    test_two_stage_identical_top_k()
+    test_two_stage_default_saves_calls()
+    test_score_cache()
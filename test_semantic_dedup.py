@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+意味的重複検出（semantic_dedup）のテスト
+言い換え記事・日英の翻訳記事を重複として検出できるかを検証
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import numpy as np
+
+import semantic_dedup
+from semantic_dedup import SemanticIndex, load_index, term_vector, tokenize
+
+POSTED = [
+    ("OpenAI launches GPT-5 with improved reasoning",
+     "OpenAI on Thursday released GPT-5, its newest model, which it says is better at coding and reasoning."),
+    ("Google unveils Gemini 3 for developers",
+     "Google announced Gemini 3 with a new API for developers."),
+]
+
+THRESHOLD = 0.4
+CROSS_LANG_THRESHOLD = 0.45
+
+
+def build_index():
+    index = SemanticIndex()
+    for title, summary in POSTED:
+        index.add(title, summary)
+    return index
+
+
+def test_tokenize():
+    print("[テスト1] トークナイズ")
+    latin = tokenize("OpenAI releases GPT-5")
+    assert "openai" in latin and "gpt-5" in latin
+    assert "the" not in tokenize("The model")
+    # カタカナの主要固有名詞は英語表記に寄せる
+    assert "google" in tokenize("グーグルが発表")
+    # 全角英数字も半角として扱う
+    assert "gpt-5" in tokenize("ＧＰＴ-５")
+    print("  ✅ OK")
+
+
+def test_paraphrase_and_translation():
+    print("[テスト2] 言い換え・翻訳記事の検出")
+    index = build_index()
+    queries = [
+        ("OpenAI releases GPT-5, says it reasons better",
+         "The new GPT-5 model from OpenAI is now available, with gains in coding and reasoning."),
+        ("OpenAI、GPT-5を発表　推論能力が向上",
+         "オープンエーアイは新モデルGPT-5を公開した。コーディングや推論の性能が向上したという。"),
+        ("グーグル、開発者向けにGemini 3を公開",
+         "GoogleはGemini 3と新しいAPIを発表した。"),
+    ]
+    dups = index.find_duplicates(queries, THRESHOLD, CROSS_LANG_THRESHOLD)
+    for (title, _), dup in zip(queries, dups):
+        print(f"  {title[:40]} -> {dup}")
+        assert dup is not None
+    print("  ✅ OK")
+
+
+def test_distinct_news():
+    print("[テスト3] 別ニュースは重複としない")
+    index = build_index()
+    queries = [
+        ("OpenAI adds editing tools to Sora app",
+         "OpenAI added new editing features to Sora."),
+        ("OpenAI、動画生成AI「Sora」の新機能を発表",
+         "OpenAIはSoraアプリに新しい編集機能を追加した。"),
+        ("Apple announces new iPhone",
+         "Apple today announced a new iPhone with AI features."),
+    ]
+    dups = index.find_duplicates(queries, THRESHOLD, CROSS_LANG_THRESHOLD)
+    for (title, _), dup in zip(queries, dups):
+        print(f"  {title[:40]} -> {dup}")
+        assert dup is None
+    print("  ✅ OK")
+
+
+def test_same_company_different_story():
+    print("[テスト3b] 日英で同じ企業名だけが一致する別ニュースは重複としない")
+    index = SemanticIndex()
+    index.add("GoogleがGemini 3を発表", "グーグルは新しいAIモデルGemini 3を公開した。")
+    index.add("OpenAI、ChatGPTにショッピング機能を追加", "OpenAIはChatGPTで商品を比較できる機能を発表した。")
+    index.add("Anthropic、Claude Sonnet 4.5を発表", "AnthropicはClaudeの新モデルを公開した。")
+    queries = [
+        ("Google Gemini comes to Google TV", "Google is bringing Gemini to Google TV devices."),
+        ("ChatGPT gets group chats", "OpenAI is piloting group chats in ChatGPT."),
+        ("Claude Code now available on the web", "Anthropic launched Claude Code on the web."),
+    ]
+    dups = index.find_duplicates(queries, THRESHOLD, CROSS_LANG_THRESHOLD)
+    for (title, _), dup in zip(queries, dups):
+        print(f"  {title[:40]} -> {dup}")
+        assert dup is None
+    # 内容語の共通を求めなければ、企業名・製品名の一致だけで重複扱いになってしまう
+    assert index.find_duplicates(queries[:1], THRESHOLD, CROSS_LANG_THRESHOLD, cross_lang_min_shared=0)[0]
+    print("  ✅ OK")
+
+
+def test_signed_hash_collisions():
+    print("[テスト3c] 同じバケットに衝突した語は符号付きで足し合わせる")
+    size = semantic_dedup.N_FEATURES // 2
+    seen = {}
+    pair = None
+    for i in range(100000):
+        tok = f"tok{i}"
+        idx, sign = semantic_dedup._bucket(tok, size)
+        if idx in seen and seen[idx][1] != sign:
+            pair = (seen[idx][0], tok, idx)
+            break
+        seen.setdefault(idx, (tok, sign))
+    a, b, idx = pair
+    v = term_vector("", f"{a} {b}")
+    # 逆符号の2語は打ち消し合う
+    assert np.isclose(v[idx], 0.0)
+    print("  ✅ OK")
+
+
+def test_eviction_and_persistence():
+    print("[テスト4] 期限切れ削除と保存・読み込み")
+    index = SemanticIndex()
+    index.add(*POSTED[0], created_at=time.time() - 10 * 86400)
+    index.add(*POSTED[1])
+    assert index.evict(7) == 1
+    assert len(index) == 1
+
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "semantic_index.npz"
+        index.save(path)
+        loaded = load_index(path)
+        assert len(loaded) == 1
+        assert loaded.matrix.dtype.name == "float32"
+        assert loaded.titles == [POSTED[1][0]]
+        assert loaded.content.shape == (1, semantic_dedup.N_FEATURES // 2)
+        # 次元が変わった場合は空のインデックスとして扱う
+        assert len(load_index(path, n_features=1024)) == 0
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_tokenize()
+    test_paraphrase_and_translation()
+    test_distinct_news()
+    test_same_company_different_story()
+    test_signed_hash_collisions()
+    test_eviction_and_persistence()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+投機的な並列処理（speculation）のテスト
+ランキング順の結果返却・同時実行数・勝者決定後の中止を検証
+"""
+import sys
+import time
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from speculation import speculative_results
+
+
+def make_worker(outcomes, delays, log):
+    """outcomes[i] が真なら合格。実行中の件数と中止された件数を log に記録"""
+    lock = threading.Lock()
+
+    def fn(i, item, cancel):
+        with lock:
+            log["active"] += 1
+            log["max_active"] = max(log["max_active"], log["active"])
+            log["started"].append(i)
+        try:
+            end = time.time() + delays[i]
+            while time.time() < end:
+                if cancel.is_set():
+                    log["cancelled"].append(i)
+                    return None
+                time.sleep(0.005)
+            return f"html{i}" if outcomes[i] else None
+        finally:
+            with lock:
+                log["active"] -= 1
+
+    return fn
+
+
+def new_log():
+    return {"active": 0, "max_active": 0, "started": [], "cancelled": []}
+
+
+def test_rank_order_over_speed():
+    print("[テスト1] 下位の候補が先に合格しても、上位の合格を優先")
+    log = new_log()
+    fn = make_worker([True, True, False], [0.15, 0.02, 0.02], log)
+    idx, item, html = next(speculative_results(["a", "b", "c"], fn, width=3))
+    assert (idx, item, html) == (0, "a", "html0")
+    assert log["max_active"] == 3
+    print("  ✅ OK")
+
+
+def test_failed_top_falls_through():
+    print("[テスト2] 上位が不合格なら次の合格候補、全件を width 件ずつ処理")
+    log = new_log()
+    fn = make_worker([False, False, True, False, True], [0.02] * 5, log)
+    got = [idx for idx, _, _ in speculative_results(list("abcde"), fn, width=2)]
+    assert got == [2, 4]
+    assert log["max_active"] <= 2
+    assert sorted(log["started"]) == [0, 1, 2, 3, 4]
+    print("  ✅ OK")
+
+
+def test_cancel_after_winner():
+    print("[テスト3] 勝者決定後は実行中の処理を中止し、未着手の候補は開始しない")
+    log = new_log()
+    fn = make_worker([True, False, False, False, False], [0.02, 1.0, 1.0, 1.0, 1.0], log)
+    cancel = threading.Event()
+    start = time.time()
+    for idx, _, _ in speculative_results(list("abcde"), fn, width=3, cancel=cancel):
+        break
+    assert idx == 0 and cancel.is_set()
+    time.sleep(0.1)
+    assert sorted(log["cancelled"]) == [1, 2]
+    assert 4 not in log["started"]
+    assert time.time() - start < 0.5
+    print("  ✅ OK")
+
+
+def test_sequential_width_one():
+    print("[テスト4] width=1 は1件ずつ順に処理")
+    log = new_log()
+    fn = make_worker([False, True, True], [0.01] * 3, log)
+    idx, _, _ = next(speculative_results(list("abc"), fn, width=1))
+    time.sleep(0.05)
+    assert idx == 1 and log["max_active"] == 1 and 2 not in log["started"]
+    print("  ✅ OK")
+
+
+def test_multiple_results_with_skip():
+    print("[テスト5] 複数件を受け取る場合、先の結果と衝突する候補は処理しない")
+    log = new_log()
+    fn = make_worker([True, True, True, True], [0.02, 0.05, 0.02, 0.02], log)
+    domains = ["x.com", "x.com", "y.com", "z.com"]
+    taken = set()
+    got = []
+    skip = lambda i, item: domains[i] in taken
+    for idx, item, _ in speculative_results(list("abcd"), fn, width=1, skip=skip):
+        taken.add(domains[idx])
+        got.append(idx)
+        if len(got) == 2:
+            break
+    # 候補1は候補0と同じドメインなので生成せず、次の候補2を採用
+    assert got == [0, 2]
+    assert 1 not in log["started"]
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_rank_order_over_speed()
+    test_failed_top_falls_through()
+    test_cancel_after_winner()
+    test_sequential_width_one()
+    test_multiple_results_with_skip()
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+ストリーミング生成の逐次チェック（stream_validator）のテスト
+チャンクを少しずつ渡し、問題のある生成を早期に検出できるか検証
+"""
+import sys
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from stream_validator import IncrementalHtmlValidator
+
+GOOD = ('<p data-meta="description">OpenAIが新モデルを発表。</p>\n'
+        '<h1>OpenAIが新モデルを発表</h1>\n<p>リード段落。</p>\n' + '<p>本文。</p>\n' * 200)
+
+
+def feed(validator, text, size=7):
+    """size文字ずつ渡し、(中止理由, 中止時点の文字数) を返す"""
+    for end in range(size, len(text) + size, size):
+        reason = validator.check(text[:end])
+        if reason:
+            return reason, min(end, len(text))
+    return None, len(text)
+
+
+def test_good_article_passes():
+    print("[テスト1] 正常な記事は最後まで通る")
+    assert feed(IncrementalHtmlValidator(), GOOD) == (None, len(GOOD))
+    print("  ✅ OK")
+
+
+def test_code_fence_split_across_chunks():
+    print("[テスト2] チャンク境界をまたぐコードブロックマーカーを検出")
+    text = "```html\n" + GOOD
+    reason, at = feed(IncrementalHtmlValidator(), text, size=2)
+    assert "コードブロック" in reason and at <= 4
+    print("  ✅ OK")
+
+
+def test_disallowed_tag_mid_stream():
+    print("[テスト3] 途中の使用禁止タグで打ち切り")
+    text = GOOD[:500] + "<table><tr><td>x</td></tr></table>" + GOOD[500:]
+    reason, at = feed(IncrementalHtmlValidator(), text)
+    assert "<table>" in reason and at < 520
+    print("  ✅ OK")
+
+
+def test_missing_h1():
+    print("[テスト4] 先頭の一定文字数内に<h1>がなければ打ち切り")
+    text = GOOD.replace("<h1>", "<h3>").replace("</h1>", "</h3>")
+    reason, at = feed(IncrementalHtmlValidator(h1_within_chars=300), text)
+    assert "<h1>" in reason and at <= 310
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_good_article_passes()
+    test_code_fence_split_across_chunks()
+    test_disallowed_tag_mid_stream()
+    test_missing_h1()
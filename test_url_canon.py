@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+URL正規化（url_canon）のテスト
+トラッキングパラメータ・AMP・ラッパーURLが同一記事として扱われるかを検証
+"""
+import sys
+import base64
+import tempfile
+import threading
+from pathlib import Path
+
+sys.path.append(str(Path(__file__).parent / "src"))
+from url_canon import UrlCanonicalizer, canonicalize_url, needs_resolution
+
+BASE_URL = "https://theverge.com/ai/12345/openai-gpt-5"
+
+
+def test_canonicalize_url():
+    print("[テスト1] オフライン正規化")
+    variants = [
+        "https://www.theverge.com/ai/12345/openai-gpt-5",
+        "https://www.theverge.com/ai/12345/openai-gpt-5/",
+        "http://WWW.TheVerge.com/ai/12345/openai-gpt-5#comments",
+        "https://www.theverge.com/ai/12345/openai-gpt-5?utm_source=rss&utm_medium=feed",
+        "https://www.theverge.com:443/ai/12345/openai-gpt-5?fbclid=abc",
+        "https://amp.theverge.com/ai/12345/openai-gpt-5",
+        "https://www.theverge.com/ai/12345/openai-gpt-5/amp/",
+        "https://www.theverge.com/ai/12345/openai-gpt-5?amp=1",
+        "https://www-theverge-com.cdn.ampproject.org/c/s/www.theverge.com/ai/12345/openai-gpt-5/amp",
+        "https://www.google.com/url?q=https://www.theverge.com/ai/12345/openai-gpt-5&sa=U",
+    ]
+    for v in variants:
+        assert canonicalize_url(v) == BASE_URL, (v, canonicalize_url(v))
+
+    # 意味のあるクエリは残し、順序を揃える
+    assert canonicalize_url("https://example.com/a?b=2&a=1&utm_campaign=x") == "https://example.com/a?a=1&b=2"
+    print("  ✅ OK")
+
+
+def test_redirector_detection():
+    print("[テスト2] リダイレクタ判定")
+    assert needs_resolution("https://feeds.feedburner.com/~r/example/~3/abc/")
+    assert needs_resolution("https://news.google.com/rss/articles/CBMiXXX")
+    assert not needs_resolution(BASE_URL)
+    print("  ✅ OK")
+
+
+def test_cache_and_rel_canonical():
+    print("[テスト3] rel=canonical の記録とGoogle News展開")
+    with tempfile.TemporaryDirectory() as d:
+        path = Path(d) / "url_canonical_cache.json"
+        canon = UrlCanonicalizer(path)
+
+        # 取得時に見つけた rel=canonical は次回以降に反映される
+        canon.remember_canonical("https://example.com/story?id=1&utm_source=rss", "https://example.com/news/story-1")
+        canon.save()
+        canon = UrlCanonicalizer(path)
+        assert canon.canonical("https://example.com/story?id=1", allow_network=False) == "https://example.com/news/story-1"
+
+        # Google News の旧形式IDはネットワークなしで展開できる
+        token = base64.urlsafe_b64encode(b"\x08\x13\x22\x2a" + BASE_URL.encode() + b"\xd2\x01\x00").decode().rstrip("=")
+        gnews = f"https://news.google.com/rss/articles/{token}?oc=5"
+        assert canon.canonical(gnews) == BASE_URL
+        assert canon.canonical(gnews, allow_network=False) == BASE_URL
+    print("  ✅ OK")
+
+
+def test_concurrent_remember_and_save():
+    print("\n=== 複数スレッドからの記録・保存 ===")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "url_canon_cache.json"
+        canon = UrlCanonicalizer(path)
+
+        def worker(n):
+            for i in range(50):
+                canon.remember_canonical(f"https://example.com/s?id={n}-{i}", f"https://example.com/news/{n}-{i}")
+                canon.save()
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        canon.save()
+
+        # 保存途中のファイルや一時ファイルが残らず、全件読み戻せる
+        assert [p.name for p in Path(tmp).iterdir()] == ["url_canon_cache.json"]
+        canon = UrlCanonicalizer(path)
+        assert canon.canonical("https://example.com/s?id=7-49", allow_network=False) == "https://example.com/news/7-49"
+        assert len(canon.cache.items()) == 8 * 50
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_canonicalize_url()
+    test_redirector_detection()
+    test_cache_and_rel_canonical()
+    test_concurrent_remember_and_save()
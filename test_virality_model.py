@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+ローカル話題性モデル（virality_model）のテスト
+合成した評価履歴で学習し、保存・読み込み・予測速度・ranker との連携を検証
+"""
+import sys
+import time
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.append(str(Path(__file__).parent / "src"))
+import ranker
+import virality_model
+from ranker import rank_candidates
+from test_ranker import FakeClient, make_candidates, selection
+
+
+def synthetic_history(path: Path, n: int = 400) -> None:
+    """「OpenAI」を含むタイトルほど高スコアになる評価履歴"""
+    rng = np.random.default_rng(0)
+    for i in range(n):
+        hot = i % 2 == 0
+        c = {
+            "title": f"OpenAI releases model {i}" if hot else f"Local weather update {i}",
+            "summary": f"summary {i}",
+            "domain": "openai.com" if hot else "example.com",
+            "lang": "en",
+        }
+        score = (0.85 if hot else 0.2) + rng.normal(0, 0.05)
+        virality_model.record_history(c, float(np.clip(score, 0, 1)), path=path)
+
+
+def test_train_and_versioning():
+    print("[テスト1] 学習・版数付き保存")
+    with tempfile.TemporaryDirectory() as d:
+        state = Path(d)
+        history = state / "history.jsonl"
+        synthetic_history(history)
+
+        assert virality_model.train(state, history, min_samples=1000) is None
+        p1 = virality_model.train(state, history, min_samples=100, epochs=200)
+        p2 = virality_model.train(state, history, min_samples=100, epochs=200)
+        assert p1.name == "virality_model_v1.npz" and p2.name == "virality_model_v2.npz"
+
+        model = virality_model.load_latest_model(state)
+        assert model.version == 2
+        assert model.meta["holdout"]["mae"] < model.meta["holdout"]["baseline_mae"]
+
+        hot, cold = model.predict([
+            {"title": "OpenAI releases model X", "summary": "", "domain": "openai.com", "lang": "en"},
+            {"title": "Local weather update X", "summary": "", "domain": "example.com", "lang": "en"},
+        ])
+        assert hot > 0.6 > 0.4 > cold
+    print("  ✅ OK")
+
+
+def test_local_mode_ranking():
+    print("[テスト2] ローカルモードはLLMを呼ばない")
+    with tempfile.TemporaryDirectory() as d:
+        state = Path(d)
+        history = state / "history.jsonl"
+        synthetic_history(history)
+        virality_model.train(state, history, min_samples=100, epochs=200)
+
+        original = ranker._local_model
+        ranker._local_model = virality_model.load_latest_model(state)
+        try:
+            cands = make_candidates(50)
+            start = time.time()
+            ranker._local_model.predict(cands)
+            assert time.time() - start < 0.5
+
+            client = FakeClient("0.9")
+            sel = selection(virality_model={"mode": "local", "record_history": False})
+            scored = rank_candidates(cands, sel, client, top_k=5)
+            assert len(client.calls) == 0
+            assert len(scored) == 50
+            assert [s for s, _ in scored] == sorted((s for s, _ in scored), reverse=True)
+        finally:
+            ranker._local_model = original
+    print("  ✅ OK")
+
+
+if __name__ == "__main__":
+    test_train_and_versioning()
+    test_local_mode_ranking()